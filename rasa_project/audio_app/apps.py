@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class AudioAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'audio_app'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,97 @@
+"""
+Streaming audio decode through an ffmpeg pipe.
+
+Encoded bytes are written to ffmpeg's stdin from a feeder thread while raw
+PCM is read back from its stdout in fixed-size frames, so decoding a file of
+any length holds only a few frames in memory and never touches disk.
+"""
+import subprocess
+import threading
+
+import numpy as np
+from django.conf import settings
+
+BYTES_PER_SAMPLE = 2  # s16le
+STDERR_LIMIT = 4096
+
+
+class AudioDecodeError(Exception):
+    pass
+
+
+def _feed(chunks, stdin, stop, errors):
+    try:
+        for chunk in chunks:
+            if stop.is_set():
+                break
+            stdin.write(chunk)
+    except (BrokenPipeError, ValueError):
+        # ffmpeg exited (or was killed) before reading all input; its exit status says why.
+        pass
+    except Exception as e:
+        errors.append(e)
+    finally:
+        try:
+            stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+
+
+def _drain(stream, sink):
+    for line in stream:
+        sink.append(line)
+        while sum(len(item) for item in sink) > STDERR_LIMIT:
+            sink.pop(0)
+
+
+def decode_pcm(chunks, sample_rate, frame_size=None, channels=1):
+    """
+    Decode an iterable of encoded byte ``chunks`` (any format ffmpeg reads) and
+    yield float32 frames of ``frame_size`` samples per channel (one second by
+    default) at ``sample_rate``; the last frame may be shorter. Samples keep
+    the int16 scale. Frames are 1-D for mono, ``(samples, channels)``
+    otherwise. Raises ``AudioDecodeError`` if ffmpeg cannot decode the input.
+    """
+    frame_size = frame_size or sample_rate
+    frame_bytes = frame_size * channels * BYTES_PER_SAMPLE
+    process = subprocess.Popen(
+        [
+            settings.AUDIO_FFMPEG_BINARY, '-hide_banner', '-nostdin', '-loglevel', 'error',
+            '-i', 'pipe:0', '-f', 's16le', '-acodec', 'pcm_s16le',
+            '-ac', str(channels), '-ar', str(sample_rate), 'pipe:1',
+        ],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+    )
+    stop = threading.Event()
+    feed_errors, stderr = [], []
+    feeder = threading.Thread(target=_feed, args=(chunks, process.stdin, stop, feed_errors), daemon=True)
+    drainer = threading.Thread(target=_drain, args=(process.stderr, stderr), daemon=True)
+    feeder.start()
+    drainer.start()
+
+    finished = False
+    try:
+        while True:
+            data = process.stdout.read(frame_bytes)
+            usable = len(data) - len(data) % (channels * BYTES_PER_SAMPLE)
+            if usable:
+                frame = np.frombuffer(data[:usable], dtype='<i2').astype(np.float32)
+                yield frame if channels == 1 else frame.reshape(-1, channels)
+            if len(data) < frame_bytes:
+                break
+        finished = True
+    finally:
+        stop.set()
+        if not finished:
+            process.kill()
+        process.stdout.close()
+        returncode = process.wait()
+        feeder.join(timeout=5)
+        drainer.join(timeout=5)
+        process.stderr.close()
+
+    if feed_errors:
+        raise feed_errors[0]
+    if returncode != 0:
+        message = b''.join(stderr).decode(errors='replace').strip()
+        raise AudioDecodeError(message or f'ffmpeg exited with status {returncode}')
@@ -0,0 +1,40 @@
+from django.core.exceptions import ValidationError
+from django.db import models
+
+
+class DigestField(models.BinaryField):
+    """
+    A raw hash digest of up to ``max_length`` bytes: ``VARBINARY`` on MySQL,
+    so it can carry a unique index without a prefix length or a collation,
+    ``bytea`` on PostgreSQL and ``BLOB`` on SQLite. Values read back as
+    ``bytes``; hex strings are accepted wherever a value is expected, so
+    ``filter(digest='3F78...')`` works.
+    """
+    default_error_messages = {'invalid': '“%(value)s” is not a hex digest.'}
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('max_length', 32)
+        super().__init__(*args, **kwargs)
+
+    def db_type(self, connection):
+        if connection.vendor == 'mysql':
+            return f'varbinary({self.max_length})'
+        return super().db_type(connection)
+
+    def from_db_value(self, value, expression, connection):
+        return None if value is None else bytes(value)
+
+    def to_python(self, value):
+        if isinstance(value, str):
+            try:
+                return bytes.fromhex(value)
+            except ValueError:
+                raise ValidationError(self.error_messages['invalid'], code='invalid', params={'value': value})
+        return None if value is None else bytes(value)
+
+    def get_prep_value(self, value):
+        return self.to_python(super().get_prep_value(value))
+
+    def value_to_string(self, obj):
+        value = self.value_from_object(obj)
+        return None if value is None else value.hex().upper()
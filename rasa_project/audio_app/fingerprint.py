@@ -0,0 +1,180 @@
+"""
+Landmark audio fingerprinting in the style of Dejavu, fully vectorised with NumPy/SciPy.
+
+Audio is reduced to a log-power spectrogram, local maxima are picked with a 2-D
+maximum filter, and each peak is paired with the next ``FAN_VALUE`` peaks to form
+``(f1, f2, dt)`` hashes packed into 31 bits, so they fit a signed or unsigned
+32-bit column on every database backend.
+"""
+import numpy as np
+from django.conf import settings
+from scipy.ndimage import maximum_filter
+
+from .decoding import decode_pcm
+from .hashing import iter_file_chunks
+from .models import AudioFingerprint, MyAudioFile
+from .s3 import get_s3_client
+
+SAMPLE_RATE = 11025
+WINDOW_SIZE = 1024
+HOP_SIZE = 512
+FAN_VALUE = 15
+PEAK_NEIGHBORHOOD = (15, 15)  # (frequency bins, frames)
+AMP_MIN_DB = 10.0
+MIN_HASH_DELTA = 1
+MAX_HASH_DELTA = 200
+
+FREQ_BITS = 10
+DELTA_BITS = 11
+
+
+def spectrogram(samples):
+    """Log-power spectrogram of mono ``samples``; rows are frequency bins, columns frames."""
+    samples = np.asarray(samples, dtype=np.float32)
+    if samples.size < WINDOW_SIZE:
+        return np.empty((WINDOW_SIZE // 2 + 1, 0), dtype=np.float32)
+    frames = np.lib.stride_tricks.sliding_window_view(samples, WINDOW_SIZE)[::HOP_SIZE]
+    power = np.abs(np.fft.rfft(frames * np.hanning(WINDOW_SIZE).astype(np.float32), axis=1)) ** 2
+    return (10 * np.log10(power + 1e-10)).T.astype(np.float32)
+
+
+def find_peaks(spec, amp_min=AMP_MIN_DB):
+    """Return ``(freqs, times)`` of the 2-D local maxima of ``spec`` louder than ``amp_min``, ordered by time."""
+    local_max = maximum_filter(spec, size=PEAK_NEIGHBORHOOD, mode='constant', cval=-np.inf) == spec
+    freqs, times = np.nonzero(local_max & (spec > amp_min))
+    order = np.lexsort((freqs, times))
+    return freqs[order], times[order]
+
+
+def pack_hashes(freq1, freq2, deltas):
+    return (
+        (freq1.astype(np.uint32) << (FREQ_BITS + DELTA_BITS))
+        | (freq2.astype(np.uint32) << DELTA_BITS)
+        | deltas.astype(np.uint32)
+    )
+
+
+def pair_peaks(freqs, times, anchor_count=None, fan_value=FAN_VALUE):
+    """
+    Pair each of the first ``anchor_count`` peaks (all by default) with the
+    next ``fan_value`` peaks; returns ``(hashes, offsets)`` uint32 arrays, not
+    de-duplicated. The offset is the anchor peak's frame.
+    """
+    count = len(times)
+    anchor_count = count if anchor_count is None else min(anchor_count, count)
+    if count < 2 or anchor_count < 1:
+        return np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.uint32)
+    anchors = np.repeat(np.arange(anchor_count), fan_value)
+    targets = anchors + np.tile(np.arange(1, fan_value + 1), anchor_count)
+    in_range = targets < count
+    anchors, targets = anchors[in_range], targets[in_range]
+
+    deltas = times[targets] - times[anchors]
+    valid = (deltas >= MIN_HASH_DELTA) & (deltas <= MAX_HASH_DELTA)
+    anchors, targets, deltas = anchors[valid], targets[valid], deltas[valid]
+    return pack_hashes(freqs[anchors], freqs[targets], deltas), times[anchors].astype(np.uint32)
+
+
+def unique_pairs(hashes, offsets):
+    """Drop repeated ``(hash, offset)`` pairs; the result is sorted by hash, then offset."""
+    pairs = np.unique((np.asarray(hashes, dtype=np.uint64) << 32) | np.asarray(offsets, dtype=np.uint64))
+    return (pairs >> 32).astype(np.uint32), (pairs & 0xFFFFFFFF).astype(np.uint32)
+
+
+def hash_peaks(freqs, times, fan_value=FAN_VALUE):
+    """Pair every peak with the next ``fan_value`` peaks and return unique ``(hashes, offsets)`` uint32 arrays."""
+    return unique_pairs(*pair_peaks(freqs, times, fan_value=fan_value))
+
+
+def fingerprint_samples(samples):
+    """Fingerprint mono ``samples`` at ``SAMPLE_RATE``; returns ``(hashes, offsets)``."""
+    freqs, times = find_peaks(spectrogram(samples))
+    return hash_peaks(freqs, times)
+
+
+class StreamingFingerprinter:
+    """
+    Incremental ``fingerprint_samples``: ``feed`` it consecutive blocks of
+    samples, then call ``finish``. The result is identical to fingerprinting
+    the whole signal at once, but only the unconsumed tail of the samples, the
+    spectrogram columns still inside a peak neighbourhood and the peaks still
+    waiting for pairs are kept between blocks.
+    """
+    # Columns either side of a column that decide whether it holds a peak.
+    MARGIN = PEAK_NEIGHBORHOOD[1] // 2
+
+    def __init__(self):
+        self.samples = np.empty(0, dtype=np.float32)
+        self.spec = np.empty((WINDOW_SIZE // 2 + 1, 0), dtype=np.float32)
+        self.spec_start = 0  # frame index of self.spec[:, 0]
+        self.settled = 0  # frames before this have had their peaks found
+        self.peak_freqs = np.empty(0, dtype=np.int64)
+        self.peak_times = np.empty(0, dtype=np.int64)
+        self.hashes = []
+        self.offsets = []
+
+    def feed(self, samples):
+        self.samples = np.concatenate([self.samples, np.asarray(samples, dtype=np.float32)])
+        frames = (len(self.samples) - WINDOW_SIZE) // HOP_SIZE + 1 if len(self.samples) >= WINDOW_SIZE else 0
+        if frames:
+            columns = spectrogram(self.samples[:(frames - 1) * HOP_SIZE + WINDOW_SIZE])
+            self.samples = self.samples[frames * HOP_SIZE:]
+            self._add_columns(columns, final=False)
+
+    def finish(self):
+        """Flush the buffered frames and peaks and return unique ``(hashes, offsets)``."""
+        self._add_columns(self.spec[:, :0], final=True)
+        if not self.hashes:
+            return np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.uint32)
+        return unique_pairs(np.concatenate(self.hashes), np.concatenate(self.offsets))
+
+    def _add_columns(self, columns, final):
+        self.spec = np.concatenate([self.spec, columns], axis=1)
+        end = self.spec_start + self.spec.shape[1]
+        settle_to = end if final else end - self.MARGIN
+        if settle_to <= self.settled:
+            return
+        freqs, times = find_peaks(self.spec)
+        times = times + self.spec_start
+        keep = (times >= self.settled) & (times < settle_to)
+        self._add_peaks(freqs[keep], times[keep], final)
+        self.settled = settle_to
+        drop = max(0, self.settled - self.MARGIN - self.spec_start)
+        self.spec = self.spec[:, drop:]
+        self.spec_start += drop
+
+    def _add_peaks(self, freqs, times, final):
+        self.peak_freqs = np.concatenate([self.peak_freqs, freqs])
+        self.peak_times = np.concatenate([self.peak_times, times])
+        # An anchor can be hashed once all FAN_VALUE peaks after it are known.
+        anchor_count = len(self.peak_times) if final else max(0, len(self.peak_times) - FAN_VALUE)
+        if anchor_count:
+            hashes, offsets = pair_peaks(self.peak_freqs, self.peak_times, anchor_count)
+            self.hashes.append(hashes)
+            self.offsets.append(offsets)
+            self.peak_freqs = self.peak_freqs[anchor_count:]
+            self.peak_times = self.peak_times[anchor_count:]
+
+
+def fingerprint_frames(frames):
+    """Fingerprint an iterable of mono sample blocks at ``SAMPLE_RATE`` with bounded memory."""
+    fingerprinter = StreamingFingerprinter()
+    for frame in frames:
+        fingerprinter.feed(frame)
+    return fingerprinter.finish()
+
+
+def fingerprint_chunks(chunks):
+    """Decode and fingerprint an iterable of encoded audio byte chunks without buffering the file."""
+    return fingerprint_frames(decode_pcm(chunks, SAMPLE_RATE))
+
+
+def fingerprint_audio_file(pk):
+    """Stream, decode and fingerprint a stored ``MyAudioFile``; returns the number of fingerprints stored."""
+    audio_file = MyAudioFile.objects.only('s3_key').get(pk=pk)
+    body = get_s3_client().get_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=audio_file.s3_key)['Body']
+    try:
+        hashes, offsets = fingerprint_chunks(iter_file_chunks(body, settings.AUDIO_DECODE_READ_SIZE))
+    finally:
+        body.close()
+    return AudioFingerprint.objects.replace_for_file(audio_file, hashes, offsets)
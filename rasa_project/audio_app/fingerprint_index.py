@@ -0,0 +1,377 @@
+import json
+import logging
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Max, Min, Q
+
+from .matching import EMPTY
+from .models import AudioFingerprint, MyAudioFile
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'manifest.json'
+
+
+class FingerprintSegment:
+    """
+    One immutable on-disk index segment: a 64-byte header followed by three
+    parallel little-endian ``uint32`` arrays (hashes, file ids, offsets), all
+    sorted by hash. Opened with ``numpy.memmap``, so lookups are zero-copy and
+    the page cache is shared by every process that maps the same file.
+    """
+    HEADER = struct.Struct('<4sIQQ40x')
+    MAGIC = b'AFPI'
+    VERSION = 1
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            magic, version, self.count, self.max_id = self.HEADER.unpack(f.read(self.HEADER.size))
+        if magic != self.MAGIC or version != self.VERSION:
+            raise ValueError(f'{path} is not a fingerprint index segment')
+        if self.count:
+            arrays = np.memmap(path, dtype='<u4', mode='r', offset=self.HEADER.size, shape=(3, self.count))
+            self.hashes, self.file_ids, self.offsets = arrays
+        else:
+            self.hashes = self.file_ids = self.offsets = np.empty(0, dtype='<u4')
+
+    @classmethod
+    def write(cls, path, chunks, max_id):
+        """
+        Write ``(hashes, file_ids, offsets)`` chunks that arrive sorted by hash
+        as a segment, atomically. Each column is spooled to a temporary file
+        as the chunks come in, so only one chunk is held in memory.
+        """
+        directory = os.path.dirname(path) or None
+        columns = [tempfile.TemporaryFile(dir=directory) for _ in range(3)]
+        try:
+            count = 0
+            for hashes, file_ids, offsets in chunks:
+                if len(file_ids) and int(np.max(file_ids)) > np.iinfo(np.uint32).max:
+                    raise ValueError('Audio file ids no longer fit the uint32 index format')
+                for column, array in zip(columns, (hashes, file_ids, offsets)):
+                    column.write(np.asarray(array, dtype='<u4').tobytes())
+                count += len(hashes)
+            tmp_path = f'{path}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION, count, max_id))
+                for column in columns:
+                    column.seek(0)
+                    shutil.copyfileobj(column, f)
+            os.replace(tmp_path, path)
+        finally:
+            for column in columns:
+                column.close()
+        return cls(path)
+
+    @classmethod
+    def in_memory(cls, chunks, max_id):
+        """A segment held in memory instead of mapped from a file, from chunks sorted by hash."""
+        segment = cls.__new__(cls)
+        chunks = list(chunks)
+        segment.path = None
+        segment.max_id = max_id
+        segment.hashes, segment.file_ids, segment.offsets = (
+            np.concatenate([chunk[i] for chunk in chunks]) if chunks else EMPTY for i in range(3)
+        )
+        segment.count = len(segment.hashes)
+        return segment
+
+    def ranges(self, hashes):
+        """``(starts, ends)`` of each of the sorted ``hashes`` in this segment."""
+        return np.searchsorted(self.hashes, hashes, 'left'), np.searchsorted(self.hashes, hashes, 'right')
+
+
+def _expand(starts, ends):
+    """Concatenate ``arange(start, end)`` for every range, vectorised."""
+    counts = ends - starts
+    total = int(counts.sum())
+    return np.repeat(starts, counts) + (np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts))
+
+
+def first_fingerprint_ids(min_id, max_id=None):
+    """
+    ``{file id: id of its first fingerprint}`` for the files with fingerprints
+    in ``(min_id, max_id]``. ``replace_for_file`` rewrites all of a file's
+    fingerprints at once, so the file's postings in segments built before that
+    id come from an earlier fingerprinting and are dead.
+    """
+    rows = AudioFingerprint.objects.filter(pk__gt=min_id)
+    if max_id is not None:
+        rows = rows.filter(pk__lte=max_id)
+    return dict(rows.order_by().values('audio_file_id').annotate(first=Min('pk')).values_list('audio_file_id', 'first'))
+
+
+def _tombstone_arrays(tombstones):
+    """Sorted ``(file_ids, first_ids)`` arrays of a ``{file id: first fingerprint id}`` mapping."""
+    # JSON manifests key them by string.
+    pairs = np.array(sorted((int(file_id), first_id) for file_id, first_id in tombstones.items()), dtype=np.int64)
+    if not len(pairs):
+        return EMPTY, EMPTY
+    return pairs[:, 0], pairs[:, 1]
+
+
+def _live(segment, file_ids, tombstones):
+    """Mask of the postings of ``file_ids`` in ``segment`` that no tombstone kills."""
+    dead_files, first_ids = tombstones
+    if not len(dead_files) or not len(file_ids):
+        return np.ones(len(file_ids), dtype=bool)
+    i = np.minimum(np.searchsorted(dead_files, file_ids), len(dead_files) - 1)
+    return ~((dead_files[i] == file_ids) & (segment.max_id < first_ids[i]))
+
+
+class MemmapFingerprintIndex:
+    """
+    Fingerprint index served from memory-mapped segments: one base segment,
+    delta segments for fingerprints stored since, and an in-memory segment of
+    the few rows newer than the last one, reloaded from the database every
+    ``AUDIO_FINGERPRINT_INDEX_RELOAD_SECONDS``. Same interface as
+    ``DatabaseFingerprintIndex``.
+
+    Segments are immutable, so the postings of a re-fingerprinted file are
+    masked by the tombstones recorded in the manifest by ``build_delta``, and
+    by those of the files re-fingerprinted in the database tail, until
+    ``merge_segments`` drops them.
+    """
+    # Dead postings count towards a hash's size in a segment, so hashes up to
+    # this multiple of max_fanout are expanded before their live postings are
+    # counted; more common ones are dropped unseen.
+    FANOUT_SLACK = 2
+
+    def __init__(self, directory, manifest):
+        self.directory = directory
+        self.max_id = manifest['max_id']
+        names = [manifest['base']] + manifest['deltas']
+        self.segments = [FingerprintSegment(os.path.join(directory, name)) for name in names]
+        self.tombstones = _tombstone_arrays(manifest.get('tombstones', {}))
+        self._tail = None
+        self._tail_lock = threading.Lock()
+
+    def tail(self):
+        """
+        ``(segment, tombstones)`` of the fingerprints stored since the last
+        segment, read from the database at most once per reload interval.
+        """
+        tail = self._tail
+        if tail is None or time.monotonic() - tail[0] >= settings.AUDIO_FINGERPRINT_INDEX_RELOAD_SECONDS:
+            with self._tail_lock:
+                if self._tail is tail:
+                    max_id = max_fingerprint_id(self.max_id)
+                    segment = FingerprintSegment.in_memory(iter_fingerprints(self.max_id, max_id), max_id)
+                    tombstones = _tombstone_arrays(first_fingerprint_ids(self.max_id, max_id))
+                    self._tail = (time.monotonic(), segment, tombstones)
+                tail = self._tail
+        return tail[1:]
+
+    def postings(self, hashes, max_fanout):
+        hashes = np.asarray(hashes, dtype=np.int64)
+        tail, tail_tombstones = self.tail()
+        segments = self.segments + [tail]
+        ranges = [segment.ranges(hashes) for segment in segments]
+
+        raw_counts = sum((ends - starts for starts, ends in ranges), np.zeros(len(hashes), dtype=np.int64))
+        expand = raw_counts <= max_fanout * self.FANOUT_SLACK
+        parts = []
+        for segment, (starts, ends) in zip(segments, ranges):
+            positions = _expand(starts[expand], ends[expand])
+            file_ids = segment.file_ids[positions]
+            live = _live(segment, file_ids, self.tombstones) & _live(segment, file_ids, tail_tombstones)
+            positions = positions[live]
+            parts.append((segment.hashes[positions], segment.file_ids[positions], segment.offsets[positions]))
+        if not any(len(part[0]) for part in parts):
+            return EMPTY, EMPTY, EMPTY
+        posting_hashes, file_ids, offsets = (np.concatenate([part[i] for part in parts]).astype(np.int64) for i in range(3))
+
+        counts = np.bincount(np.searchsorted(hashes, posting_hashes), minlength=len(hashes))
+        keep = (counts <= max_fanout)[np.searchsorted(hashes, posting_hashes)]
+        return posting_hashes[keep], file_ids[keep], offsets[keep]
+
+
+def read_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_manifest(directory, manifest):
+    path = os.path.join(directory, MANIFEST_NAME)
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(manifest, f)
+    os.replace(f'{path}.tmp', path)
+
+
+def max_fingerprint_id(min_id=0):
+    """The largest ``AudioFingerprint`` id, or ``min_id`` when there is none above it."""
+    return AudioFingerprint.objects.filter(pk__gt=min_id).aggregate(max_id=Max('pk'))['max_id'] or min_id
+
+
+def iter_fingerprints(min_id, max_id, batch_size=100000):
+    """
+    Yield ``(hashes, file_ids, offsets)`` arrays of the fingerprints with
+    ``min_id < pk <= max_id`` in hash order, ``batch_size`` rows at a time,
+    paginating on ``(hash, pk)`` so every query is a bounded index range.
+    """
+    rows = (
+        AudioFingerprint.objects.filter(pk__gt=min_id, pk__lte=max_id).order_by('hash', 'pk')
+        .values_list('hash', 'pk', 'audio_file_id', 'offset')
+    )
+    page = rows
+    while True:
+        batch = np.array(list(page[:batch_size]), dtype=np.int64).reshape(-1, 4)
+        if len(batch):
+            yield batch[:, 0], batch[:, 2], batch[:, 3]
+        if len(batch) < batch_size:
+            return
+        last_hash, last_id = int(batch[-1, 0]), int(batch[-1, 1])
+        page = rows.filter(Q(hash=last_hash, pk__gt=last_id) | Q(hash__gt=last_hash))
+
+
+def _segment_name(kind):
+    return f'{kind}-{time.time_ns()}.fpi'
+
+
+def build_base(directory):
+    """Write a base segment with every stored fingerprint and point the manifest at it alone."""
+    os.makedirs(directory, exist_ok=True)
+    max_id = max_fingerprint_id()
+    name = _segment_name('base')
+    segment = FingerprintSegment.write(os.path.join(directory, name), iter_fingerprints(0, max_id), max_id)
+    _replace_manifest(directory, {'base': name, 'deltas': [], 'max_id': max_id, 'tombstones': {}})
+    return segment
+
+
+def build_delta(directory):
+    """
+    Append a delta segment with fingerprints stored since the last segment,
+    and tombstone the earlier postings of the files they belong to; returns
+    the segment, or None.
+    """
+    manifest = read_manifest(directory)
+    if manifest is None:
+        return build_base(directory)
+    max_id = max_fingerprint_id(manifest['max_id'])
+    if max_id == manifest['max_id']:
+        return None
+    name = _segment_name('delta')
+    segment = FingerprintSegment.write(os.path.join(directory, name), iter_fingerprints(manifest['max_id'], max_id), max_id)
+    tombstones = {**manifest.get('tombstones', {}), **{
+        str(file_id): first_id for file_id, first_id in first_fingerprint_ids(manifest['max_id'], max_id).items()
+    }}
+    write_manifest(directory, {
+        **manifest, 'deltas': manifest['deltas'] + [name], 'max_id': max_id, 'tombstones': tombstones,
+    })
+    return segment
+
+
+def _existing_files(file_ids, chunk_size=500):
+    """Mask of the ``file_ids`` whose audio files still exist."""
+    unique = np.unique(file_ids).tolist()
+    existing = []
+    for start in range(0, len(unique), chunk_size):
+        existing.extend(MyAudioFile.objects.filter(pk__in=unique[start:start + chunk_size]).values_list('pk', flat=True))
+    return np.isin(file_ids, np.array(existing, dtype=np.int64))
+
+
+def _merge_chunks(segments, tombstones, batch_size=100000):
+    """
+    K-way merge of hash-sorted ``segments`` into hash-sorted chunks of the
+    postings no tombstone kills and whose files still exist. Each chunk spans
+    the hashes between two consecutive samples taken every ``batch_size``
+    postings of any segment, so it holds about ``batch_size`` postings of
+    each segment at most.
+    """
+    bounds = np.unique(np.concatenate([np.asarray(segment.hashes[::batch_size]) for segment in segments]))
+    positions = [np.append(np.searchsorted(segment.hashes, bounds), segment.count) for segment in segments]
+    for i in range(len(bounds)):
+        parts = []
+        for segment, segment_positions in zip(segments, positions):
+            chunk = slice(segment_positions[i], segment_positions[i + 1])
+            file_ids = np.asarray(segment.file_ids[chunk], dtype=np.int64)
+            live = np.ones(len(file_ids), dtype=bool)
+            for dead in tombstones:
+                live &= _live(segment, file_ids, dead)
+            parts.append([np.asarray(getattr(segment, field)[chunk])[live] for field in ('hashes', 'file_ids', 'offsets')])
+        hashes, file_ids, offsets = (np.concatenate([part[j] for part in parts]) for j in range(3))
+        keep = _existing_files(file_ids)
+        order = np.argsort(hashes[keep], kind='stable')
+        yield hashes[keep][order], file_ids[keep][order], offsets[keep][order]
+
+
+def merge_segments(directory):
+    """
+    Merge the base and all delta segments into a new base segment, leaving out
+    postings that tombstones mark dead and those of deleted files.
+    """
+    manifest = read_manifest(directory)
+    if manifest is None or not manifest['deltas']:
+        return None
+    segments = [FingerprintSegment(os.path.join(directory, name)) for name in [manifest['base']] + manifest['deltas']]
+    tombstones = [
+        _tombstone_arrays(manifest.get('tombstones', {})),
+        _tombstone_arrays(first_fingerprint_ids(manifest['max_id'])),
+    ]
+    name = _segment_name('base')
+    merged = FingerprintSegment.write(os.path.join(directory, name), _merge_chunks(segments, tombstones), manifest['max_id'])
+    _replace_manifest(directory, {'base': name, 'deltas': [], 'max_id': manifest['max_id'], 'tombstones': {}})
+    return merged
+
+
+def _replace_manifest(directory, manifest):
+    old = read_manifest(directory)
+    write_manifest(directory, manifest)
+    if old:
+        # Workers still mapping the old files keep reading them until they reload;
+        # unlinking a mapped file is safe on POSIX.
+        for name in [old['base']] + old['deltas']:
+            if name not in [manifest['base']] + manifest['deltas']:
+                try:
+                    os.remove(os.path.join(directory, name))
+                except FileNotFoundError:
+                    pass
+
+
+_index = None
+_index_checked_at = 0.0
+_index_mtime = None
+_index_lock = threading.Lock()
+
+
+def get_memmap_index():
+    """
+    The process's memory-mapped index, reopened when the manifest changes
+    (checked every ``AUDIO_FINGERPRINT_INDEX_RELOAD_SECONDS``), or None when
+    no index has been built.
+    """
+    global _index, _index_checked_at, _index_mtime
+    directory = settings.AUDIO_FINGERPRINT_INDEX_DIR
+    if time.monotonic() - _index_checked_at < settings.AUDIO_FINGERPRINT_INDEX_RELOAD_SECONDS:
+        return _index
+    with _index_lock:
+        _index_checked_at = time.monotonic()
+        try:
+            mtime = os.stat(os.path.join(directory, MANIFEST_NAME)).st_mtime_ns
+        except FileNotFoundError:
+            _index = _index_mtime = None
+            return None
+        if mtime != _index_mtime:
+            try:
+                _index = MemmapFingerprintIndex(directory, read_manifest(directory))
+                _index_mtime = mtime
+            except (OSError, ValueError) as e:
+                logger.error(f"Could not open fingerprint index in {directory}: {e}")
+        return _index
+
+
+def reset_memmap_index():
+    global _index, _index_checked_at, _index_mtime
+    with _index_lock:
+        _index, _index_checked_at, _index_mtime = None, 0.0, None
@@ -0,0 +1,254 @@
+import hashlib
+import logging
+import math
+import os
+import struct
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over strings, backed by a bytearray.
+    Sized from the expected ``capacity`` and target ``error_rate``.
+    """
+    HEADER = struct.Struct('<4sdQQQQ')
+    # Bumped when the keys change (AHBF snapshots held hashes in their stored case).
+    MAGIC = b'AHB2'
+
+    def __init__(self, capacity, error_rate=0.01, bits=None, count=0):
+        self.capacity = max(int(capacity), 1)
+        self.error_rate = error_rate
+        self.num_bits = max(int(math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2)), 8)
+        self.num_hashes = max(int(round(self.num_bits / self.capacity * math.log(2))), 1)
+        self.bits = bits if bits is not None else bytearray((self.num_bits + 7) // 8)
+        self.count = count
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+    def expected_false_positive_rate(self):
+        """Theoretical false-positive rate for the number of items added so far."""
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+    def dump(self, fileobj, last_id=0):
+        fileobj.write(self.HEADER.pack(self.MAGIC, self.error_rate, self.capacity, self.count, last_id, len(self.bits)))
+        fileobj.write(self.bits)
+
+    @classmethod
+    def load(cls, fileobj):
+        """Return ``(bloom, last_id)`` read from a snapshot written by :meth:`dump`."""
+        magic, error_rate, capacity, count, last_id, size = cls.HEADER.unpack(fileobj.read(cls.HEADER.size))
+        if magic != cls.MAGIC:
+            raise ValueError('Not an audio hash filter snapshot')
+        bits = bytearray(fileobj.read(size))
+        bloom = cls(capacity, error_rate, bits=bits, count=count)
+        if len(bits) != (bloom.num_bits + 7) // 8:
+            raise ValueError('Truncated audio hash filter snapshot')
+        return bloom, last_id
+
+
+class AudioHashFilter:
+    """
+    Process-local Bloom filter in front of the ``MyAudioFile.file_hash`` lookup.
+
+    A negative answer is definite, so only possible hits reach the database.
+    The filter is loaded lazily from the snapshot written by the
+    ``rebuild_hash_filter`` command (or built from the database), updated by the
+    ``post_save`` signal for rows created in this process, and caught up with
+    rows inserted by other processes every ``AUDIO_HASH_FILTER_REFRESH_SECONDS``,
+    so a row stored elsewhere can be missed for up to that long. Hashes are keyed in upper case, so the filter never rules
+    out a hash the case-insensitive digest lookup would find.
+    """
+    # Rows re-read below the highest id seen, so rows whose transactions
+    # committed out of id order are not missed by the catch-up query.
+    REFRESH_OVERLAP = 1000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._bloom = None
+            self._last_id = 0
+            self._refreshed_at = 0.0
+            self.lookups = 0
+            self.definite_misses = 0
+            self.possible_hits = 0
+            self.false_positives = 0
+
+    @property
+    def enabled(self):
+        return settings.AUDIO_HASH_FILTER_ENABLED
+
+    def build(self, capacity=None, error_rate=None):
+        """Build a fresh filter from every stored hash and swap it in."""
+        from .models import MyAudioFile
+
+        rows = MyAudioFile.objects.count()
+        bloom = BloomFilter(
+            capacity or max(settings.AUDIO_HASH_FILTER_CAPACITY, rows * 2),
+            error_rate or settings.AUDIO_HASH_FILTER_ERROR_RATE,
+        )
+        last_id = 0
+        for pk, file_hash in MyAudioFile.objects.order_by().values_list('pk', 'file_hash').iterator(chunk_size=10000):
+            bloom.add(file_hash.upper())
+            last_id = max(last_id, pk)
+        with self._lock:
+            self._bloom = bloom
+            self._last_id = last_id
+            self._refreshed_at = time.monotonic()
+        logger.info('Built audio hash filter with %s hashes', bloom.count)
+        return bloom
+
+    def save(self, path=None):
+        path = path or settings.AUDIO_HASH_FILTER_PATH
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._lock:
+            bloom, last_id = self._bloom, self._last_id
+            if bloom is None:
+                raise ValueError('The audio hash filter has not been built')
+            tmp_path = f'{path}.tmp'
+            with open(tmp_path, 'wb') as f:
+                bloom.dump(f, last_id)
+        os.replace(tmp_path, path)
+
+    def _load_snapshot(self, path):
+        try:
+            with open(path, 'rb') as f:
+                return BloomFilter.load(f)
+        except FileNotFoundError:
+            return None
+        except (ValueError, struct.error) as e:
+            logger.warning(f"Ignoring unreadable audio hash filter snapshot {path}: {e}")
+            return None
+
+    def _ensure_ready(self):
+        if self._bloom is None:
+            with self._build_lock:
+                if self._bloom is not None:
+                    return
+                snapshot = self._load_snapshot(settings.AUDIO_HASH_FILTER_PATH)
+                if snapshot is None:
+                    self.build()
+                    return
+                with self._lock:
+                    self._bloom, self._last_id = snapshot
+                self._catch_up()
+        elif time.monotonic() - self._refreshed_at >= settings.AUDIO_HASH_FILTER_REFRESH_SECONDS:
+            self._catch_up()
+
+    def _catch_up(self):
+        from .models import MyAudioFile
+
+        rows = list(
+            MyAudioFile.objects.filter(pk__gt=self._last_id - self.REFRESH_OVERLAP)
+            .order_by().values_list('pk', 'file_hash')
+        )
+        with self._lock:
+            for pk, file_hash in rows:
+                key = file_hash.upper()
+                if key not in self._bloom:
+                    self._bloom.add(key)
+                self._last_id = max(self._last_id, pk)
+            self._refreshed_at = time.monotonic()
+            oversized = self._bloom.count > self._bloom.capacity
+        if oversized:
+            self.build()
+
+    def add(self, file_hash):
+        """Record a newly stored hash. A no-op until the filter is first used."""
+        self.add_many([file_hash])
+
+    def add_many(self, file_hashes):
+        with self._lock:
+            if self._bloom is None:
+                return
+            for file_hash in file_hashes:
+                key = file_hash.upper()
+                if key not in self._bloom:
+                    self._bloom.add(key)
+
+    def existing_hashes(self, hashes):
+        """
+        Same contract as ``MyAudioFile.objects.existing_hashes``, but hashes the
+        filter rules out are answered without a query.
+        """
+        from .models import MyAudioFile
+
+        hashes = list(dict.fromkeys(hashes))
+        if not self.enabled:
+            return MyAudioFile.objects.existing_hashes(hashes)
+
+        self._ensure_ready()
+        bloom = self._bloom
+        candidates = [file_hash for file_hash in hashes if file_hash.upper() in bloom]
+        found = MyAudioFile.objects.existing_hashes(candidates) if candidates else set()
+        self._count(len(hashes), len(candidates), len(found))
+        return found
+
+    def _count(self, looked_up, candidates, found):
+        self.lookups += looked_up
+        self.definite_misses += looked_up - candidates
+        self.possible_hits += candidates
+        self.false_positives += candidates - found
+
+    def hash_exists(self, file_hash):
+        return file_hash in self.existing_hashes([file_hash])
+
+    async def ahash_exists(self, file_hash):
+        """
+        ``hash_exists`` for async views. While the filter is fresh a definite
+        miss is answered on the event loop, without a thread or a query.
+        """
+        from .models import MyAudioFile
+
+        if not self.enabled:
+            return await MyAudioFile.objects.ahash_exists(file_hash)
+        refresh_due = time.monotonic() - self._refreshed_at >= settings.AUDIO_HASH_FILTER_REFRESH_SECONDS
+        if self._bloom is None or refresh_due:
+            await sync_to_async(self._ensure_ready)()
+        candidate = file_hash.upper() in self._bloom
+        found = candidate and await MyAudioFile.objects.ahash_exists(file_hash)
+        self._count(1, int(candidate), int(found))
+        return found
+
+    def stats(self):
+        bloom = self._bloom
+        negatives = self.definite_misses + self.false_positives
+        return {
+            'enabled': self.enabled,
+            'loaded': bloom is not None,
+            'capacity': bloom.capacity if bloom else None,
+            'num_bits': bloom.num_bits if bloom else None,
+            'num_hashes': bloom.num_hashes if bloom else None,
+            'count': bloom.count if bloom else None,
+            'expected_false_positive_rate': bloom.expected_false_positive_rate() if bloom else None,
+            'lookups': self.lookups,
+            'definite_misses': self.definite_misses,
+            'possible_hits': self.possible_hits,
+            'false_positives': self.false_positives,
+            'observed_false_positive_rate': self.false_positives / negatives if negatives else None,
+        }
+
+
+hash_filter = AudioHashFilter()
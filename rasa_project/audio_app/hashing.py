@@ -0,0 +1,81 @@
+import hashlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+HASH_ALGORITHMS_BY_HEX_LENGTH = {40: 'sha1', 64: 'sha256'}
+
+# Algorithm tags stored next to binary digests (MyAudioFile.hash_algorithm).
+HASH_SHA1 = 1
+HASH_SHA256 = 2
+HASH_BLAKE2B_256 = 3
+HASH_ALGORITHM_NAMES = {HASH_SHA1: 'sha1', HASH_SHA256: 'sha256', HASH_BLAKE2B_256: 'blake2b-256'}
+HASH_ALGORITHM_CODES = {name: code for code, name in HASH_ALGORITHM_NAMES.items()}
+DIGEST_SIZES = {HASH_SHA1: 20, HASH_SHA256: 32, HASH_BLAKE2B_256: 32}
+
+
+def algorithm_for_hash(hex_digest):
+    """Infer the hash algorithm from the length of a hex digest, or None."""
+    return HASH_ALGORITHMS_BY_HEX_LENGTH.get(len(hex_digest or ''))
+
+
+def parse_hex_digest(hex_digest, algorithm=None):
+    """
+    Return ``(digest bytes, algorithm code)`` for a hex digest. ``algorithm``
+    is a name from ``HASH_ALGORITHM_NAMES``; by default it is inferred from the
+    length (64 hex digits mean SHA-256). Raises ``ValueError`` if the digest
+    is not hex or does not fit the algorithm.
+    """
+    code = HASH_ALGORITHM_CODES.get(algorithm or algorithm_for_hash(hex_digest))
+    if code is None:
+        raise ValueError(f'Unknown hash algorithm for {hex_digest!r}')
+    digest = bytes.fromhex(hex_digest)
+    if len(digest) != DIGEST_SIZES[code]:
+        raise ValueError(f'{HASH_ALGORITHM_NAMES[code]} digests are {DIGEST_SIZES[code]} bytes')
+    return digest, code
+
+
+def new_hasher(algorithm):
+    if algorithm == 'blake2b-256':
+        return hashlib.blake2b(digest_size=32)
+    return hashlib.new(algorithm)
+
+
+def hash_chunks(chunks, algorithm='sha1'):
+    """Feed an iterable of byte chunks into ``hashlib`` in order and return the uppercase hex digest."""
+    s = new_hasher(algorithm)
+    for chunk in chunks:
+        s.update(chunk)
+    return s.hexdigest().upper()
+
+
+def iter_file_chunks(fileobj, blocksize=2**20):
+    """Yield ``blocksize`` chunks from a binary file object."""
+    while True:
+        buf = fileobj.read(blocksize)
+        if not buf:
+            break
+        yield buf
+
+
+def iter_s3_object(client, bucket, key, size=None, chunk_size=8 * 2**20, workers=4):
+    """
+    Yield the bytes of an S3 object in order, fetched with parallel ranged GETs.
+    At most ``workers`` chunks are in flight or buffered at a time, so memory
+    stays bounded by ``workers * chunk_size`` whatever the object size.
+    """
+    if size is None:
+        size = client.head_object(Bucket=bucket, Key=key)['ContentLength']
+
+    def fetch(start):
+        end = min(start + chunk_size, size) - 1
+        return client.get_object(Bucket=bucket, Key=key, Range=f'bytes={start}-{end}')['Body'].read()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for start in range(0, size, chunk_size):
+            pending.append(pool.submit(fetch, start))
+            if len(pending) >= workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
@@ -0,0 +1,68 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import IntegrityError, transaction
+
+from audio_app.hashing import parse_hex_digest
+from audio_app.models import MyAudioFile
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill MyAudioFile.digest and hash_algorithm from file_hash for rows stored before those columns "
+        "existed. Runs in short pk-ordered batches so it can run while the site is live, and can be resumed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows updated per transaction.')
+        parser.add_argument('--sleep', type=float, default=0.0, help='Seconds to pause between batches.')
+
+    def handle(self, *args, **options):
+        counts = {'updated': 0, 'unparseable': 0, 'conflicts': 0}
+        started = time.monotonic()
+        last_pk = 0
+        while True:
+            rows = list(
+                MyAudioFile.objects.filter(digest__isnull=True, pk__gt=last_pk)
+                .order_by('pk').only('pk', 'file_hash')[:options['batch_size']]
+            )
+            if not rows:
+                break
+            last_pk = rows[-1].pk
+            parsed = []
+            for row in rows:
+                try:
+                    row.digest, row.hash_algorithm = parse_hex_digest(row.file_hash)
+                except ValueError:
+                    counts['unparseable'] += 1
+                else:
+                    parsed.append(row)
+            self.update(parsed, counts)
+            self.stdout.write(
+                f"up to pk {last_pk}: {counts['updated']} updated, {counts['unparseable']} unparseable, "
+                f"{counts['conflicts']} conflicts, {counts['updated'] / (time.monotonic() - started):.0f} rows/s"
+            )
+            if options['sleep']:
+                time.sleep(options['sleep'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {counts['updated']} updated, {counts['unparseable']} unparseable, {counts['conflicts']} conflicts"
+        ))
+
+    def update(self, rows, counts):
+        try:
+            with transaction.atomic():
+                MyAudioFile.objects.bulk_update(rows, ['digest', 'hash_algorithm'])
+            counts['updated'] += len(rows)
+            return
+        except IntegrityError:
+            pass
+        # Some digest is already taken, e.g. by the same hash stored in another letter case.
+        for row in rows:
+            try:
+                with transaction.atomic():
+                    MyAudioFile.objects.filter(pk=row.pk).update(digest=row.digest, hash_algorithm=row.hash_algorithm)
+            except IntegrityError:
+                counts['conflicts'] += 1
+                self.stderr.write(f'Digest of audio file {row.pk} ({row.file_hash}) is already stored; skipped')
+            else:
+                counts['updated'] += 1
@@ -0,0 +1,49 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from audio_app.fingerprint_index import build_base, build_delta, merge_segments, read_manifest
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the memory-mapped fingerprint index from the database. By default a full base segment is built; "
+        "--delta appends a segment for fingerprints stored since the last one, --merge folds deltas into a new "
+        "base, and --watch keeps doing both in the background."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--directory', default=settings.AUDIO_FINGERPRINT_INDEX_DIR)
+        mode = parser.add_mutually_exclusive_group()
+        mode.add_argument('--delta', action='store_true', help='Append a delta segment.')
+        mode.add_argument('--merge', action='store_true', help='Merge delta segments into a new base segment.')
+        mode.add_argument('--watch', type=int, metavar='SECONDS', help='Append deltas every SECONDS and merge them when there are too many.')
+        parser.add_argument('--max-deltas', type=int, default=settings.AUDIO_FINGERPRINT_INDEX_MAX_DELTAS,
+                            help='With --watch, merge once this many delta segments exist.')
+
+    def handle(self, *args, **options):
+        directory = options['directory']
+        if options['watch']:
+            while True:
+                self._delta(directory)
+                if len(read_manifest(directory)['deltas']) >= options['max_deltas']:
+                    self._merge(directory)
+                time.sleep(options['watch'])
+        elif options['delta']:
+            self._delta(directory)
+        elif options['merge']:
+            self._merge(directory)
+        else:
+            segment = build_base(directory)
+            self.stdout.write(self.style.SUCCESS(f'Wrote base segment with {segment.count} fingerprints to {segment.path}'))
+
+    def _delta(self, directory):
+        segment = build_delta(directory)
+        if segment is not None:
+            self.stdout.write(f'Wrote segment with {segment.count} fingerprints to {segment.path}')
+
+    def _merge(self, directory):
+        segment = merge_segments(directory)
+        if segment is not None:
+            self.stdout.write(self.style.SUCCESS(f'Merged {segment.count} fingerprints into {segment.path}'))
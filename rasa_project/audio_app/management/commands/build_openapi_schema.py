@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from rasa_project.schema import SCHEMA_FORMATS, schema_artifacts, write_schema
+
+
+class Command(BaseCommand):
+    help = (
+        "Render the OpenAPI schema to OPENAPI_SCHEMA_DIR so /swagger/, /redoc/ and /swagger.json|yaml serve "
+        "it without regenerating it per request. Run on every deploy."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', action='append', dest='formats', choices=sorted(SCHEMA_FORMATS),
+                            help='Formats to write; defaults to all. May be repeated.')
+
+    def handle(self, *args, **options):
+        for schema_format in options['formats'] or sorted(SCHEMA_FORMATS):
+            path, body = write_schema(schema_format)
+            _, etag = schema_artifacts[schema_format].get()
+            self.stdout.write(f'{path}: {len(body)} bytes, ETag {etag}')
+        self.stdout.write(self.style.SUCCESS('OpenAPI schema built'))
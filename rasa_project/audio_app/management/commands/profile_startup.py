@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from rasa_project.startup import (
+    DEFERRED_MODULES, IMPORT_BUDGET_MS, PHASES, profile_startup, project_import_ms, time_by_owner,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Profile imports during startup (django.setup(), then loading the URLconf) in a fresh interpreter "
+        "and report the time per app and the heaviest modules."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--phase', choices=PHASES, action='append', dest='phases',
+                            help='Phases to report; defaults to both. May be repeated.')
+        parser.add_argument('--top', type=int, default=15, help='Number of heaviest modules to list.')
+        parser.add_argument('--check', action='store_true',
+                            help='Exit with an error if a phase is over its import budget or imports a deferred module.')
+
+    def handle(self, *args, **options):
+        profile = profile_startup()
+        failures = []
+        for phase in options['phases'] or PHASES:
+            records = profile[phase]
+            total_ms = sum(record.self_us for record in records) / 1000
+            self.stdout.write(self.style.MIGRATE_HEADING(f'{phase}: {total_ms:.1f} ms in {len(records)} imports'))
+            self.stdout.write(f"  {'charged to':<28} {'ms':>8} {'share':>6}")
+            for owner, ms in time_by_owner(records):
+                self.stdout.write(f'  {owner:<28} {ms:>8.1f} {ms / total_ms:>6.0%}')
+            self.stdout.write(f"  {'heaviest (cumulative)':<28} {'ms':>8}  charged to")
+            for record in sorted(records, key=lambda record: -record.cumulative_us)[:options['top']]:
+                self.stdout.write(f'  {record.module:<28} {record.cumulative_us / 1000:>8.1f}  {record.owner}')
+            project_ms = project_import_ms(records)
+            over_budget = project_ms > IMPORT_BUDGET_MS[phase]
+            style = self.style.ERROR if over_budget else self.style.SUCCESS
+            self.stdout.write(style(f'  project imports: {project_ms:.1f} ms (budget {IMPORT_BUDGET_MS[phase]} ms)'))
+            loaded = {record.module for record in records}
+            eager = [module for module in DEFERRED_MODULES[phase] if module in loaded]
+            if eager:
+                self.stdout.write(self.style.WARNING(f"  imported eagerly: {', '.join(eager)}"))
+            if over_budget or eager:
+                failures.append(phase)
+        if options['check'] and failures:
+            raise CommandError(f"Startup check failed for: {', '.join(failures)}")
@@ -0,0 +1,21 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from audio_app.hash_filter import hash_filter
+
+
+class Command(BaseCommand):
+    help = "Rebuild the audio hash Bloom filter from the database and persist it as a snapshot."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--capacity', type=int, help='Expected number of hashes (defaults to twice the current row count).')
+        parser.add_argument('--error-rate', type=float, help='Target false-positive rate.')
+        parser.add_argument('--path', default=settings.AUDIO_HASH_FILTER_PATH, help='Where to write the snapshot.')
+
+    def handle(self, *args, **options):
+        bloom = hash_filter.build(capacity=options['capacity'], error_rate=options['error_rate'])
+        hash_filter.save(options['path'])
+        self.stdout.write(self.style.SUCCESS(f"Wrote filter with {bloom.count} hashes to {options['path']}"))
+        self.stdout.write(json.dumps(hash_filter.stats(), indent=2))
@@ -0,0 +1,116 @@
+import logging
+import multiprocessing
+import os
+import socket
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Avg, Count, Max
+
+from audio_app.models import AudioTask
+from audio_app.tasks import claim_tasks, complete_task, execute_task, fail_task, renew_locks, run_task
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Claim queued audio tasks and run them in a process pool sized to the CPU count."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                            help='Pool size; 0 runs tasks inline in this process.')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to wait when the queue is empty.')
+        parser.add_argument('--once', action='store_true', help='Exit once no runnable tasks are left.')
+        parser.add_argument('--stats', action='store_true', help='Print per-task counts and timings, then exit.')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            return self.print_stats()
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        if options['processes'] == 0:
+            return self.run_inline(options)
+        while not self.run_pool(options):
+            logger.error('Audio worker pool broke; starting a new one')
+
+    def run_inline(self, options):
+        # Nothing renews the lock while a task runs inline, so the task timeout
+        # has to end it before the lock expires.
+        if not 0 < settings.AUDIO_TASK_TIMEOUT < settings.AUDIO_TASK_VISIBILITY_TIMEOUT:
+            raise CommandError('Running tasks inline needs 0 < AUDIO_TASK_TIMEOUT < AUDIO_TASK_VISIBILITY_TIMEOUT')
+        while True:
+            tasks = claim_tasks(self.worker_id, 1)
+            if not tasks:
+                if options['once']:
+                    return
+                time.sleep(options['poll_interval'])
+                continue
+            for task in tasks:
+                execute_task(task, settings.AUDIO_TASK_TIMEOUT)
+                self.report(task)
+
+    def run_pool(self, options):
+        """Run until done (``--once``); returns False if the pool broke and must be replaced."""
+        processes = options['processes']
+        # Pool processes are spawned and set Django up themselves, so no database
+        # socket is shared with them.
+        connections.close_all()
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=processes, mp_context=context, initializer=django.setup) as pool:
+            running = {}
+            renewed_at = time.monotonic()
+            while True:
+                # Renew the locks of running tasks well before they expire.
+                if running and time.monotonic() - renewed_at >= settings.AUDIO_TASK_VISIBILITY_TIMEOUT / 3:
+                    renew_locks(self.worker_id, running.values())
+                    renewed_at = time.monotonic()
+                free = processes - len(running)
+                if free:
+                    for task in claim_tasks(self.worker_id, free):
+                        future = pool.submit(run_task, task.name, task.payload, settings.AUDIO_TASK_TIMEOUT)
+                        running[future] = task
+                if not running:
+                    if options['once']:
+                        return True
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                done, _ = wait(running, timeout=options['poll_interval'], return_when=FIRST_COMPLETED)
+                broken = False
+                for future in done:
+                    task = running.pop(future)
+                    try:
+                        _, duration_ms = future.result()
+                    except BrokenProcessPool:
+                        broken = True
+                        fail_task(task, 'Worker process died')
+                    except Exception as e:
+                        fail_task(task, ''.join(traceback.format_exception(e)))
+                    else:
+                        complete_task(task, duration_ms)
+                    self.report(task)
+                if broken:
+                    for task in running.values():
+                        fail_task(task, 'Worker process died')
+                    return False
+
+    def report(self, task):
+        task.refresh_from_db(fields=['status', 'duration_ms'])
+        self.stdout.write(f'{task.name} #{task.pk}: {task.status} in {task.duration_ms} ms')
+
+    def print_stats(self):
+        rows = (
+            AudioTask.objects.values('name', 'status')
+            .annotate(count=Count('id'), avg_ms=Avg('duration_ms'), max_ms=Max('duration_ms'))
+            .order_by('name', 'status')
+        )
+        self.stdout.write(f"{'task':<20} {'status':<10} {'count':>8} {'avg ms':>10} {'max ms':>10}")
+        for row in rows:
+            avg_ms = f"{row['avg_ms']:.0f}" if row['avg_ms'] is not None else '-'
+            max_ms = row['max_ms'] if row['max_ms'] is not None else '-'
+            self.stdout.write(f"{row['name']:<20} {row['status']:<10} {row['count']:>8} {avg_ms:>10} {max_ms:>10}")
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from audio_app.models import MyAudioFile
+from audio_app.verification import verify_pending_audio_files
+
+
+class Command(BaseCommand):
+    help = "Stream stored audio objects from S3 and check them against their claimed hashes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Number of files verified concurrently.')
+        parser.add_argument('--limit', type=int, help='Verify at most this many rows.')
+        parser.add_argument(
+            '--status', action='append', dest='statuses',
+            choices=[choice for choice, _ in MyAudioFile.VERIFICATION_CHOICES],
+            help='Verification statuses to (re)check; defaults to pending. May be repeated.',
+        )
+
+    def handle(self, *args, **options):
+        statuses = options['statuses'] or [MyAudioFile.VERIFICATION_PENDING]
+        results = verify_pending_audio_files(workers=options['workers'], limit=options['limit'], statuses=statuses)
+        for verification_status, count in sorted(results.items()):
+            self.stdout.write(f'{verification_status}: {count}')
+        self.stdout.write(self.style.SUCCESS(f'Verified {sum(results.values())} audio files'))
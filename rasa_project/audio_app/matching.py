@@ -0,0 +1,107 @@
+import numpy as np
+from django.conf import settings
+from django.db.models import Count
+
+from .fingerprint import HOP_SIZE, SAMPLE_RATE
+from .models import AudioFingerprint
+
+EMPTY = np.empty(0, dtype=np.int64)
+
+
+class DatabaseFingerprintIndex:
+    """
+    Inverted index from fingerprint hash to ``(file_id, offset)`` postings,
+    served by the indexed ``AudioFingerprint.hash`` column.
+    """
+    chunk_size = 500
+
+    def __init__(self, queryset=None):
+        self.queryset = AudioFingerprint.objects.all() if queryset is None else queryset
+
+    def postings(self, hashes, max_fanout):
+        """
+        Return ``(hashes, file_ids, offsets)`` arrays with every posting of the
+        given unique ``hashes``, leaving out hashes with more than
+        ``max_fanout`` postings; they are too common to tell files apart.
+        """
+        results = []
+        hashes = [int(h) for h in hashes]
+        for start in range(0, len(hashes), self.chunk_size):
+            chunk = hashes[start:start + self.chunk_size]
+            common = set(
+                self.queryset.filter(hash__in=chunk).values('hash')
+                .annotate(postings=Count('id')).filter(postings__gt=max_fanout)
+                .values_list('hash', flat=True)
+            )
+            if common:
+                chunk = [h for h in chunk if h not in common]
+            if chunk:
+                results.extend(
+                    self.queryset.filter(hash__in=chunk).values_list('hash', 'audio_file_id', 'offset')
+                )
+        if not results:
+            return EMPTY, EMPTY, EMPTY
+        postings = np.array(results, dtype=np.int64)
+        return postings[:, 0], postings[:, 1], postings[:, 2]
+
+
+def get_fingerprint_index():
+    """The memory-mapped index when one has been built, otherwise the database."""
+    from .fingerprint_index import get_memmap_index
+
+    return get_memmap_index() or DatabaseFingerprintIndex()
+
+
+def match_fingerprints(hashes, offsets, index=None, max_fanout=None, min_score=None, limit=5):
+    """
+    Identify the stored files a query clip's ``(hashes, offsets)`` came from.
+
+    Every posting is aligned with each query occurrence of its hash, and the
+    ``stored offset - query offset`` differences are histogrammed per file; a
+    true match piles its votes into one bin. Returns up to ``limit`` dicts with
+    ``file_id``, ``score`` (votes in the best bin) and ``offset`` (frames into
+    the stored file where the clip starts), best first.
+    """
+    index = index or get_fingerprint_index()
+    max_fanout = max_fanout or settings.AUDIO_MATCH_MAX_FANOUT
+    min_score = min_score or settings.AUDIO_MATCH_MIN_SCORE
+    if len(hashes) == 0:
+        return []
+
+    order = np.argsort(hashes, kind='stable')
+    query_hashes = np.asarray(hashes, dtype=np.int64)[order]
+    query_offsets = np.asarray(offsets, dtype=np.int64)[order]
+    posting_hashes, file_ids, stored_offsets = index.postings(np.unique(query_hashes), max_fanout)
+    if len(posting_hashes) == 0:
+        return []
+
+    # Join each posting with every query occurrence of its hash.
+    left = np.searchsorted(query_hashes, posting_hashes, side='left')
+    counts = np.searchsorted(query_hashes, posting_hashes, side='right') - left
+    total = counts.sum()
+    starts = np.repeat(np.cumsum(counts) - counts, counts)
+    query_index = np.repeat(left, counts) + (np.arange(total) - starts)
+    deltas = np.repeat(stored_offsets, counts) - query_offsets[query_index]
+    file_ids = np.repeat(file_ids, counts)
+
+    # Histogram (file, delta) pairs and keep each file's fullest bin.
+    shift = int(query_offsets.max())
+    width = int(deltas.max()) + shift + 1
+    bins, votes = np.unique(file_ids * width + (deltas + shift), return_counts=True)
+    bin_files = bins // width
+    best = np.lexsort((-votes, bin_files))
+    first_of_file = np.ones(len(best), dtype=bool)
+    first_of_file[1:] = bin_files[best][1:] != bin_files[best][:-1]
+    best = best[first_of_file]
+    best = best[votes[best] >= min_score]
+    best = best[np.argsort(-votes[best], kind='stable')][:limit]
+
+    return [
+        {
+            'file_id': int(bin_files[i]),
+            'score': int(votes[i]),
+            'offset': int(bins[i] % width - shift),
+            'offset_seconds': round(float((bins[i] % width - shift) * HOP_SIZE / SAMPLE_RATE), 3),
+        }
+        for i in best
+    ]
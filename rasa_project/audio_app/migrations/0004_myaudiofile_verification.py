@@ -0,0 +1,23 @@
+# Generated by Django 5.0.7 on 2026-10-18 15:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('audio_app', '0003_remove_myaudiofile_myaudio_url_myaudiofile_s3_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='myaudiofile',
+            name='verification_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('verified', 'Verified'), ('mismatch', 'Hash mismatch'), ('missing', 'Object missing'), ('error', 'Error')], db_index=True, default='pending', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='myaudiofile',
+            name='verified_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.7 on 2026-10-18 15:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('audio_app', '0004_myaudiofile_verification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='myaudiofile',
+            name='fingerprinted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='AudioFingerprint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hash', models.PositiveIntegerField(db_index=True)),
+                ('offset', models.PositiveIntegerField()),
+                ('audio_file', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fingerprints', to='audio_app.myaudiofile')),
+            ],
+        ),
+    ]
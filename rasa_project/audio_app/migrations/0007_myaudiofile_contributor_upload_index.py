@@ -0,0 +1,19 @@
+# Generated by Django 5.0.7 on 2026-10-18 15:29
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('audio_app', '0006_audiotask'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='myaudiofile',
+            index=models.Index(fields=['contributor', 'uploaded_at', 'id'], name='audio_contributor_upload_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.7 on 2026-10-18 15:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('audio_app', '0007_myaudiofile_contributor_upload_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='myaudiofile',
+            name='upload_status',
+            field=models.CharField(choices=[('pending', 'Reserved, upload pending'), ('complete', 'Uploaded')], default='complete', max_length=10),
+        ),
+    ]
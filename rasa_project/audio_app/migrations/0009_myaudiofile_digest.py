@@ -0,0 +1,30 @@
+# Generated by Django 5.0.7 on 2026-10-18 15:38
+
+import audio_app.fields
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('audio_app', '0008_myaudiofile_upload_status'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='myaudiofile',
+            name='digest',
+            field=audio_app.fields.DigestField(blank=True, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='myaudiofile',
+            name='hash_algorithm',
+            field=models.PositiveSmallIntegerField(blank=True, choices=[(1, 'sha1'), (2, 'sha256'), (3, 'blake2b-256')], editable=False, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='myaudiofile',
+            constraint=models.UniqueConstraint(fields=('digest', 'hash_algorithm'), name='audio_digest_algorithm_unique'),
+        ),
+    ]
@@ -1,19 +1,267 @@
-from django.db import models
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.db.models import Q
+from django.utils import timezone
 from auth_app.models import CustomUser
 
+from .fields import DigestField
+from .hashing import HASH_ALGORITHM_NAMES, parse_hex_digest
+
+
+class MyAudioFileManager(models.Manager):
+    def abandoned(self):
+        """
+        Reservations not completed within ``AUDIO_UPLOAD_RESERVATION_TTL``.
+        They no longer count as stored and may be replaced.
+        """
+        cutoff = timezone.now() - timedelta(seconds=settings.AUDIO_UPLOAD_RESERVATION_TTL)
+        return Q(upload_status=self.model.UPLOAD_PENDING, uploaded_at__lt=cutoff)
+
+    def release_abandoned(self, hashes):
+        """Delete abandoned reservations of ``hashes`` so they can be stored again."""
+        return self.filter(self.abandoned(), file_hash__in=list(hashes)).delete()[0]
+
+    def existing_hashes(self, hashes, chunk_size=500):
+        """
+        Return the subset of ``hashes`` already stored or reserved, using one
+        indexed ``IN`` lookup per ``chunk_size`` hashes. Abandoned
+        reservations are ignored.
+        """
+        hashes = list(dict.fromkeys(hashes))
+        rows = self.exclude(self.abandoned())
+        if settings.AUDIO_HASH_LOOKUP_BY_DIGEST:
+            return self._existing_digests(rows, hashes, chunk_size)
+        found = set()
+        for start in range(0, len(hashes), chunk_size):
+            chunk = hashes[start:start + chunk_size]
+            found.update(rows.filter(file_hash__in=chunk).values_list('file_hash', flat=True))
+        return found
+
+    async def ahash_exists(self, file_hash):
+        """Async ``file_hash in existing_hashes([file_hash])``, for async views."""
+        rows = self.exclude(self.abandoned())
+        if settings.AUDIO_HASH_LOOKUP_BY_DIGEST:
+            try:
+                digest, algorithm = parse_hex_digest(file_hash)
+            except ValueError:
+                pass
+            else:
+                return await rows.filter(digest=digest, hash_algorithm=algorithm).aexists()
+        return await rows.filter(file_hash=file_hash).aexists()
+
+    def _existing_digests(self, rows, hashes, chunk_size):
+        # Only valid once backfill_audio_digests has filled every row's digest.
+        by_digest, other = {}, []
+        for h in hashes:
+            try:
+                by_digest.setdefault(parse_hex_digest(h), []).append(h)
+            except ValueError:
+                other.append(h)
+        keys = list(by_digest)
+        found = set()
+        for start in range(0, len(keys), chunk_size):
+            chunk = keys[start:start + chunk_size]
+            for digest, algorithm in rows.filter(digest__in=[d for d, _ in chunk]).values_list('digest', 'hash_algorithm'):
+                found.update(by_digest.get((digest, algorithm), ()))
+        for start in range(0, len(other), chunk_size):
+            found.update(rows.filter(file_hash__in=other[start:start + chunk_size]).values_list('file_hash', flat=True))
+        return found
+
+    def store_many(self, contributor, records, batch_size=500):
+        """
+        Insert ``(file_hash, s3_key, file_name, algorithm)`` records for
+        ``contributor`` with one ``bulk_create``, skipping hashes that are
+        already stored. ``algorithm`` may be None to infer it from the hash.
+        Returns ``({file_hash: pk} of inserted rows, set of existing hashes)``.
+        Call inside a transaction. ``bulk_create`` sends no ``post_save``.
+        """
+        self.release_abandoned(record[0] for record in records)
+        existing = self.existing_hashes([record[0] for record in records])
+        new = [record for record in records if record[0] not in existing]
+        # ignore_conflicts also covers hashes stored concurrently since the lookup.
+        self.bulk_create(
+            [
+                self.model(contributor=contributor, file_hash=h, s3_key=key, file_name=name).with_digest(algorithm)
+                for h, key, name, algorithm in new
+            ],
+            batch_size=batch_size, ignore_conflicts=True,
+        )
+        new_hashes = [record[0] for record in new]
+        inserted = {}
+        for start in range(0, len(new_hashes), batch_size):
+            inserted.update(
+                self.filter(file_hash__in=new_hashes[start:start + batch_size], contributor=contributor)
+                .values_list('file_hash', 'pk')
+            )
+        existing.update(h for h in new_hashes if h not in inserted)
+        return inserted, existing
+
+    def reserve(self, contributor, file_hash, s3_key, file_name, ttl, algorithm=None):
+        """
+        Claim ``file_hash`` (a digest of ``algorithm``, inferred if None) for
+        an upload by ``contributor`` by inserting a pending row; the unique
+        constraint makes concurrent claims race-free.
+        The contributor's own pending row, or anyone's pending row older than
+        ``ttl`` seconds, is taken over instead. Returns the pending row, or
+        None if the hash is stored or being uploaded by someone else.
+        """
+        try:
+            with transaction.atomic():
+                audio_file = self.model(
+                    contributor=contributor, file_hash=file_hash, s3_key=s3_key, file_name=file_name,
+                    upload_status=self.model.UPLOAD_PENDING,
+                ).with_digest(algorithm)
+                audio_file.save(force_insert=True)
+                return audio_file
+        except IntegrityError:
+            pass
+        now = timezone.now()
+        claimable = Q(contributor=contributor) | Q(uploaded_at__lt=now - timedelta(seconds=ttl))
+        claimed = self.filter(claimable, file_hash=file_hash, upload_status=self.model.UPLOAD_PENDING).update(
+            contributor=contributor, s3_key=s3_key, file_name=file_name, uploaded_at=now,
+        )
+        return self.get(file_hash=file_hash) if claimed else None
 
 
 class MyAudioFile(models.Model):
     """
     Model to store the name of the audio file and its unique hash (not the actual file).
     """
+    VERIFICATION_PENDING = 'pending'
+    VERIFICATION_VERIFIED = 'verified'
+    VERIFICATION_MISMATCH = 'mismatch'
+    VERIFICATION_MISSING = 'missing'
+    VERIFICATION_ERROR = 'error'
+    VERIFICATION_CHOICES = [
+        (VERIFICATION_PENDING, 'Pending'),
+        (VERIFICATION_VERIFIED, 'Verified'),
+        (VERIFICATION_MISMATCH, 'Hash mismatch'),
+        (VERIFICATION_MISSING, 'Object missing'),
+        (VERIFICATION_ERROR, 'Error'),
+    ]
+    UPLOAD_PENDING = 'pending'
+    UPLOAD_COMPLETE = 'complete'
+    UPLOAD_STATUS_CHOICES = [
+        (UPLOAD_PENDING, 'Reserved, upload pending'),
+        (UPLOAD_COMPLETE, 'Uploaded'),
+    ]
+
     file_name = models.CharField(max_length=255,null=True,blank=True)
     file_hash = models.CharField(max_length=100, unique=True)
+    # Raw bytes of file_hash and the algorithm that produced them; filled on
+    # save and by backfill_audio_digests for older rows.
+    digest = DigestField(max_length=32, null=True, blank=True, editable=False)
+    hash_algorithm = models.PositiveSmallIntegerField(
+        choices=sorted(HASH_ALGORITHM_NAMES.items()), null=True, blank=True, editable=False
+    )
     s3_key = models.CharField(max_length=600, blank=True, null=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     contributor= models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    upload_status = models.CharField(max_length=10, choices=UPLOAD_STATUS_CHOICES, default=UPLOAD_COMPLETE)
+    verification_status = models.CharField(max_length=10, choices=VERIFICATION_CHOICES, default=VERIFICATION_PENDING, db_index=True)
+    verified_at = models.DateTimeField(null=True, blank=True)
+    fingerprinted_at = models.DateTimeField(null=True, blank=True)
+
+    objects = MyAudioFileManager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of a contributor's uploads, newest first (see ListMyUploads)
+            models.Index(fields=['contributor', 'uploaded_at', 'id'], name='audio_contributor_upload_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['digest', 'hash_algorithm'], name='audio_digest_algorithm_unique'),
+        ]
 
     def __str__(self):
         return f"{self.file_name} - {self.hash}"
 
+    def with_digest(self, algorithm=None):
+        """
+        Fill ``digest``/``hash_algorithm`` from ``file_hash`` if it is a hex
+        digest of ``algorithm``, a name from ``HASH_ALGORITHM_NAMES`` inferred
+        from the length if not given.
+        """
+        if self.digest is None and self.file_hash:
+            try:
+                self.digest, self.hash_algorithm = parse_hex_digest(self.file_hash, algorithm)
+            except ValueError:
+                pass
+        return self
+
+    def save(self, *args, **kwargs):
+        if kwargs.get('update_fields') is None:
+            self.with_digest()
+        super().save(*args, **kwargs)
+
+
+class AudioFingerprintManager(models.Manager):
+    def replace_for_file(self, audio_file, hashes, offsets, batch_size=5000):
+        """
+        Replace the stored fingerprints of ``audio_file`` with the given
+        ``hashes``/``offsets`` arrays using batched bulk inserts.
+        """
+        with transaction.atomic():
+            self.filter(audio_file=audio_file).delete()
+            self.bulk_create(
+                (self.model(audio_file_id=audio_file.pk, hash=int(h), offset=int(o)) for h, o in zip(hashes.tolist(), offsets.tolist())),
+                batch_size=batch_size,
+            )
+            MyAudioFile.objects.filter(pk=audio_file.pk).update(fingerprinted_at=timezone.now())
+        return len(hashes)
+
+
+class AudioFingerprint(models.Model):
+    """
+    One landmark hash of an audio file and the frame offset it occurs at
+    (see audio_app.fingerprint).
+    """
+    audio_file = models.ForeignKey(MyAudioFile, on_delete=models.CASCADE, related_name='fingerprints')
+    hash = models.PositiveIntegerField(db_index=True)
+    offset = models.PositiveIntegerField()
+
+    objects = AudioFingerprintManager()
+
+    def __str__(self):
+        return f"{self.audio_file_id} - {self.hash}@{self.offset}"
+
+
+class AudioTask(models.Model):
+    """
+    A unit of background work (see audio_app.tasks), claimed and run by the
+    ``run_audio_worker`` command outside the request cycle.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    duration_ms = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'run_after'])]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
 # Create your models here.
@@ -0,0 +1,198 @@
+import asyncio
+import datetime
+import hashlib
+import hmac
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from urllib.parse import quote, urlsplit
+
+from botocore.exceptions import ClientError, NoCredentialsError
+from django.conf import settings
+
+
+MiB = 1024 * 1024
+# S3 multipart limits: at most 10,000 parts of 5 MiB to 5 GiB, and objects up to 5 TiB.
+MULTIPART_MIN_PART_SIZE = 8 * MiB
+MULTIPART_MAX_PART_SIZE = 5 * 1024 * MiB
+MULTIPART_MAX_PARTS = 10000
+MULTIPART_MAX_OBJECT_SIZE = 5 * 1024 * 1024 * MiB
+
+
+def choose_part_size(file_size):
+    """
+    Return ``(part_size, part_count)`` for a multipart upload of ``file_size``
+    bytes: the smallest whole-MiB part size of at least 8 MiB that fits in
+    S3's 10,000-part limit.
+    """
+    if file_size <= 0 or file_size > MULTIPART_MAX_OBJECT_SIZE:
+        raise ValueError('file_size must be between 1 byte and 5 TiB')
+    part_size = max(MULTIPART_MIN_PART_SIZE, math.ceil(file_size / MULTIPART_MAX_PARTS))
+    part_size = min(math.ceil(part_size / MiB) * MiB, MULTIPART_MAX_PART_SIZE)
+    return part_size, math.ceil(file_size / part_size)
+
+
+def _sign(key, msg):
+    return hmac.new(key, msg.encode('utf-8'), hashlib.sha256).digest()
+
+
+def _uri_encode(value, safe='-_.~'):
+    return quote(str(value), safe=safe)
+
+
+class S3Presigner:
+    """
+    Presigns S3 requests with SigV4 query-string authentication.
+
+    One instance is shared per process. The day-scoped signing key is derived
+    once per UTC day and cached, so producing a URL only costs a SHA-256 of the
+    canonical request and one HMAC.
+    """
+    ALGORITHM = 'AWS4-HMAC-SHA256'
+    SERVICE = 's3'
+
+    def __init__(self, access_key, secret_key, region, bucket, endpoint_url=None):
+        if not access_key or not secret_key:
+            raise NoCredentialsError()
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.bucket = bucket
+        if endpoint_url:
+            # Custom endpoints (MinIO, moto, LocalStack) are addressed path-style.
+            parts = urlsplit(endpoint_url)
+            self.scheme, self.host = parts.scheme, parts.netloc
+            self.path_prefix = f"{parts.path.rstrip('/')}/{bucket}"
+        else:
+            self.scheme = 'https'
+            self.host = f'{bucket}.s3.amazonaws.com' if region == 'us-east-1' else f'{bucket}.s3.{region}.amazonaws.com'
+            self.path_prefix = ''
+        self._lock = threading.Lock()
+        self._signing_key = (None, None)
+
+    def signing_key(self, datestamp):
+        cached_date, cached_key = self._signing_key
+        if cached_date == datestamp:
+            return cached_key
+        with self._lock:
+            key = _sign(f'AWS4{self.secret_key}'.encode('utf-8'), datestamp)
+            key = _sign(key, self.region)
+            key = _sign(key, self.SERVICE)
+            key = _sign(key, 'aws4_request')
+            self._signing_key = (datestamp, key)
+        return key
+
+    def presign(self, method, key, expires=3600, content_type=None, params=None, now=None):
+        """
+        Return a presigned URL for ``method`` on ``key``. ``params`` are extra
+        query parameters such as ``uploadId`` and ``partNumber``. When
+        ``content_type`` is given the upload must send a matching header.
+        """
+        now = now or datetime.datetime.now(datetime.timezone.utc)
+        amz_date = now.strftime('%Y%m%dT%H%M%SZ')
+        datestamp = amz_date[:8]
+        scope = f'{datestamp}/{self.region}/{self.SERVICE}/aws4_request'
+
+        headers = {'host': self.host}
+        if content_type:
+            headers['content-type'] = content_type.strip()
+        signed_headers = ';'.join(sorted(headers))
+        canonical_headers = ''.join(f'{name}:{headers[name]}\n' for name in sorted(headers))
+
+        query = {str(name): str(value) for name, value in (params or {}).items()}
+        query.update({
+            'X-Amz-Algorithm': self.ALGORITHM,
+            'X-Amz-Credential': f'{self.access_key}/{scope}',
+            'X-Amz-Date': amz_date,
+            'X-Amz-Expires': str(int(expires)),
+            'X-Amz-SignedHeaders': signed_headers,
+        })
+        canonical_query = '&'.join(
+            f'{_uri_encode(name)}={_uri_encode(value)}' for name, value in sorted(query.items())
+        )
+        path = _uri_encode(f'{self.path_prefix}/{key}', safe='/~')
+
+        canonical_request = '\n'.join([
+            method, path, canonical_query, canonical_headers, signed_headers, 'UNSIGNED-PAYLOAD',
+        ])
+        string_to_sign = '\n'.join([
+            self.ALGORITHM, amz_date, scope, hashlib.sha256(canonical_request.encode('utf-8')).hexdigest(),
+        ])
+        signature = hmac.new(self.signing_key(datestamp), string_to_sign.encode('utf-8'), hashlib.sha256).hexdigest()
+        return f'{self.scheme}://{self.host}{path}?{canonical_query}&X-Amz-Signature={signature}'
+
+    def presign_put(self, key, content_type, expires=3600):
+        return self.presign('PUT', key, expires=expires, content_type=content_type)
+
+    def presign_upload_part(self, key, upload_id, part_number, expires=3600):
+        return self.presign('PUT', key, expires=expires, params={'partNumber': part_number, 'uploadId': upload_id})
+
+
+@lru_cache(maxsize=None)
+def get_s3_client():
+    """Process-wide boto3 S3 client; boto3 clients are thread-safe once created."""
+    import boto3
+    from botocore.config import Config
+
+    session = boto3.session.Session()
+    return session.client(
+        's3',
+        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+        region_name=settings.AWS_S3_REGION_NAME,
+        endpoint_url=settings.AWS_S3_ENDPOINT_URL,
+        # Enough connections for every S3 I/O thread of the async views.
+        config=Config(max_pool_connections=max(10, settings.AUDIO_S3_IO_THREADS)),
+    )
+
+
+@lru_cache(maxsize=None)
+def get_presigner():
+    return S3Presigner(
+        settings.AWS_ACCESS_KEY_ID,
+        settings.AWS_SECRET_ACCESS_KEY,
+        settings.AWS_S3_REGION_NAME,
+        settings.AWS_STORAGE_BUCKET_NAME,
+        endpoint_url=settings.AWS_S3_ENDPOINT_URL,
+    )
+
+
+def object_exists(key, client=None):
+    """HEAD ``key`` in the storage bucket; False if there is no such object."""
+    client = client or get_s3_client()
+    try:
+        client.head_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=key)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return False
+        raise
+    return True
+
+
+def existing_objects(keys, workers=8):
+    """Return the subset of ``keys`` present in the storage bucket, with concurrent HEAD requests."""
+    keys = list(dict.fromkeys(keys))
+    if not keys:
+        return set()
+    client = get_s3_client()
+    with ThreadPoolExecutor(max_workers=min(workers, len(keys))) as pool:
+        found = pool.map(lambda key: object_exists(key, client), keys)
+        return {key for key, exists in zip(keys, found) if exists}
+
+
+@lru_cache(maxsize=None)
+def get_s3_io_executor():
+    """Threads that run blocking S3 requests for async views."""
+    return ThreadPoolExecutor(max_workers=settings.AUDIO_S3_IO_THREADS, thread_name_prefix='s3-io')
+
+
+async def aexisting_objects(keys):
+    """``existing_objects`` for async views, with the HEAD requests on the shared S3 I/O threads."""
+    keys = list(dict.fromkeys(keys))
+    if not keys:
+        return set()
+    loop = asyncio.get_running_loop()
+    executor = get_s3_io_executor()
+    found = await asyncio.gather(*(loop.run_in_executor(executor, object_exists, key) for key in keys))
+    return {key for key, exists in zip(keys, found) if exists}
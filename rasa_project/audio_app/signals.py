@@ -0,0 +1,11 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .hash_filter import hash_filter
+from .models import MyAudioFile
+
+
+@receiver(post_save, sender=MyAudioFile)
+def add_hash_to_filter(sender, instance, created, **kwargs):
+    if created:
+        hash_filter.add(instance.file_hash)
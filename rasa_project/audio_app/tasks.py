@@ -0,0 +1,151 @@
+import logging
+import signal
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import AudioTask
+
+logger = logging.getLogger(__name__)
+
+# Task name -> dotted path of a function called with the task's payload as keyword arguments.
+TASKS = {
+    'verify_audio_hash': 'audio_app.verification.verify_audio_file',
+    'fingerprint_audio': 'audio_app.fingerprint.fingerprint_audio_file',
+}
+
+
+def enqueue(name, **payload):
+    if name not in TASKS:
+        raise ValueError(f'Unknown task {name!r}')
+    return AudioTask.objects.create(name=name, payload=payload, max_attempts=settings.AUDIO_TASK_MAX_ATTEMPTS)
+
+
+def enqueue_many(name, payloads):
+    if name not in TASKS:
+        raise ValueError(f'Unknown task {name!r}')
+    return AudioTask.objects.bulk_create(
+        AudioTask(name=name, payload=payload, max_attempts=settings.AUDIO_TASK_MAX_ATTEMPTS) for payload in payloads
+    )
+
+
+def _ready(now):
+    # Queued work that is due, plus running work whose worker stopped renewing
+    # its lock (see renew_locks).
+    return Q(status=AudioTask.QUEUED, run_after__lte=now) | Q(
+        status=AudioTask.RUNNING, locked_until__lt=now, attempts__lt=F('max_attempts')
+    )
+
+
+def claim_tasks(worker_id, limit):
+    """
+    Atomically claim up to ``limit`` runnable tasks for ``worker_id``.
+
+    Uses ``SELECT ... FOR UPDATE SKIP LOCKED`` where the database supports it,
+    so concurrent workers never block on or double-claim a row. Elsewhere
+    (SQLite) each row is claimed with a conditional ``UPDATE`` that only
+    succeeds if nobody changed it since it was read.
+    """
+    now = timezone.now()
+    claim = {
+        'status': AudioTask.RUNNING,
+        'locked_by': worker_id,
+        'locked_until': now + timedelta(seconds=settings.AUDIO_TASK_VISIBILITY_TIMEOUT),
+        'attempts': F('attempts') + 1,
+        'started_at': now,
+    }
+    _fail_abandoned(now)
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            pks = list(
+                AudioTask.objects.select_for_update(skip_locked=True).filter(_ready(now))
+                .order_by('run_after').values_list('pk', flat=True)[:limit]
+            )
+            AudioTask.objects.filter(pk__in=pks).update(**claim)
+    else:
+        pks = []
+        candidates = AudioTask.objects.filter(_ready(now)).order_by('run_after').values_list('pk', 'status', 'attempts')
+        for pk, task_status, attempts in candidates[:limit * 2]:
+            if AudioTask.objects.filter(pk=pk, status=task_status, attempts=attempts).update(**claim):
+                pks.append(pk)
+                if len(pks) == limit:
+                    break
+    return list(AudioTask.objects.filter(pk__in=pks).order_by('run_after'))
+
+
+def _fail_abandoned(now):
+    """Give up on running tasks whose lock expired after their last allowed attempt."""
+    AudioTask.objects.filter(
+        status=AudioTask.RUNNING, locked_until__lt=now, attempts__gte=F('max_attempts')
+    ).update(status=AudioTask.FAILED, finished_at=now, last_error='Visibility timeout expired on the final attempt')
+
+
+def renew_locks(worker_id, tasks):
+    """
+    Extend the locks of ``tasks`` that ``worker_id`` is still running by
+    ``AUDIO_TASK_VISIBILITY_TIMEOUT``, so they are not claimed again while
+    they run past it.
+    """
+    AudioTask.objects.filter(pk__in=[task.pk for task in tasks], status=AudioTask.RUNNING, locked_by=worker_id).update(
+        locked_until=timezone.now() + timedelta(seconds=settings.AUDIO_TASK_VISIBILITY_TIMEOUT)
+    )
+
+
+def complete_task(task, duration_ms):
+    AudioTask.objects.filter(pk=task.pk, locked_by=task.locked_by).update(
+        status=AudioTask.SUCCEEDED, finished_at=timezone.now(), duration_ms=duration_ms, locked_until=None
+    )
+
+
+def fail_task(task, error, duration_ms=None):
+    """Record a failed attempt and schedule a retry with exponential backoff, or give up."""
+    now = timezone.now()
+    update = {'last_error': error[-5000:], 'duration_ms': duration_ms, 'locked_until': None}
+    if task.attempts >= task.max_attempts:
+        update.update(status=AudioTask.FAILED, finished_at=now)
+    else:
+        backoff = settings.AUDIO_TASK_RETRY_BACKOFF * 2 ** (task.attempts - 1)
+        update.update(status=AudioTask.QUEUED, run_after=now + timedelta(seconds=backoff))
+    AudioTask.objects.filter(pk=task.pk, locked_by=task.locked_by).update(**update)
+
+
+def _raise_timeout(signum, frame):
+    raise TimeoutError('Task exceeded AUDIO_TASK_TIMEOUT')
+
+
+def run_task(name, payload, timeout=None):
+    """
+    Run a task function and return ``(result, duration_ms)``. ``timeout`` is
+    enforced with ``SIGALRM``, so it needs the main thread of the process:
+    a pool process, or the worker itself when it runs tasks inline.
+    """
+    from django.db import close_old_connections
+
+    func = import_string(TASKS[name])
+    if timeout:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.alarm(timeout)
+    start = time.perf_counter()
+    try:
+        return func(**payload), int((time.perf_counter() - start) * 1000)
+    finally:
+        if timeout:
+            signal.alarm(0)
+        close_old_connections()
+
+
+def execute_task(task, timeout=None):
+    """Run a claimed task in this process and record the outcome."""
+    try:
+        _, duration_ms = run_task(task.name, task.payload, timeout)
+    except Exception:
+        fail_task(task, traceback.format_exc())
+        return False
+    complete_task(task, duration_ms)
+    return True
@@ -1,3 +1,1192 @@
-from django.test import TestCase
+import datetime
+import io
+import os
+import shutil
+import tempfile
+import types
+import unittest
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
 
-# Create your tests here.
+import numpy as np
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import connections
+from django.db.backends.sqlite3.base import DatabaseWrapper as SQLiteDatabaseWrapper
+from django.db.utils import ConnectionHandler
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from django.urls import include, path, resolve, reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase, APIClient
+from django.contrib.auth import get_user_model
+
+from .hash_filter import BloomFilter, hash_filter
+from .hashing import HASH_BLAKE2B_256, HASH_SHA1, HASH_SHA256, hash_chunks, iter_s3_object, parse_hex_digest
+from .models import AudioFingerprint, AudioTask, MyAudioFile
+from .s3 import S3Presigner, choose_part_size, get_presigner, get_s3_client, MiB
+from .utils import build_content_key, choose_upload_key, content_key_for, is_content_key, is_staging_key
+from rasa_project.db.backends.base import PooledDatabaseWrapperMixin
+from rasa_project.db.middleware import ReplicaRoutingMiddleware
+from rasa_project.db.pool import ConnectionPool, PoolTimeout
+from rasa_project.db.routers import ReplicaRouter, begin_request, current_state, end_request, primary_pins, replica_lag, use_primary
+from rasa_project.startup import DEFERRED_MODULES, profile_startup
+
+try:
+    import requests
+    from moto import mock_aws
+except ImportError:
+    mock_aws = None
+
+User = get_user_model()
+
+
+class AudioHashBatchTests(APITestCase):
+
+    def setUp(self):
+        hash_filter.reset()
+        self.user = User.objects.create_user(username='testuser', email='testuser@example.com', password='password123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        MyAudioFile.objects.create(contributor=self.user, file_hash='AAA', s3_key='1/audio/a', file_name='a.mp3')
+        MyAudioFile.objects.create(contributor=self.user, file_hash='BBB', s3_key='1/audio/b', file_name='b.mp3')
+
+    def test_existing_hashes_chunks_lookups(self):
+        with self.assertNumQueries(2):
+            found = MyAudioFile.objects.existing_hashes(['AAA', 'CCC', 'BBB'], chunk_size=2)
+        self.assertEqual(found, {'AAA', 'BBB'})
+
+    def test_batch_check_returns_existence_map(self):
+        url = reverse('check_if_audio_hashes_exist')
+        response = self.client.post(url, {'hashes': ['AAA', 'CCC', 'BBB']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['exists'], {'AAA': True, 'CCC': False, 'BBB': True})
+
+    @override_settings(AUDIO_HASH_BATCH_LIMIT=2)
+    def test_batch_check_rejects_oversized_batch(self):
+        url = reverse('check_if_audio_hashes_exist')
+        response = self.client.post(url, {'hashes': ['AAA', 'BBB', 'CCC']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['success'], False)
+
+
+class AudioHashFilterTests(TestCase):
+
+    def setUp(self):
+        hash_filter.reset()
+        self.user = User.objects.create_user(username='testuser', email='testuser@example.com', password='password123')
+        MyAudioFile.objects.create(contributor=self.user, file_hash='AAA', s3_key='1/audio/a', file_name='a.mp3')
+
+    def test_bloom_filter_has_no_false_negatives_and_round_trips(self):
+        bloom = BloomFilter(1000, 0.01)
+        values = [f'{i:040X}' for i in range(1000)]
+        for value in values:
+            bloom.add(value)
+        self.assertTrue(all(value in bloom for value in values))
+        buffer = io.BytesIO()
+        bloom.dump(buffer, last_id=42)
+        buffer.seek(0)
+        loaded, last_id = BloomFilter.load(buffer)
+        self.assertEqual(last_id, 42)
+        self.assertTrue(all(value in loaded for value in values))
+
+    def test_definite_miss_skips_the_database(self):
+        self.assertTrue(hash_filter.hash_exists('AAA'))
+        with self.assertNumQueries(0):
+            self.assertFalse(hash_filter.hash_exists('NOT-STORED'))
+        self.assertEqual(hash_filter.stats()['definite_misses'], 1)
+
+    def test_rows_stored_by_other_processes_are_found_after_the_catch_up(self):
+        hash_filter.hash_exists('AAA')
+        # bulk_create sends no post_save, like a row inserted by another worker.
+        MyAudioFile.objects.bulk_create([MyAudioFile(contributor=self.user, file_hash='CCC', s3_key='1/audio/c', file_name='c.mp3')])
+        with override_settings(AUDIO_HASH_FILTER_REFRESH_SECONDS=0):
+            self.assertEqual(hash_filter.existing_hashes(['CCC', 'DDD']), {'CCC'})
+
+    def test_new_rows_are_added_by_signal(self):
+        hash_filter.hash_exists('AAA')
+        MyAudioFile.objects.create(contributor=self.user, file_hash='BBB', s3_key='1/audio/b', file_name='b.mp3')
+        self.assertTrue(hash_filter.hash_exists('BBB'))
+
+    def test_snapshot_is_loaded_lazily(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'filter.bin')
+            hash_filter.build()
+            hash_filter.save(path)
+            hash_filter.reset()
+            with override_settings(AUDIO_HASH_FILTER_PATH=path):
+                self.assertTrue(hash_filter.hash_exists('AAA'))
+            self.assertEqual(hash_filter.stats()['count'], 1)
+
+
+class S3PresignerTests(TestCase):
+
+    def test_signature_matches_botocore(self):
+        import boto3
+        from botocore.config import Config
+
+        client = boto3.client(
+            's3', aws_access_key_id='AKIDEXAMPLE', aws_secret_access_key='secret', region_name='eu-west-2',
+            endpoint_url='https://s3.eu-west-2.amazonaws.com',
+            config=Config(signature_version='s3v4', s3={'addressing_style': 'virtual'}),
+        )
+        key = '7/audio/my song.mp3_20240101000000/audio/mpeg'
+        expected = client.generate_presigned_url(
+            'put_object', Params={'Bucket': 'bucket', 'Key': key, 'ContentType': 'audio/mpeg'}, ExpiresIn=3600
+        )
+        expected_query = parse_qs(urlsplit(expected).query)
+        now = datetime.datetime.strptime(expected_query['X-Amz-Date'][0], '%Y%m%dT%H%M%SZ')
+
+        presigner = S3Presigner('AKIDEXAMPLE', 'secret', 'eu-west-2', 'bucket')
+        url = presigner.presign('PUT', key, expires=3600, content_type='audio/mpeg', now=now)
+        self.assertEqual(parse_qs(urlsplit(url).query), expected_query)
+        self.assertEqual(urlsplit(url).path, urlsplit(expected).path)
+
+    def test_signing_key_is_cached_per_day(self):
+        presigner = S3Presigner('AKIDEXAMPLE', 'secret', 'us-east-1', 'bucket')
+        self.assertIs(presigner.signing_key('20240101'), presigner.signing_key('20240101'))
+        self.assertNotEqual(presigner.signing_key('20240101'), presigner.signing_key('20240102'))
+
+
+class SignedUrlBatchTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', email='testuser@example.com', password='password123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_batch_returns_one_url_per_file(self):
+        url = reverse('signed_aws_urls')
+        files = [
+            {'file_name': 'a.mp3', 'content_type': 'audio/mpeg'},
+            {'file_name': 'b.wav', 'content_type': 'audio/wav'},
+        ]
+        response = self.client.post(url, {'files': files}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        uploads = response.data['uploads']
+        self.assertEqual([upload['file_name'] for upload in uploads], ['a.mp3', 'b.wav'])
+        for upload in uploads:
+            self.assertTrue(upload['s3_key'].startswith(f'{self.user.id}/audio/'))
+            self.assertIn('X-Amz-Signature=', upload['signed_url'])
+
+    def test_batch_rejects_items_without_string_names_and_types(self):
+        url = reverse('signed_aws_urls')
+        response = self.client.post(url, {'files': [{'file_name': 'a.mp3'}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(url, {'files': [{'file_name': ['a'], 'content_type': 'audio/mpeg'}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ContentAddressedKeyTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', email='testuser@example.com', password='password123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_key_is_sharded_by_digest(self):
+        sha1 = hash_chunks([b'audio'])
+        key = build_content_key(sha1)
+        self.assertEqual(key, f'{sha1[:2].lower()}/{sha1[2:4].lower()}/sha1/{sha1.lower()}')
+        self.assertTrue(is_content_key(key))
+        self.assertEqual(content_key_for(sha1.lower()), key)
+        staging_key = choose_upload_key(self.user.id, 'a.mp3', 'audio/mpeg', sha1)
+        self.assertTrue(is_staging_key(staging_key))
+        self.assertNotEqual(choose_upload_key(self.user.id, 'a.mp3', 'audio/mpeg', sha1), staging_key)
+        self.assertTrue(choose_upload_key(self.user.id, 'a.mp3', 'audio/mpeg', 'AAA').startswith(f'{self.user.id}/audio/'))
+        with override_settings(AUDIO_S3_KEY_LAYOUT='user'):
+            self.assertIsNone(content_key_for(sha1))
+            self.assertTrue(choose_upload_key(self.user.id, 'a.mp3', 'audio/mpeg', sha1).startswith(f'{self.user.id}/audio/'))
+
+    @unittest.skipUnless(mock_aws, 'moto is not installed')
+    def test_stored_content_needs_no_upload(self):
+        with mock_aws():
+            get_s3_client.cache_clear()
+            self.addCleanup(get_s3_client.cache_clear)
+            s3 = get_s3_client()
+            s3.create_bucket(Bucket=settings.AWS_STORAGE_BUCKET_NAME)
+            in_row, verified, unverified, new = (hash_chunks([body]) for body in (b'a', b'b', b'c', b'd'))
+            MyAudioFile.objects.create(contributor=self.user, file_hash=in_row, s3_key=f'{self.user.id}/audio/a.mp3_1/audio/mpeg')
+            # The same content, verified under the lower-case spelling of its hash.
+            MyAudioFile.objects.create(
+                contributor=self.user, file_hash=verified.lower(), s3_key=build_content_key(verified),
+                verification_status=MyAudioFile.VERIFICATION_VERIFIED,
+            )
+            s3.put_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=build_content_key(verified), Body=b'b')
+            # Written to the content key with no verified row behind it.
+            s3.put_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=build_content_key(unverified), Body=b'not c')
+
+            files = [{'file_name': f'{h}.mp3', 'content_type': 'audio/mpeg', 'hash': h} for h in (in_row, verified, unverified, new)]
+            response = self.client.post(reverse('signed_aws_urls'), {'files': files}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            row_upload, bucket_upload, unverified_upload, new_upload = response.data['uploads']
+            self.assertEqual((row_upload['exists'], row_upload['s3_key']), (True, f'{self.user.id}/audio/a.mp3_1/audio/mpeg'))
+            self.assertEqual((bucket_upload['exists'], bucket_upload['s3_key']), (True, build_content_key(verified)))
+            self.assertNotIn('signed_url', bucket_upload)
+            for upload in (unverified_upload, new_upload):
+                self.assertFalse(upload['exists'])
+                self.assertTrue(is_staging_key(upload['s3_key']))
+                self.assertEqual(upload['headers'], {'Content-Type': 'audio/mpeg'})
+                self.assertIn(upload['s3_key'], upload['signed_url'].replace('%2F', '/'))
+
+
+class MultipartUploadTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', email='testuser@example.com', password='password123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_part_size_respects_s3_limits(self):
+        self.assertEqual(choose_part_size(1), (8 * MiB, 1))
+        part_size, part_count = choose_part_size(200 * 1024 * MiB)
+        self.assertLessEqual(part_count, 10000)
+        self.assertEqual(part_size % MiB, 0)
+        with self.assertRaises(ValueError):
+            choose_part_size(6 * 1024 * 1024 * MiB)
+
+    @override_settings(AWS_ACCESS_KEY_ID='')
+    def test_part_urls_without_credentials(self):
+        get_presigner.cache_clear()
+        self.addCleanup(get_presigner.cache_clear)
+        response = self.client.post(reverse('multipart_upload_part_urls'), {
+            's3_key': f'{self.user.id}/audio/a.wav_1/audio/wav', 'upload_id': 'upload', 'part_numbers': [1],
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+        self.assertEqual(response.data, {'success': False, 'error': 'Could not generate signed URL'})
+
+    @unittest.skipUnless(mock_aws, 'moto is not installed')
+    def test_create_presign_and_complete(self):
+        with mock_aws():
+            get_s3_client.cache_clear()
+            self.addCleanup(get_s3_client.cache_clear)
+            s3 = get_s3_client()
+            s3.create_bucket(Bucket=settings.AWS_STORAGE_BUCKET_NAME)
+
+            response = self.client.post(reverse('multipart_upload_create'), {
+                'file_name': 'long.wav', 'content_type': 'audio/wav', 'file_size': 12 * MiB,
+            }, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['part_count'], 2)
+            s3_key, upload_id, part_size = response.data['s3_key'], response.data['upload_id'], response.data['part_size']
+
+            response = self.client.post(reverse('multipart_upload_part_urls'), {
+                's3_key': s3_key, 'upload_id': upload_id, 'part_numbers': [1, 2],
+            }, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            urls = response.data['urls']
+            self.assertIn('partNumber=2', urls[2])
+
+            response = self.client.post(reverse('multipart_upload_part_urls'), {
+                's3_key': s3_key, 'upload_id': upload_id, 'part_numbers': [True, 2.0],
+            }, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+            body = os.urandom(12 * MiB)
+            # Part 1 through its presigned URL, as a client would; part 2 with boto.
+            put = requests.put(urls[1], data=body[:part_size])
+            self.assertEqual(put.status_code, 200)
+            parts = [{'part_number': 1, 'etag': put.headers['ETag']}]
+            etag = s3.upload_part(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=s3_key, UploadId=upload_id,
+                                  PartNumber=2, Body=body[part_size:])['ETag']
+            parts.append({'part_number': 2, 'etag': etag})
+
+            response = self.client.post(reverse('multipart_upload_complete'), {
+                's3_key': s3_key, 'upload_id': upload_id, 'parts': parts,
+            }, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            stored = s3.get_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=s3_key)['Body'].read()
+            self.assertEqual(stored, body)
+
+    def test_other_users_keys_are_rejected(self):
+        response = self.client.post(reverse('multipart_upload_abort'), {
+            's3_key': f'{self.user.id + 1}/audio/x', 'upload_id': 'abc',
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@unittest.skipUnless(mock_aws, 'moto is not installed')
+class AudioVerificationTests(TestCase):
+
+    def setUp(self):
+        self.mock = mock_aws()
+        self.mock.start()
+        self.addCleanup(self.mock.stop)
+        get_s3_client.cache_clear()
+        self.addCleanup(get_s3_client.cache_clear)
+        self.s3 = get_s3_client()
+        self.s3.create_bucket(Bucket=settings.AWS_STORAGE_BUCKET_NAME)
+        self.user = User.objects.create_user(username='testuser', email='testuser@example.com', password='password123')
+        self.body = os.urandom(300 * 1024)
+        self.s3.put_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key='1/audio/a', Body=self.body)
+
+    def test_ranged_stream_preserves_order(self):
+        chunks = list(iter_s3_object(self.s3, settings.AWS_STORAGE_BUCKET_NAME, '1/audio/a', chunk_size=64 * 1024, workers=3))
+        self.assertEqual(len(chunks), 5)
+        self.assertEqual(b''.join(chunks), self.body)
+
+    def test_rows_are_marked_verified_mismatched_or_missing(self):
+        from .verification import verify_audio_file
+
+        good = MyAudioFile.objects.create(contributor=self.user, file_hash=hash_chunks([self.body]), s3_key='1/audio/a')
+        bad = MyAudioFile.objects.create(contributor=self.user, file_hash='0' * 40, s3_key='1/audio/a')
+        gone = MyAudioFile.objects.create(contributor=self.user, file_hash='1' * 40, s3_key='1/audio/missing')
+        self.assertEqual(verify_audio_file(good.pk), MyAudioFile.VERIFICATION_VERIFIED)
+        self.assertEqual(verify_audio_file(bad.pk), MyAudioFile.VERIFICATION_MISMATCH)
+        self.assertEqual(verify_audio_file(gone.pk), MyAudioFile.VERIFICATION_MISSING)
+        good.refresh_from_db()
+        self.assertIsNotNone(good.verified_at)
+        # Only staged uploads are discarded; rows at other keys are marked.
+        bad.refresh_from_db()
+        self.assertEqual(bad.verification_status, MyAudioFile.VERIFICATION_MISMATCH)
+        self.s3.head_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key='1/audio/a')
+
+    def test_staged_upload_moves_to_its_content_key_once_verified(self):
+        from .verification import verify_audio_file
+
+        file_hash = hash_chunks([self.body])
+        staging_key = choose_upload_key(self.user.id, 'a.mp3', 'audio/mpeg', file_hash)
+        self.s3.put_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=staging_key, Body=self.body)
+        audio_file = MyAudioFile.objects.create(contributor=self.user, file_hash=file_hash, s3_key=staging_key)
+        self.assertEqual(verify_audio_file(audio_file.pk), MyAudioFile.VERIFICATION_VERIFIED)
+        audio_file.refresh_from_db()
+        self.assertEqual(audio_file.s3_key, build_content_key(file_hash))
+        body = self.s3.get_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=audio_file.s3_key)['Body'].read()
+        self.assertEqual(body, self.body)
+        self.assertEqual(self.s3.list_objects_v2(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Prefix='staging/')['KeyCount'], 0)
+
+    def test_blake2b_upload_moves_to_its_blake2b_content_key(self):
+        from .verification import verify_audio_file
+
+        file_hash = hash_chunks([self.body], 'blake2b-256')
+        staging_key = choose_upload_key(self.user.id, 'a.mp3', 'audio/mpeg', file_hash, algorithm='blake2b-256')
+        self.s3.put_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=staging_key, Body=self.body)
+        audio_file = MyAudioFile(contributor=self.user, file_hash=file_hash, s3_key=staging_key).with_digest('blake2b-256')
+        audio_file.save()
+        self.assertEqual(verify_audio_file(audio_file.pk), MyAudioFile.VERIFICATION_VERIFIED)
+        audio_file.refresh_from_db()
+        self.assertEqual(audio_file.s3_key, build_content_key(file_hash, 'blake2b-256'))
+        self.assertIn('/blake2b-256/', audio_file.s3_key)
+
+    def test_mismatched_staged_upload_is_deleted_and_frees_the_hash(self):
+        from .verification import verify_audio_file
+
+        file_hash = hash_chunks([self.body])
+        staging_key = choose_upload_key(self.user.id, 'a.mp3', 'audio/mpeg', file_hash)
+        self.s3.put_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=staging_key, Body=b'something else')
+        audio_file = MyAudioFile.objects.create(contributor=self.user, file_hash=file_hash, s3_key=staging_key)
+        self.assertEqual(verify_audio_file(audio_file.pk), MyAudioFile.VERIFICATION_MISMATCH)
+        self.assertEqual(MyAudioFile.objects.existing_hashes([file_hash]), set())
+        self.assertEqual(self.s3.list_objects_v2(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Prefix='staging/')['KeyCount'], 0)
+        self.assertEqual(self.s3.list_objects_v2(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Prefix=build_content_key(file_hash))['KeyCount'], 0)
+
+
+def synthetic_audio(seconds, seed=0):
+    from .fingerprint import SAMPLE_RATE
+
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    freqs = rng.uniform(80, 4000, size=(int(seconds * 2) + 1, 3))[(t * 2).astype(int)]
+    return (np.sin(2 * np.pi * freqs * t[:, None]).sum(axis=1) * 4000).astype(np.float32)
+
+
+class AudioFingerprintTests(TestCase):
+
+    def test_excerpt_shares_hashes_at_a_constant_offset(self):
+        from .fingerprint import HOP_SIZE, fingerprint_samples
+
+        samples = synthetic_audio(20)
+        hashes, offsets = fingerprint_samples(samples)
+        excerpt_hashes, excerpt_offsets = fingerprint_samples(samples[100 * HOP_SIZE:])
+        self.assertEqual(hashes.dtype, np.uint32)
+
+        common, full_index, excerpt_index = np.intersect1d(hashes, excerpt_hashes, return_indices=True)
+        self.assertGreater(len(common), len(excerpt_hashes) // 4)
+        deltas = offsets[full_index].astype(np.int64) - excerpt_offsets[excerpt_index]
+        self.assertEqual(np.bincount(deltas[deltas >= 0]).argmax(), 100)
+
+    def test_streaming_fingerprint_matches_whole_file(self):
+        from .fingerprint import fingerprint_frames, fingerprint_samples
+
+        samples = synthetic_audio(15, seed=3)
+        expected = fingerprint_samples(samples)
+        for block in (777, 4096, 11025):
+            frames = (samples[start:start + block] for start in range(0, len(samples), block))
+            hashes, offsets = fingerprint_frames(frames)
+            np.testing.assert_array_equal(hashes, expected[0])
+            np.testing.assert_array_equal(offsets, expected[1])
+
+    @unittest.skipUnless(shutil.which('ffmpeg'), 'ffmpeg is not installed')
+    def test_ffmpeg_stream_is_decoded_in_fixed_frames(self):
+        import wave
+
+        from .decoding import AudioDecodeError, decode_pcm
+        from .fingerprint import SAMPLE_RATE, fingerprint_chunks, fingerprint_samples
+
+        samples = synthetic_audio(5).astype('<i2')
+        buffer = io.BytesIO()
+        with wave.open(buffer, 'wb') as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(SAMPLE_RATE)
+            wav.writeframes(samples.tobytes())
+        data = buffer.getvalue()
+        chunks = [data[i:i + 1000] for i in range(0, len(data), 1000)]
+
+        frames = list(decode_pcm(chunks, SAMPLE_RATE, frame_size=4000))
+        self.assertTrue(all(len(frame) == 4000 for frame in frames[:-1]))
+        np.testing.assert_array_equal(np.concatenate(frames), samples)
+        np.testing.assert_array_equal(fingerprint_chunks(chunks)[0], fingerprint_samples(samples)[0])
+        with self.assertRaises(AudioDecodeError):
+            list(decode_pcm([b'not audio' * 100], SAMPLE_RATE))
+
+    def test_fingerprints_are_replaced_in_bulk(self):
+        user = User.objects.create_user(username='testuser', email='testuser@example.com', password='password123')
+        audio_file = MyAudioFile.objects.create(contributor=user, file_hash='AAA', s3_key='1/audio/a')
+        hashes = np.array([5, 6, 7], dtype=np.uint32)
+        offsets = np.array([0, 1, 2], dtype=np.uint32)
+        AudioFingerprint.objects.replace_for_file(audio_file, hashes, offsets)
+        AudioFingerprint.objects.replace_for_file(audio_file, hashes[:2], offsets[:2])
+        self.assertEqual(audio_file.fingerprints.count(), 2)
+        audio_file.refresh_from_db()
+        self.assertIsNotNone(audio_file.fingerprinted_at)
+
+
+class FingerprintMatchingTests(TestCase):
+
+    def setUp(self):
+        from .fingerprint import fingerprint_samples
+
+        user = User.objects.create_user(username='testuser', email='testuser@example.com', password='password123')
+        self.samples = synthetic_audio(20, seed=1)
+        self.target = MyAudioFile.objects.create(contributor=user, file_hash='AAA', s3_key='1/audio/a')
+        other = MyAudioFile.objects.create(contributor=user, file_hash='BBB', s3_key='1/audio/b')
+        AudioFingerprint.objects.replace_for_file(self.target, *fingerprint_samples(self.samples))
+        AudioFingerprint.objects.replace_for_file(other, *fingerprint_samples(synthetic_audio(20, seed=2)))
+
+    def test_excerpt_matches_its_source_and_offset(self):
+        from .fingerprint import HOP_SIZE, fingerprint_samples
+        from .matching import match_fingerprints
+
+        matches = match_fingerprints(*fingerprint_samples(self.samples[200 * HOP_SIZE:400 * HOP_SIZE]))
+        self.assertEqual(matches[0]['file_id'], self.target.pk)
+        self.assertEqual(matches[0]['offset'], 200)
+
+    def test_common_hashes_are_skipped(self):
+        from .matching import DatabaseFingerprintIndex
+
+        common_hash = AudioFingerprint.objects.values_list('hash', flat=True).first()
+        AudioFingerprint.objects.bulk_create(
+            AudioFingerprint(audio_file=self.target, hash=common_hash, offset=i) for i in range(1000, 1010)
+        )
+        hashes, file_ids, offsets = DatabaseFingerprintIndex().postings([common_hash], max_fanout=5)
+        self.assertEqual(len(hashes), 0)
+
+
+class MemmapFingerprintIndexTests(TestCase):
+
+    def setUp(self):
+        from .fingerprint import fingerprint_samples
+        from .fingerprint_index import reset_memmap_index
+
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.addCleanup(reset_memmap_index)
+        self.user = User.objects.create_user(username='testuser', email='testuser@example.com', password='password123')
+        self.samples = [synthetic_audio(20, seed=seed) for seed in (1, 2)]
+        self.files = []
+        for seed, samples in enumerate(self.samples):
+            audio_file = MyAudioFile.objects.create(contributor=self.user, file_hash=f'{seed}' * 40, s3_key=f'1/audio/{seed}')
+            AudioFingerprint.objects.replace_for_file(audio_file, *fingerprint_samples(samples))
+            self.files.append(audio_file)
+
+    def test_segments_match_the_database_index(self):
+        from .fingerprint import HOP_SIZE, fingerprint_samples
+        from .fingerprint_index import build_base, build_delta, get_memmap_index, merge_segments, read_manifest
+        from .matching import match_fingerprints
+
+        build_base(self.directory)
+        late = MyAudioFile.objects.create(contributor=self.user, file_hash='9' * 40, s3_key='1/audio/9')
+        late_samples = synthetic_audio(20, seed=9)
+        AudioFingerprint.objects.replace_for_file(late, *fingerprint_samples(late_samples))
+
+        with override_settings(AUDIO_FINGERPRINT_INDEX_DIR=self.directory):
+            index = get_memmap_index()
+            query = fingerprint_samples(late_samples[50 * HOP_SIZE:250 * HOP_SIZE])
+            self.assertEqual(match_fingerprints(*query, index=index)[0]['file_id'], late.pk)
+
+            build_delta(self.directory)
+            self.assertEqual(len(read_manifest(self.directory)['deltas']), 1)
+            merged = merge_segments(self.directory)
+            self.assertEqual(merged.count, AudioFingerprint.objects.count())
+
+        self.assertPostingsMatchTheDatabase(self.samples[0])
+
+    def test_refingerprinted_files_are_counted_once(self):
+        from .fingerprint import HOP_SIZE, fingerprint_samples
+        from .fingerprint_index import build_base, build_delta, merge_segments
+        from .matching import DatabaseFingerprintIndex, match_fingerprints
+
+        build_base(self.directory)
+        source = self.files[0]
+        # Same audio, so the same hashes under new fingerprint ids.
+        AudioFingerprint.objects.replace_for_file(source, *fingerprint_samples(self.samples[0]))
+        query = fingerprint_samples(self.samples[0][50 * HOP_SIZE:250 * HOP_SIZE])
+        expected = match_fingerprints(*query, index=DatabaseFingerprintIndex())
+        self.assertEqual(expected[0]['file_id'], source.pk)
+
+        # The new fingerprints in the database tail, then in a delta segment.
+        for build in (None, build_delta):
+            if build:
+                build(self.directory)
+            index = self.assertPostingsMatchTheDatabase(self.samples[0])
+            self.assertEqual(match_fingerprints(*query, index=index), expected)
+
+        self.files[1].delete()
+        merged = merge_segments(self.directory)
+        self.assertEqual(merged.count, AudioFingerprint.objects.count())
+        self.assertPostingsMatchTheDatabase(self.samples[1])
+
+    def test_segments_are_streamed_and_merged_in_hash_order(self):
+        from .fingerprint_index import FingerprintSegment, _merge_chunks, iter_fingerprints, max_fingerprint_id
+
+        rows = sorted(AudioFingerprint.objects.values_list('hash', 'audio_file_id', 'offset'))
+        # Small batches split runs of equal hashes across pages and chunks.
+        chunks = list(iter_fingerprints(0, max_fingerprint_id(), batch_size=7))
+        self.assertGreater(len(chunks), 1)
+        segment = FingerprintSegment.write(os.path.join(self.directory, 'streamed.fpi'), chunks, max_fingerprint_id())
+        self.assertEqual(segment.count, len(rows))
+        self.assertTrue(np.all(np.diff(segment.hashes.astype(np.int64)) >= 0))
+        self.assertEqual(sorted(zip(*(a.tolist() for a in (segment.hashes, segment.file_ids, segment.offsets)))), rows)
+
+        self.files[1].delete()
+        merged = FingerprintSegment.in_memory(_merge_chunks([segment, segment], [], batch_size=5), segment.max_id)
+        self.assertTrue(np.all(np.diff(merged.hashes) >= 0))
+        live = sorted(AudioFingerprint.objects.values_list('hash', 'audio_file_id', 'offset'))
+        self.assertEqual(sorted(zip(*(a.tolist() for a in (merged.hashes, merged.file_ids, merged.offsets)))), sorted(live * 2))
+
+    def test_tail_is_read_once_per_reload(self):
+        from .fingerprint import fingerprint_samples
+        from .fingerprint_index import build_base
+
+        build_base(self.directory)
+        AudioFingerprint.objects.replace_for_file(self.files[0], *fingerprint_samples(self.samples[0]))
+        index = self.assertPostingsMatchTheDatabase(self.samples[0])
+        hashes = np.unique(fingerprint_samples(self.samples[0])[0])
+        with self.assertNumQueries(0):
+            index.postings(hashes, 1000)
+
+    def assertPostingsMatchTheDatabase(self, samples):
+        from .fingerprint import fingerprint_samples
+        from .fingerprint_index import MemmapFingerprintIndex, read_manifest
+        from .matching import DatabaseFingerprintIndex
+
+        hashes = np.unique(fingerprint_samples(samples)[0])
+        index = MemmapFingerprintIndex(self.directory, read_manifest(self.directory))
+        expected = DatabaseFingerprintIndex().postings(hashes, 1000)
+        actual = index.postings(hashes, 1000)
+        self.assertEqual(
+            sorted(zip(*(a.tolist() for a in actual))),
+            sorted(zip(*(e.tolist() for e in expected))),
+        )
+        return index
+
+
+class AudioTaskQueueTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', email='testuser@example.com', password='password123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_store_enqueues_background_work(self):
+        response = self.client.post(reverse('save_audio_hash'), {
+            'hash': 'A' * 40, 's3_key': f'{self.user.id}/audio/a', 'file_name': 'a.mp3',
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            sorted(AudioTask.objects.values_list('name', flat=True)), ['fingerprint_audio', 'verify_audio_hash']
+        )
+
+    def test_claimed_tasks_are_not_claimed_twice(self):
+        from .tasks import claim_tasks, enqueue
+
+        enqueue('verify_audio_hash', pk=1)
+        enqueue('verify_audio_hash', pk=2)
+        first = claim_tasks('worker-a', 1)
+        second = claim_tasks('worker-b', 5)
+        self.assertEqual(len(first), 1)
+        self.assertEqual(len(second), 1)
+        self.assertNotEqual(first[0].pk, second[0].pk)
+        self.assertEqual(claim_tasks('worker-c', 5), [])
+
+    def test_failures_are_retried_then_given_up(self):
+        from .tasks import claim_tasks, enqueue, execute_task
+
+        task = enqueue('verify_audio_hash', pk=12345)
+        for attempt in range(task.max_attempts):
+            AudioTask.objects.filter(pk=task.pk).update(run_after=timezone.now())
+            [claimed] = claim_tasks('worker', 1)
+            self.assertFalse(execute_task(claimed))
+        task.refresh_from_db()
+        self.assertEqual(task.status, AudioTask.FAILED)
+        self.assertIn('DoesNotExist', task.last_error)
+
+    def test_expired_locks_are_reclaimed(self):
+        from .tasks import claim_tasks, enqueue
+
+        enqueue('verify_audio_hash', pk=1)
+        [claimed] = claim_tasks('worker-a', 1)
+        AudioTask.objects.filter(pk=claimed.pk).update(locked_until=timezone.now() - datetime.timedelta(seconds=1))
+        [reclaimed] = claim_tasks('worker-b', 1)
+        self.assertEqual(reclaimed.pk, claimed.pk)
+        self.assertEqual(reclaimed.attempts, 2)
+
+    def test_renewed_locks_are_not_reclaimed(self):
+        from .tasks import claim_tasks, enqueue, renew_locks
+
+        enqueue('verify_audio_hash', pk=1)
+        [claimed] = claim_tasks('worker-a', 1)
+        AudioTask.objects.filter(pk=claimed.pk).update(locked_until=timezone.now() - datetime.timedelta(seconds=1))
+        renew_locks('worker-b', [claimed])
+        renew_locks('worker-a', [claimed])
+        self.assertEqual(claim_tasks('worker-b', 1), [])
+
+    @override_settings(AUDIO_TASK_TIMEOUT=1200, AUDIO_TASK_VISIBILITY_TIMEOUT=1200)
+    def test_inline_worker_needs_a_timeout_within_the_lock(self):
+        with self.assertRaises(CommandError):
+            call_command('run_audio_worker', processes=0, once=True)
+
+
+class MyUploadsListingTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', email='testuser@example.com', password='password123')
+        other = User.objects.create_user(username='other', email='other@example.com', password='password123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        MyAudioFile.objects.create(contributor=other, file_hash='OTHER', s3_key='2/audio/x')
+        for i in range(5):
+            MyAudioFile.objects.create(contributor=self.user, file_hash=f'HASH{i}', file_name=f'{i}.mp3')
+        # Ties on uploaded_at must still page without gaps or repeats.
+        tied = timezone.now().replace(microsecond=0)
+        MyAudioFile.objects.filter(file_hash__in=['HASH1', 'HASH2', 'HASH3']).update(uploaded_at=tied)
+
+    def test_pages_cover_every_upload_once_newest_first(self):
+        url = reverse('my_uploads')
+        seen, cursor = [], None
+        while True:
+            response = self.client.get(url, {'limit': 2, **({'cursor': cursor} if cursor else {})})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['results']), 2)
+            seen.extend(response.data['results'])
+            cursor = response.data['next_cursor']
+            if cursor is None:
+                break
+
+        expected = list(
+            MyAudioFile.objects.filter(contributor=self.user).order_by('-uploaded_at', '-id').values_list('file_hash', flat=True)
+        )
+        self.assertEqual([row['file_hash'] for row in seen], expected)
+        self.assertEqual(set(seen[0]), {'id', 'file_name', 'file_hash', 's3_key', 'uploaded_at', 'upload_status', 'verification_status'})
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(reverse('my_uploads'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(response.data['success'])
+
+
+class AudioHashBatchStoreTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', email='testuser@example.com', password='password123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        MyAudioFile.objects.create(contributor=self.user, file_hash='B' * 40, s3_key='1/audio/b')
+
+    def test_batch_reports_inserted_and_existing_hashes(self):
+        files = [
+            {'hash': h * 40, 's3_key': f'{self.user.id}/audio/{h}', 'file_name': f'{h}.mp3'}
+            for h in ('A', 'B', 'C')
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('save_audio_hashes'), {'files': files}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['inserted'], ['A' * 40, 'C' * 40])
+        self.assertEqual(response.data['existing'], ['B' * 40])
+        self.assertEqual(MyAudioFile.objects.filter(contributor=self.user).count(), 3)
+        self.assertEqual(AudioTask.objects.filter(name='verify_audio_hash').count(), 2)
+        self.assertEqual(AudioTask.objects.filter(name='fingerprint_audio').count(), 2)
+
+    def test_batch_rejects_incomplete_or_duplicate_records(self):
+        url = reverse('save_audio_hashes')
+        incomplete = [{'hash': 'A' * 40, 's3_key': 'k'}]
+        duplicate = [{'hash': 'A' * 40, 's3_key': 'k', 'file_name': 'a.mp3'}] * 2
+        for files in (incomplete, duplicate, []):
+            response = self.client.post(url, {'files': files}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(AudioTask.objects.exists())
+
+    def test_algorithm_is_recorded_and_validated(self):
+        files = [{'hash': 'C' * 64, 's3_key': f'{self.user.id}/audio/c', 'file_name': 'c.mp3', 'algorithm': 'blake2b-256'}]
+        response = self.client.post(reverse('save_audio_hashes'), {'files': files}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(MyAudioFile.objects.get(file_hash='C' * 64).hash_algorithm, HASH_BLAKE2B_256)
+
+        response = self.client.post(reverse('save_audio_hash'), {
+            'hash': 'D' * 64, 's3_key': f'{self.user.id}/audio/d', 'file_name': 'd.mp3', 'algorithm': 'blake2b-256',
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(MyAudioFile.objects.get(file_hash='D' * 64).hash_algorithm, HASH_BLAKE2B_256)
+
+        for algorithm in ('md5', 'sha256'):
+            response = self.client.post(reverse('save_audio_hash'), {
+                'hash': 'E' * 40, 's3_key': f'{self.user.id}/audio/e', 'file_name': 'e.mp3', 'algorithm': algorithm,
+            }, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_store_rejects_keys_outside_the_callers_prefixes(self):
+        other = User.objects.create_user(username='other', email='other@example.com', password='password123')
+        for s3_key in (f'{other.id}/audio/c', f'staging/{other.id}/{"0" * 32}', 'ab/cd/sha1/' + 'c' * 40):
+            response = self.client.post(reverse('save_audio_hash'), {
+                'hash': 'C' * 40, 's3_key': s3_key, 'file_name': 'c.mp3',
+            }, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            files = [{'hash': 'C' * 40, 's3_key': s3_key, 'file_name': 'c.mp3'}]
+            response = self.client.post(reverse('save_audio_hashes'), {'files': files}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(MyAudioFile.objects.filter(file_hash='C' * 40).exists())
+
+        response = self.client.post(reverse('save_audio_hash'), {
+            'hash': 'C' * 40, 's3_key': f'staging/{self.user.id}/{"0" * 32}', 'file_name': 'c.mp3',
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_single_store_reports_duplicate_hash(self):
+        response = self.client.post(reverse('save_audio_hash'), {
+            'hash': 'B' * 40, 's3_key': f'{self.user.id}/audio/b', 'file_name': 'b.mp3',
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+
+@unittest.skipUnless(mock_aws, 'moto is not installed')
+class ReserveAudioUploadTests(APITestCase):
+
+    def setUp(self):
+        self.mock = mock_aws()
+        self.mock.start()
+        self.addCleanup(self.mock.stop)
+        get_s3_client.cache_clear()
+        self.addCleanup(get_s3_client.cache_clear)
+        self.s3 = get_s3_client()
+        self.s3.create_bucket(Bucket=settings.AWS_STORAGE_BUCKET_NAME)
+        self.user = User.objects.create_user(username='testuser', email='testuser@example.com', password='password123')
+        self.other = User.objects.create_user(username='other', email='other@example.com', password='password123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.body = {'hash': 'A' * 40, 'file_name': 'a.mp3', 'content_type': 'audio/mpeg'}
+
+    def test_reserve_then_complete(self):
+        response = self.client.post(reverse('upload_reserve'), self.body, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(response.data['duplicate'])
+        self.assertIn(response.data['s3_key'], response.data['signed_url'].replace('%2F', '/'))
+        audio_file = MyAudioFile.objects.get(file_hash='A' * 40)
+        self.assertEqual(audio_file.upload_status, MyAudioFile.UPLOAD_PENDING)
+        self.assertFalse(AudioTask.objects.exists())
+
+        other_client = APIClient()
+        other_client.force_authenticate(user=self.other)
+        response = other_client.post(reverse('upload_reserve'), self.body, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertTrue(response.data['duplicate'])
+        self.assertEqual(other_client.post(reverse('upload_complete'), {'hash': 'A' * 40}, format='json').status_code, status.HTTP_404_NOT_FOUND)
+
+        response = self.client.post(reverse('upload_complete'), {'hash': 'A' * 40}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        audio_file.refresh_from_db()
+        self.assertEqual(audio_file.upload_status, MyAudioFile.UPLOAD_PENDING)
+        self.assertFalse(AudioTask.objects.exists())
+
+        self.s3.put_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=audio_file.s3_key, Body=b'a')
+        response = self.client.post(reverse('upload_complete'), {'hash': 'A' * 40}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        audio_file.refresh_from_db()
+        self.assertEqual(audio_file.upload_status, MyAudioFile.UPLOAD_COMPLETE)
+        self.assertEqual(sorted(AudioTask.objects.values_list('name', flat=True)), ['fingerprint_audio', 'verify_audio_hash'])
+        self.assertEqual(self.client.post(reverse('upload_reserve'), self.body, format='json').status_code, status.HTTP_409_CONFLICT)
+
+    def test_abandoned_reservation_can_be_taken_over(self):
+        self.client.post(reverse('upload_reserve'), self.body, format='json')
+        MyAudioFile.objects.update(uploaded_at=timezone.now() - datetime.timedelta(seconds=settings.AUDIO_UPLOAD_RESERVATION_TTL + 1))
+        other_client = APIClient()
+        other_client.force_authenticate(user=self.other)
+        response = other_client.post(reverse('upload_reserve'), self.body, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(MyAudioFile.objects.get(file_hash='A' * 40).contributor, self.other)
+
+    def test_abandoned_reservation_no_longer_blocks_the_hash(self):
+        self.client.post(reverse('upload_reserve'), self.body, format='json')
+        self.assertTrue(self.client.post(reverse('check_if_audio_hash_exist'), {'hash': 'A' * 40}, format='json').data['exists'])
+        MyAudioFile.objects.update(uploaded_at=timezone.now() - datetime.timedelta(seconds=settings.AUDIO_UPLOAD_RESERVATION_TTL + 1))
+        self.assertEqual(MyAudioFile.objects.existing_hashes(['A' * 40]), set())
+        self.assertFalse(self.client.post(reverse('check_if_audio_hash_exist'), {'hash': 'A' * 40}, format='json').data['exists'])
+
+        other_client = APIClient()
+        other_client.force_authenticate(user=self.other)
+        response = other_client.post(reverse('save_audio_hash'), {'hash': 'A' * 40, 's3_key': '2/audio/a', 'file_name': 'a.mp3'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        audio_file = MyAudioFile.objects.get(file_hash='A' * 40)
+        self.assertEqual((audio_file.contributor, audio_file.upload_status), (self.other, MyAudioFile.UPLOAD_COMPLETE))
+
+    def test_reserve_records_the_algorithm(self):
+        body = {**self.body, 'hash': 'A' * 64, 'algorithm': 'blake2b-256'}
+        response = self.client.post(reverse('upload_reserve'), body, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(is_staging_key(response.data['s3_key']))
+        self.assertEqual(MyAudioFile.objects.get(file_hash='A' * 64).hash_algorithm, HASH_BLAKE2B_256)
+
+    def test_unverified_object_at_the_content_key_is_ignored(self):
+        self.s3.put_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=build_content_key('A' * 40), Body=b'not a')
+        response = self.client.post(reverse('upload_reserve'), self.body, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(response.data['upload_required'])
+        self.assertTrue(is_staging_key(response.data['s3_key']))
+        self.assertEqual(MyAudioFile.objects.get(file_hash='A' * 40).upload_status, MyAudioFile.UPLOAD_PENDING)
+
+
+class AudioDigestTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', email='testuser@example.com', password='password123')
+
+    def test_digest_is_written_alongside_the_hex_hash(self):
+        sha1 = hash_chunks([b'audio'])
+        audio_file = MyAudioFile.objects.create(contributor=self.user, file_hash=sha1, s3_key='1/audio/a')
+        MyAudioFile.objects.store_many(self.user, [(hash_chunks([b'other'], 'sha256'), '1/audio/b', 'b.mp3', None)])
+        audio_file.refresh_from_db()
+        self.assertEqual(audio_file.digest, bytes.fromhex(sha1))
+        self.assertEqual(audio_file.hash_algorithm, HASH_SHA1)
+        self.assertEqual(MyAudioFile.objects.get(s3_key='1/audio/b').hash_algorithm, HASH_SHA256)
+        self.assertEqual(MyAudioFile.objects.get(digest=sha1.lower()).pk, audio_file.pk)
+        self.assertEqual(parse_hex_digest('A' * 64, 'blake2b-256'), (b'\xaa' * 32, HASH_BLAKE2B_256))
+        with self.assertRaises(ValueError):
+            parse_hex_digest('A' * 40, 'sha256')
+
+    def test_backfill_then_lookup_by_digest(self):
+        sha1 = hash_chunks([b'audio'])
+        MyAudioFile.objects.bulk_create([
+            MyAudioFile(contributor=self.user, file_hash=sha1, s3_key='1/audio/a'),
+            MyAudioFile(contributor=self.user, file_hash=sha1.lower(), s3_key='1/audio/b'),
+            MyAudioFile(contributor=self.user, file_hash='AAA', s3_key='1/audio/c'),
+        ])
+        out = io.StringIO()
+        call_command('backfill_audio_digests', batch_size=2, stdout=out, stderr=io.StringIO())
+        self.assertIn('Done: 1 updated, 1 unparseable, 1 conflicts', out.getvalue())
+        self.assertEqual(MyAudioFile.objects.filter(digest__isnull=False).count(), 1)
+
+        with override_settings(AUDIO_HASH_LOOKUP_BY_DIGEST=True):
+            found = MyAudioFile.objects.existing_hashes([sha1, 'AAA', 'B' * 40, 'not hex'])
+        self.assertEqual(found, {sha1, 'AAA'})
+
+    def test_filter_and_digest_lookup_ignore_case(self):
+        sha1 = hash_chunks([b'audio'])
+        MyAudioFile.objects.create(contributor=self.user, file_hash=sha1.lower(), s3_key='1/audio/a')
+        hash_filter.reset()
+        with override_settings(AUDIO_HASH_LOOKUP_BY_DIGEST=True):
+            self.assertEqual(hash_filter.existing_hashes([sha1, 'B' * 40]), {sha1})
+        self.assertEqual(hash_filter.stats()['possible_hits'], 1)
+
+    def test_invalid_hex_is_a_validation_error(self):
+        with self.assertRaises(ValidationError):
+            MyAudioFile.objects.filter(digest='not hex').exists()
+
+
+
+class OpenAPISchemaTests(TestCase):
+
+    def setUp(self):
+        schema_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, schema_dir)
+        settings_override = override_settings(OPENAPI_SCHEMA_DIR=schema_dir, OPENAPI_SCHEMA_LIVE=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_built_schema_is_served_with_an_etag(self):
+        call_command('build_openapi_schema', stdout=io.StringIO())
+        response = self.client.get(reverse('schema-swagger-ui'), {'format': 'openapi'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('/audio/upload/reserve/', response.json()['paths'])
+        etag = response['ETag']
+        response = self.client.get(reverse('schema-swagger-ui'), {'format': 'openapi'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(self.client.get(reverse('schema-json'))['ETag'], etag)
+        self.assertEqual(self.client.get(reverse('schema-yaml'))['Content-Type'], 'application/yaml')
+        self.assertEqual(self.client.get(reverse('schema-redoc')).status_code, status.HTTP_200_OK)
+
+
+class StartupImportTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.profile = profile_startup()
+
+    def test_heavy_dependencies_load_on_first_use(self):
+        for phase, modules in DEFERRED_MODULES.items():
+            loaded = {record.module for record in self.profile[phase]}
+            self.assertEqual([module for module in modules if module in loaded], [], phase)
+
+    def test_check_fails_when_over_the_import_budget(self):
+        command = 'audio_app.management.commands.profile_startup'
+        with mock.patch(f'{command}.profile_startup', return_value=self.profile), \
+                mock.patch.dict(f'{command}.IMPORT_BUDGET_MS', {'setup': 0, 'urls': 0}):
+            with self.assertRaises(CommandError):
+                call_command('profile_startup', '--check', stdout=io.StringIO())
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class PooledSQLiteDatabaseWrapper(PooledDatabaseWrapperMixin, SQLiteDatabaseWrapper):
+    pass
+
+
+class ConnectionPoolTests(SimpleTestCase):
+
+    def ok(self, connection):
+        pass
+
+    def test_connections_are_reused_most_recent_first(self):
+        pool = ConnectionPool(max_size=2)
+        first, reused = pool.acquire(FakeConnection, self.ok)
+        second, _ = pool.acquire(FakeConnection, self.ok)
+        self.assertFalse(reused)
+        pool.release(first)
+        pool.release(second)
+        self.assertEqual(pool.acquire(FakeConnection, self.ok), (second, True))
+        stats = pool.stats()
+        self.assertEqual((stats['created'], stats['reused'], stats['in_use'], stats['idle']), (2, 1, 1, 1))
+
+    def test_checkout_waits_for_a_free_connection_then_times_out(self):
+        pool = ConnectionPool(max_size=1, timeout=0.05)
+        connection, _ = pool.acquire(FakeConnection, self.ok)
+        with self.assertRaises(PoolTimeout):
+            pool.acquire(FakeConnection, self.ok)
+        pool.release(connection, discard=True)
+        self.assertTrue(connection.closed)
+        self.assertFalse(pool.acquire(FakeConnection, self.ok)[1])
+        stats = pool.stats()
+        self.assertEqual((stats['waits'], stats['timeouts'], stats['discarded'], stats['size']), (1, 1, 1, 1))
+
+    def test_idle_and_old_connections_are_closed(self):
+        pool = ConnectionPool(max_size=2, max_idle=0)
+        connection, _ = pool.acquire(FakeConnection, self.ok)
+        pool.release(connection)
+        self.assertFalse(pool.acquire(FakeConnection, self.ok)[1])
+        self.assertTrue(connection.closed)
+
+        pool = ConnectionPool(max_size=2, max_lifetime=0)
+        connection, _ = pool.acquire(FakeConnection, self.ok)
+        pool.release(connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.stats()['closed_lifetime'], 1)
+
+    def test_connection_failing_its_health_check_is_replaced(self):
+        pool = ConnectionPool(max_size=1, ping_after=0)
+        connection, _ = pool.acquire(FakeConnection, self.ok)
+        pool.release(connection)
+
+        def check(connection):
+            raise OSError('server has gone away')
+
+        replacement, reused = pool.acquire(FakeConnection, check)
+        self.assertIsNot(replacement, connection)
+        self.assertFalse(reused)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.stats()['failed_checks'], 1)
+
+    def test_backend_returns_connections_to_the_pool(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            settings_dict = ConnectionHandler({'default': {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': os.path.join(tmp_dir, 'pooled.sqlite3'),
+                'POOL': {'max_size': 1},
+            }}).settings['default']
+            wrapper = PooledSQLiteDatabaseWrapper(settings_dict, 'pooled')
+            try:
+                wrapper.ensure_connection()
+                raw = wrapper.connection
+                wrapper.close()
+                self.assertEqual(wrapper.pool.stats()['idle'], 1)
+                with wrapper.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                self.assertIs(wrapper.connection, raw)
+                self.assertTrue(wrapper.pool_reused)
+
+                # Closed mid-transaction: not handed to the next user.
+                wrapper.set_autocommit(False)
+                wrapper.close()
+                wrapper.ensure_connection()
+                self.assertIsNot(wrapper.connection, raw)
+                self.assertEqual(wrapper.pool.stats()['discarded'], 1)
+            finally:
+                wrapper.close()
+                wrapper.pool.close_all()
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1', 'replica_2'], DATABASE_REPLICA_SELECTION='round_robin')
+class ReplicaRouterTests(SimpleTestCase):
+
+    def setUp(self):
+        primary_pins.clear()
+        replica_lag.reset()
+        self.router = ReplicaRouter()
+        self.user = User(pk=7, username='reader', email='reader@example.com')
+
+    def handle(self, method, url, user=None, write=False):
+        """Run a request through the middleware; returns where its reads went."""
+        request = getattr(RequestFactory(), method)(url)
+        reads = []
+
+        def view(request):
+            request.resolver_match = resolve(url)
+            if user is not None:
+                request.user = user
+            reads.extend(self.router.db_for_read(MyAudioFile) for _ in range(2))
+            if write:
+                self.assertEqual(self.router.db_for_write(MyAudioFile), 'default')
+                reads.append(self.router.db_for_read(MyAudioFile))
+            return None
+
+        middleware = ReplicaRoutingMiddleware(view)
+        middleware(request)
+        return reads
+
+    def test_safe_and_marked_requests_read_from_replicas(self):
+        first, second = self.handle('get', reverse('my_uploads')), self.handle('get', reverse('my_uploads'))
+        # Each request stays on one replica; requests take turns.
+        self.assertEqual((len(set(first)), len(set(second))), (1, 1))
+        self.assertEqual(sorted(first[:1] + second[:1]), ['replica_1', 'replica_2'])
+        self.assertEqual(len(set(self.handle('post', reverse('check_if_audio_hash_exist')))), 1)
+        self.assertNotIn('default', self.handle('post', reverse('check_if_audio_hash_exist')))
+        self.assertEqual(self.handle('post', reverse('save_audio_hash')), ['default', 'default'])
+        self.assertEqual(self.handle('get', reverse('email-verify')), ['default', 'default'])
+        self.assertEqual(self.router.db_for_read(MyAudioFile), 'default')
+
+    def test_reads_follow_the_users_writes_to_the_primary(self):
+        reads = self.handle('get', reverse('my_uploads'), user=self.user, write=True)
+        self.assertEqual(reads[-1], 'default')
+        self.assertEqual(self.handle('get', reverse('my_uploads'), user=self.user), ['default', 'default'])
+        other = User(pk=8, username='other', email='other@example.com')
+        self.assertNotIn('default', self.handle('get', reverse('my_uploads'), user=other))
+        with override_settings(DATABASE_REPLICA_PIN_SECONDS=0):
+            self.handle('get', reverse('my_uploads'), user=self.user, write=True)
+        self.assertNotIn('default', self.handle('get', reverse('my_uploads'), user=self.user))
+
+    def test_use_primary_and_atomic_blocks_read_from_the_primary(self):
+        token = begin_request(RequestFactory().get('/'))
+        try:
+            current_state().use_replicas = True
+            self.assertNotEqual(self.router.db_for_read(MyAudioFile), 'default')
+            with use_primary():
+                self.assertEqual(self.router.db_for_read(MyAudioFile), 'default')
+            with mock.patch.object(connections['default'], 'in_atomic_block', True):
+                self.assertEqual(self.router.db_for_read(MyAudioFile), 'default')
+        finally:
+            end_request(token)
+
+    @override_settings(DATABASE_REPLICA_SELECTION='least_lag', DATABASE_REPLICA_MAX_LAG=10)
+    def test_least_lag_prefers_the_freshest_replica(self):
+        with mock.patch.object(replica_lag, 'measure', side_effect=lambda alias: {'replica_1': 4, 'replica_2': 1}[alias]):
+            self.assertEqual(self.handle('get', reverse('my_uploads')), ['replica_2', 'replica_2'])
+        replica_lag.reset()
+        with mock.patch.object(replica_lag, 'measure', return_value=float('inf')):
+            self.assertEqual(self.handle('get', reverse('my_uploads')), ['default', 'default'])
+
+
+def async_urlconf():
+    """The project URLconf with the async endpoints served, as with ``AUDIO_ASYNC_VIEWS`` on."""
+    from rasa_project import urls
+    from .urls import async_urlpatterns
+
+    urlconf = types.ModuleType('async_urlconf')
+    urlconf.urlpatterns = [path('api/audio/', include(async_urlpatterns)), *urls.urlpatterns]
+    return urlconf
+
+
+@override_settings(ROOT_URLCONF=async_urlconf())
+class AsyncAudioViewTests(APITestCase):
+
+    def setUp(self):
+        hash_filter.reset()
+        self.user = User.objects.create_user(username='testuser', email='testuser@example.com', password='password123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        MyAudioFile.objects.create(contributor=self.user, file_hash='A' * 40, s3_key='1/audio/a', file_name='a.mp3')
+
+    def test_hash_check(self):
+        url = reverse('check_if_audio_hash_exist_async')
+        self.assertTrue(self.client.post(url, {'hash': 'A' * 40}, format='json').data['exists'])
+        self.assertFalse(self.client.post(url, {'hash': 'B' * 40}, format='json').data['exists'])
+        self.assertEqual(self.client.post(url, {}, format='json').status_code, status.HTTP_400_BAD_REQUEST)
+        with override_settings(AUDIO_HASH_FILTER_ENABLED=False):
+            self.assertTrue(self.client.post(url, {'hash': 'A' * 40}, format='json').data['exists'])
+
+    def test_store_queues_processing(self):
+        url = reverse('save_audio_hash_async')
+        record = {'hash': 'C' * 40, 's3_key': f'{self.user.id}/audio/c', 'file_name': 'c.mp3'}
+        response = self.client.post(url, record, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        audio_file = MyAudioFile.objects.get(file_hash='C' * 40)
+        self.assertEqual(audio_file.contributor, self.user)
+        self.assertEqual(
+            sorted(AudioTask.objects.filter(payload__pk=audio_file.pk).values_list('name', flat=True)),
+            ['fingerprint_audio', 'verify_audio_hash'],
+        )
+        self.assertEqual(self.client.post(url, {'hash': 'D' * 40}, format='json').status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_store_rejects_a_stored_hash(self):
+        record = {'hash': 'A' * 40, 's3_key': f'{self.user.id}/audio/a2', 'file_name': 'a.mp3'}
+        response = self.client.post(reverse('save_audio_hash_async'), record, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_store_is_rolled_back_if_processing_cannot_be_queued(self):
+        record = {'hash': 'C' * 40, 's3_key': f'{self.user.id}/audio/c', 'file_name': 'c.mp3'}
+        with mock.patch('audio_app.views.enqueue', side_effect=RuntimeError('queue unavailable')):
+            response = self.client.post(reverse('save_audio_hash_async'), record, format='json')
+        self.assertEqual(response.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+        self.assertFalse(MyAudioFile.objects.filter(file_hash='C' * 40).exists())
+        self.assertFalse(AudioTask.objects.exists())
+
+    @unittest.skipUnless(mock_aws, 'moto is not installed')
+    def test_presign_checks_the_bucket_off_the_event_loop(self):
+        with mock_aws():
+            get_s3_client.cache_clear()
+            self.addCleanup(get_s3_client.cache_clear)
+            s3 = get_s3_client()
+            s3.create_bucket(Bucket=settings.AWS_STORAGE_BUCKET_NAME)
+            in_bucket, new = hash_chunks([b'b']), hash_chunks([b'c'])
+            MyAudioFile.objects.create(
+                contributor=self.user, file_hash=in_bucket.lower(), s3_key=build_content_key(in_bucket),
+                verification_status=MyAudioFile.VERIFICATION_VERIFIED,
+            )
+            s3.put_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=build_content_key(in_bucket), Body=b'b')
+
+            url = reverse('signed_aws_url_async')
+            response = self.client.post(url, {'file_name': 'b.mp3', 'content_type': 'audio/mpeg', 'hash': in_bucket}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual((response.json()['exists'], response.json()['s3_key']), (True, build_content_key(in_bucket)))
+            response = self.client.post(url, {'file_name': 'c.mp3', 'content_type': 'audio/mpeg', 'hash': new}, format='json')
+            self.assertFalse(response.json()['exists'])
+            self.assertTrue(is_staging_key(response.json()['s3_key']))
+            self.assertEqual(response.json()['headers'], {'Content-Type': 'audio/mpeg'})
+            self.assertEqual(self.client.post(url, {'file_name': 'c.mp3'}, format='json').status_code, 400)
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
@@ -5,8 +6,29 @@ from . import views
 urlpatterns = [
     #path('check-hash-audio/',views.CheckAndSaveAudioHash.as_view(),name='check_hash_audio'),
     path('signed-aws-url/', views.GetSignedUrl.as_view(),name='signed_aws_url'),
+    path('signed-aws-urls/', views.GetSignedUrlsBatch.as_view(),name='signed_aws_urls'),
+    path('multipart-upload/create/', views.CreateMultipartUpload.as_view(),name='multipart_upload_create'),
+    path('multipart-upload/part-urls/', views.PresignMultipartUploadParts.as_view(),name='multipart_upload_part_urls'),
+    path('multipart-upload/complete/', views.CompleteMultipartUpload.as_view(),name='multipart_upload_complete'),
+    path('multipart-upload/abort/', views.AbortMultipartUpload.as_view(),name='multipart_upload_abort'),
     path('check-if-audio-hash/', views.CheckIfAudioHashExist.as_view(),name='check_if_audio_hash_exist'),
+    path('check-if-audio-hashes/', views.CheckIfAudioHashesExistBatch.as_view(),name='check_if_audio_hashes_exist'),
+    path('hash-filter-stats/', views.AudioHashFilterStats.as_view(),name='audio_hash_filter_stats'),
+    path('db-pool-stats/', views.DatabasePoolStats.as_view(),name='db_pool_stats'),
     path('save-audio-hash/', views.StoreAudioDetailsHashAndS3Key.as_view(),name='save_audio_hash'),
-    #path('fingerprint/', views.FingerPrintAudio.as_view(), name='audio_fingerprint'),
-    #path('recognise_audio/',views.CheckAudioFingerprint.as_view(),name='recognise_audio')
-]
\ No newline at end of file
+    path('save-audio-hashes/', views.StoreAudioDetailsHashAndS3KeyBatch.as_view(),name='save_audio_hashes'),
+    path('upload/reserve/', views.ReserveAudioUpload.as_view(),name='upload_reserve'),
+    path('upload/complete/', views.CompleteAudioUpload.as_view(),name='upload_complete'),
+    path('my-uploads/', views.ListMyUploads.as_view(),name='my_uploads'),
+    path('fingerprint/', views.FingerPrintAudio.as_view(), name='audio_fingerprint'),
+    path('recognise_audio/',views.CheckAudioFingerprint.as_view(),name='recognise_audio')
+]
+
+async_urlpatterns = [
+    path('async/signed-aws-url/', views.GetSignedUrlAsync.as_view(),name='signed_aws_url_async'),
+    path('async/check-if-audio-hash/', views.CheckIfAudioHashExistAsync.as_view(),name='check_if_audio_hash_exist_async'),
+    path('async/save-audio-hash/', views.StoreAudioDetailsHashAndS3KeyAsync.as_view(),name='save_audio_hash_async'),
+]
+
+if settings.AUDIO_ASYNC_VIEWS:
+    urlpatterns += async_urlpatterns
\ No newline at end of file
@@ -1,28 +1,91 @@
-import boto3
-from django.conf import settings
 from botocore.exceptions import NoCredentialsError, PartialCredentialsError
+from datetime import datetime
+from django.conf import settings
+import base64
 import logging
+import re
+import uuid
+
+from .hashing import HASH_ALGORITHM_NAMES, parse_hex_digest
+from .s3 import get_presigner
 
 logger = logging.getLogger(__name__)
 
+def build_upload_key(user_id, file_name, content_type, timestamp=None):
+    timestamp = timestamp or datetime.now().strftime('%Y%m%d%H%M%S')
+    return f'{user_id}/audio/{file_name}_{timestamp}/{content_type}'
+
+CONTENT_KEY_RE = re.compile(r'^([0-9a-f]{2})/([0-9a-f]{2})/([a-z0-9-]+)/\1\2[0-9a-f]+$')
+
+def build_content_key(file_hash, algorithm=None):
+    """
+    Content-addressed key ``{h[0:2]}/{h[2:4]}/{algorithm}/{h}`` for the hex
+    digest ``file_hash`` of ``algorithm`` (inferred from the length if not
+    given, see ``parse_hex_digest``). The leading digest digits spread keys
+    evenly over 65,536 prefixes, so S3's per-prefix request rate limit is
+    shared by all uploads rather than hit by one busy contributor, and
+    identical files map to one object. Raises ``ValueError`` if ``file_hash``
+    is not a digest of ``algorithm``.
+    """
+    digest, algorithm = parse_hex_digest(file_hash, algorithm)
+    h = digest.hex()
+    return f'{h[:2]}/{h[2:4]}/{HASH_ALGORITHM_NAMES[algorithm]}/{h}'
+
+def is_content_key(s3_key):
+    return isinstance(s3_key, str) and CONTENT_KEY_RE.match(s3_key) is not None
+
+STAGING_KEY_RE = re.compile(r'^staging/\d+/[0-9a-f]{32}$')
+
+def build_staging_key(user_id):
+    """
+    A fresh ``staging/{user_id}/{uuid}`` key for one hashed upload. Clients
+    only ever write to staging keys; verification copies the object to its
+    content-addressed key once its digest matches the claimed hash.
+    """
+    return f'staging/{user_id}/{uuid.uuid4().hex}'
+
+def is_staging_key(s3_key):
+    return isinstance(s3_key, str) and STAGING_KEY_RE.match(s3_key) is not None
+
+def content_key_for(file_hash, algorithm=None):
+    """
+    The content-addressed key ``file_hash`` is stored at once verified, or
+    None if ``AUDIO_S3_KEY_LAYOUT`` is not ``'content'`` or the hash is not a
+    digest of ``algorithm``.
+    """
+    if isinstance(file_hash, str) and settings.AUDIO_S3_KEY_LAYOUT == 'content':
+        try:
+            return build_content_key(file_hash, algorithm)
+        except ValueError:
+            pass
+    return None
+
+def choose_upload_key(user_id, file_name, content_type, file_hash=None, timestamp=None, algorithm=None):
+    """
+    A staging key when ``file_hash`` has a content-addressed key (see
+    ``content_key_for``), otherwise the per-user key.
+    """
+    if content_key_for(file_hash, algorithm) is not None:
+        return build_staging_key(user_id)
+    return build_upload_key(user_id, file_name, content_type, timestamp)
+
 def generate_s3_signed_url(file_path, content_type, expiration=3600):
-    s3_client = boto3.client(
-        's3',
-        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-        region_name=settings.AWS_S3_REGION_NAME
-    )
     try:
-        signed_url = s3_client.generate_presigned_url(
-            'put_object',
-            Params={
-                'Bucket': settings.AWS_STORAGE_BUCKET_NAME,
-                'Key': file_path,
-                'ContentType': content_type
-            },
-            ExpiresIn=expiration
-        )
-        return signed_url
+        return get_presigner().presign_put(file_path, content_type, expires=expiration)
     except (NoCredentialsError, PartialCredentialsError) as e:
         logger.error(f"Error generating signed URL: {e}")
         return None
+
+def encode_upload_cursor(uploaded_at, pk):
+    """Opaque cursor for the keyset position ``(uploaded_at, pk)``."""
+    return base64.urlsafe_b64encode(f'{uploaded_at.isoformat()}|{pk}'.encode()).decode().rstrip('=')
+
+def decode_upload_cursor(cursor):
+    """Return the ``(uploaded_at, pk)`` in a cursor; raises ``ValueError`` if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        uploaded_at, pk = raw.rsplit('|', 1)
+        return datetime.fromisoformat(uploaded_at), int(pk)
+    except (TypeError, UnicodeDecodeError, base64.binascii.Error) as e:
+        raise ValueError(f'Invalid cursor: {e}')
+
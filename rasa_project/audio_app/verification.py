@@ -0,0 +1,124 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .hashing import HASH_ALGORITHM_NAMES, algorithm_for_hash, hash_chunks, iter_s3_object
+from .models import MyAudioFile
+from .s3 import get_s3_client
+from .tasks import enqueue, enqueue_many
+from .utils import build_content_key, is_staging_key
+
+logger = logging.getLogger(__name__)
+
+
+def verify_audio_file(pk):
+    """
+    Stream the S3 object behind a ``MyAudioFile`` row, hash it and record
+    whether it matches the hash the client claimed. A matching upload at a
+    staging key is moved to its content-addressed key; a mismatched one is
+    deleted with its row, freeing the hash. Rows at other keys are only
+    marked. Returns the new status.
+    """
+    audio_file = MyAudioFile.objects.only('file_hash', 'hash_algorithm', 's3_key').get(pk=pk)
+    algorithm = HASH_ALGORITHM_NAMES.get(audio_file.hash_algorithm) or algorithm_for_hash(audio_file.file_hash)
+    client = get_s3_client()
+    bucket = settings.AWS_STORAGE_BUCKET_NAME
+
+    if algorithm is None or not audio_file.s3_key:
+        verification_status = MyAudioFile.VERIFICATION_ERROR
+    else:
+        try:
+            size = client.head_object(Bucket=bucket, Key=audio_file.s3_key)['ContentLength']
+            digest = hash_chunks(
+                iter_s3_object(
+                    client, bucket, audio_file.s3_key, size=size,
+                    chunk_size=settings.AUDIO_VERIFY_CHUNK_SIZE,
+                    workers=settings.AUDIO_VERIFY_RANGE_WORKERS,
+                ),
+                algorithm,
+            )
+            if digest != audio_file.file_hash.upper():
+                verification_status = MyAudioFile.VERIFICATION_MISMATCH
+            else:
+                verification_status = MyAudioFile.VERIFICATION_VERIFIED
+                if is_staging_key(audio_file.s3_key):
+                    _promote(audio_file, client, bucket)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                verification_status = MyAudioFile.VERIFICATION_MISSING
+            else:
+                logger.error(f"Error verifying audio file {pk}: {e}")
+                verification_status = MyAudioFile.VERIFICATION_ERROR
+
+    if verification_status == MyAudioFile.VERIFICATION_MISMATCH and is_staging_key(audio_file.s3_key):
+        logger.warning(f"Audio file {pk} at {audio_file.s3_key} does not match its claimed hash, deleting it")
+        _discard(audio_file, client, bucket)
+    else:
+        MyAudioFile.objects.filter(pk=pk).update(verification_status=verification_status, verified_at=timezone.now())
+    return verification_status
+
+
+def _promote(audio_file, client, bucket):
+    """Copy a verified upload from its staging key to its content-addressed key and point the row there."""
+    staging_key = audio_file.s3_key
+    audio_file.s3_key = build_content_key(audio_file.file_hash, HASH_ALGORITHM_NAMES.get(audio_file.hash_algorithm))
+    # Any object already at the content key has the same digest, or was
+    # written there without verification; either way it can be replaced.
+    client.copy({'Bucket': bucket, 'Key': staging_key}, bucket, audio_file.s3_key)
+    MyAudioFile.objects.filter(pk=audio_file.pk, s3_key=staging_key).update(s3_key=audio_file.s3_key)
+    client.delete_object(Bucket=bucket, Key=staging_key)
+
+
+def _discard(audio_file, client, bucket):
+    """Delete a row whose staged upload does not match its hash, and the object unless another row points at it."""
+    with transaction.atomic():
+        MyAudioFile.objects.filter(pk=audio_file.pk).delete()
+        shared = MyAudioFile.objects.filter(s3_key=audio_file.s3_key).exists()
+    if not shared:
+        try:
+            client.delete_object(Bucket=bucket, Key=audio_file.s3_key)
+        except ClientError as e:
+            logger.error(f"Could not delete mismatched object {audio_file.s3_key}: {e}")
+
+
+def verify_pending_audio_files(workers=4, limit=None, statuses=(MyAudioFile.VERIFICATION_PENDING,)):
+    """Verify rows in ``statuses`` with a pool of ``workers`` threads. Returns a status -> count map."""
+    # Reserved uploads still in flight are verified when they are completed.
+    pks = (
+        MyAudioFile.objects.filter(verification_status__in=statuses, upload_status=MyAudioFile.UPLOAD_COMPLETE)
+        .order_by('pk').values_list('pk', flat=True)
+    )
+    if limit:
+        pks = pks[:limit]
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for verification_status in pool.map(_verify_in_worker, list(pks)):
+            results[verification_status] = results.get(verification_status, 0) + 1
+    return results
+
+
+def _verify_in_worker(pk):
+    close_old_connections()
+    try:
+        return verify_audio_file(pk)
+    except Exception:
+        logger.exception(f"Unexpected error verifying audio file {pk}")
+        return MyAudioFile.VERIFICATION_ERROR
+    finally:
+        close_old_connections()
+
+
+def schedule_verification(pk):
+    """Queue a background check of a newly stored row (see audio_app.tasks)."""
+    if settings.AUDIO_VERIFY_ON_STORE:
+        return enqueue('verify_audio_hash', pk=pk)
+
+
+def schedule_verifications(pks):
+    """Queue background checks of many newly stored rows with one insert."""
+    if settings.AUDIO_VERIFY_ON_STORE and pks:
+        return enqueue_many('verify_audio_hash', [{'pk': pk} for pk in pks])
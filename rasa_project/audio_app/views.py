@@ -2,6 +2,8 @@ import os
 import tempfile
 import shutil
 from rest_framework.views import APIView
+from adrf.views import APIView as AsyncAPIView
+from asgiref.sync import sync_to_async
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.parsers import MultiPartParser
@@ -9,17 +11,114 @@ from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from hashlib import sha1
 from .models import *
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
 from django.http import JsonResponse
-from .utils import generate_s3_signed_url
+from .utils import build_upload_key, choose_upload_key, content_key_for, decode_upload_cursor, encode_upload_cursor
+from .s3 import aexisting_objects, choose_part_size, existing_objects, get_presigner, get_s3_client, object_exists
+from botocore.exceptions import BotoCoreError, ClientError, NoCredentialsError, PartialCredentialsError
+from .hash_filter import hash_filter
+from .hashing import HASH_ALGORITHM_CODES, parse_hex_digest
+from rasa_project.db.pool import pool_stats
+from .verification import schedule_verification, schedule_verifications
+from .tasks import enqueue, enqueue_many
 
-from rest_framework.parsers import MultiPartParser
-from drf_yasg.utils import swagger_auto_schema
-from drf_yasg import openapi
-from rest_framework.views import APIView
-from django.http import JsonResponse
 from datetime import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _upload_targets(user, items, presigner, timestamp=None):
+    """
+    Pick the S3 key for each of ``items`` (dicts with file_name, content_type
+    and optionally hash) and presign a PUT to it. Hashed files are uploaded
+    to a staging key and moved to their content-addressed key once verified.
+    A hashed file that is already stored, as a row under whatever key it was
+    uploaded to or as a verified object at its content-addressed key, comes
+    back with ``exists`` set and no URL.
+    """
+    content_keys = [content_key_for(item.get('hash')) for item in items]
+    stored = dict(_stored_uploads(items, content_keys))
+    try:
+        in_bucket = _verified_objects(_keys_to_check(items, content_keys, stored))
+    except (BotoCoreError, ClientError) as e:
+        # Uploads go to fresh staging keys, so presigning one is always safe.
+        logger.warning(f"Could not check S3 for existing uploads: {e}")
+        in_bucket = set()
+    return _presign_uploads(user, items, content_keys, stored, in_bucket, presigner, timestamp)
+
+
+async def _aupload_targets(user, items, presigner, timestamp=None):
+    """``_upload_targets`` for async views."""
+    content_keys = [content_key_for(item.get('hash')) for item in items]
+    stored = {file_hash: s3_key async for file_hash, s3_key in _stored_uploads(items, content_keys)}
+    try:
+        in_bucket = await _averified_objects(_keys_to_check(items, content_keys, stored))
+    except (BotoCoreError, ClientError) as e:
+        logger.warning(f"Could not check S3 for existing uploads: {e}")
+        in_bucket = set()
+    return _presign_uploads(user, items, content_keys, stored, in_bucket, presigner, timestamp)
+
+
+def _stored_uploads(items, content_keys):
+    """``(file_hash, s3_key)`` of the completed uploads of the content-addressed ``items``."""
+    hashes = [item['hash'] for item, key in zip(items, content_keys) if key]
+    return (
+        MyAudioFile.objects.filter(file_hash__in=hashes, upload_status=MyAudioFile.UPLOAD_COMPLETE)
+        .values_list('file_hash', 's3_key')
+    )
+
+
+def _keys_to_check(items, content_keys, stored):
+    return [key for item, key in zip(items, content_keys) if key and item['hash'] not in stored]
+
+
+def _verified_keys(keys):
+    return (
+        MyAudioFile.objects.filter(s3_key__in=keys, verification_status=MyAudioFile.VERIFICATION_VERIFIED)
+        .values_list('s3_key', flat=True)
+    )
+
+
+def _verified_objects(keys):
+    """
+    The subset of content-addressed ``keys`` still in the bucket and pointed
+    at by a verified row. Objects no verified row vouches for are ignored.
+    """
+    return existing_objects(list(_verified_keys(keys)), workers=settings.AUDIO_S3_HEAD_WORKERS)
+
+
+async def _averified_objects(keys):
+    """``_verified_objects`` for async views."""
+    return await aexisting_objects([key async for key in _verified_keys(keys)])
+
+
+def _presign_uploads(user, items, content_keys, stored, in_bucket, presigner, timestamp):
+    uploads = []
+    for item, content_key in zip(items, content_keys):
+        upload = {'file_name': item['file_name'], 'content_type': item['content_type'], 's3_key': content_key, 'exists': False}
+        if content_key and item['hash'] in stored:
+            upload.update(s3_key=stored[item['hash']] or content_key, exists=True)
+        elif content_key in in_bucket:
+            upload['exists'] = True
+        else:
+            upload['s3_key'] = choose_upload_key(user.id, item['file_name'], item['content_type'], item.get('hash'), timestamp)
+            upload['signed_url'] = presigner.presign_put(upload['s3_key'], item['content_type'])
+            upload['headers'] = {'Content-Type': item['content_type']}
+        uploads.append(upload)
+    return uploads
+
+
+def _schedule_processing(pk):
+    """Queue verification and fingerprinting of a stored file; call inside the transaction that stored it."""
+    schedule_verification(pk)
+    if settings.AUDIO_FINGERPRINT_ON_STORE:
+        enqueue('fingerprint_audio', pk=pk)
+
 
 class GetSignedUrl(APIView):
     permission_classes = [IsAuthenticated]
@@ -30,38 +129,362 @@ class GetSignedUrl(APIView):
                               "The client provides the file name and content type, and receives "
                               "a pre-signed URL for secure file upload. The file itself is not uploaded "
                               "via this endpoint; instead, the client uses the returned signed URL "
-                              "to upload the file directly to the S3 bucket.",
+                              "to upload the file directly to the S3 bucket. When the file's hash is "
+                              "given it is uploaded to a staging key and moved to a content-addressed key "
+                              "once the server has verified it; if that content is already stored, exists "
+                              "is true and no upload is needed.",
         request_body=openapi.Schema(
             type=openapi.TYPE_OBJECT,
             properties={
                 'file_name': openapi.Schema(type=openapi.TYPE_STRING, description='The name of the file to be uploaded'),
                 'content_type': openapi.Schema(type=openapi.TYPE_STRING, description='The content type (MIME type) of the file'),
+                'hash': openapi.Schema(type=openapi.TYPE_STRING, description='Optional SHA-1 or SHA-256 hex digest of the file'),
             },
             required=['file_name', 'content_type'],
         ),
-        responses={200: "A pre-signed URL for uploading the file to S3."},
+        responses={200: "A pre-signed URL for uploading the file to S3, and the headers the upload must send."},
         consumes=['multipart/form-data'],
     )
     def post(self, request):
+        error, item, presigner = self.prepare(request)
+        if error is not None:
+            return error
+        upload = _upload_targets(request.user, [item], presigner)[0]
+        return JsonResponse({'success':True, **upload}, status=200)
+
+    def prepare(self, request):
+        """Validate the request; returns ``(error response or None, upload item, presigner)``."""
         file_name = request.data.get('file_name')
         content_type = request.data.get('content_type')
-        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-        file_path=f'{request.user.id}/audio/{file_name}_{timestamp}/{content_type}'
-        
+        file_hash = request.data.get('hash') or None
+
         if not file_name or not content_type:
-            return JsonResponse({'success':False,'error': 'file_name and content_type are required'}, status=400)
-        
-        signed_url = generate_s3_signed_url(file_path, content_type)
-        if signed_url:
-            return JsonResponse({'success':True,'signed_url': signed_url},status=200)
-        return JsonResponse({'success':False,'error': 'Could not generate signed URL'}, status=500)
+            return JsonResponse({'success':False,'error': 'file_name and content_type are required'}, status=400), None, None
+        if file_hash is not None and not isinstance(file_hash, str):
+            return JsonResponse({'success':False,'error': 'hash must be a string'}, status=400), None, None
+
+        try:
+            presigner = get_presigner()
+        except (NoCredentialsError, PartialCredentialsError) as e:
+            logger.error(f"Error generating signed URL: {e}")
+            return JsonResponse({'success':False,'error': 'Could not generate signed URL'}, status=500), None, None
+        return None, {'file_name': file_name, 'content_type': content_type, 'hash': file_hash}, presigner
+
+
+class GetSignedUrlAsync(AsyncAPIView, GetSignedUrl):
+    """
+    ``GetSignedUrl`` for ASGI servers. Signing is local CPU work and stays on
+    the event loop; the S3 HEAD requests for hashed files run on the shared
+    S3 I/O threads.
+    """
+
+    @swagger_auto_schema(**GetSignedUrl.post._swagger_auto_schema)
+    async def post(self, request):
+        error, item, presigner = self.prepare(request)
+        if error is not None:
+            return error
+        upload = (await _aupload_targets(request.user, [item], presigner))[0]
+        return JsonResponse({'success':True, **upload}, status=200)
+
+
+class GetSignedUrlsBatch(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="Generate pre-signed S3 upload URLs for many files in one request. "
+                              f"Accepts up to {settings.AUDIO_PRESIGN_BATCH_LIMIT} files per request. "
+                              "Each returned URL must be used with a PUT carrying the returned headers. Files "
+                              "sent with their hash are uploaded to staging keys and moved to content-addressed "
+                              "keys once verified, and files already stored come back with exists set and no URL.",
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'files': openapi.Schema(
+                    type=openapi.TYPE_ARRAY,
+                    items=openapi.Schema(
+                        type=openapi.TYPE_OBJECT,
+                        properties={
+                            'file_name': openapi.Schema(type=openapi.TYPE_STRING, description='The name of the file to be uploaded'),
+                            'content_type': openapi.Schema(type=openapi.TYPE_STRING, description='The content type (MIME type) of the file'),
+                            'hash': openapi.Schema(type=openapi.TYPE_STRING, description='Optional SHA-1 or SHA-256 hex digest of the file'),
+                        },
+                        required=['file_name', 'content_type'],
+                    ),
+                ),
+            },
+            required=['files'],
+        ),
+        responses={
+            200: openapi.Response(description='Pre-signed URLs in request order', examples={
+                'application/json': {
+                    'success': True,
+                    'uploads': [{
+                        'file_name': 'song.mp3',
+                        'content_type': 'audio/mpeg',
+                        's3_key': 'staging/1/8c1e4f0a9b2d4e6f8a0b1c2d3e4f5a6b',
+                        'exists': False,
+                        'signed_url': 'https://bucket.s3.amazonaws.com/...',
+                        'headers': {'Content-Type': 'audio/mpeg'},
+                    }]
+                }
+            }),
+            400: 'Invalid request body',
+        },
+    )
+    def post(self, request):
+        files = request.data.get('files')
+
+        if not isinstance(files, list) or not files:
+            return Response({'success': False, 'error': 'files must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(files) > settings.AUDIO_PRESIGN_BATCH_LIMIT:
+            return Response({'success': False, 'error': f'At most {settings.AUDIO_PRESIGN_BATCH_LIMIT} files are allowed per request'}, status=status.HTTP_400_BAD_REQUEST)
+        if not all(
+            isinstance(item, dict) and item.get('file_name') and item.get('content_type')
+            and isinstance(item['file_name'], str) and isinstance(item['content_type'], str)
+            for item in files
+        ):
+            return Response({'success': False, 'error': 'Every file needs a string file_name and content_type'}, status=status.HTTP_400_BAD_REQUEST)
+        if not all(item.get('hash') is None or isinstance(item['hash'], str) for item in files):
+            return Response({'success': False, 'error': 'hash must be a string'}, status=status.HTTP_400_BAD_REQUEST)
+        if len({(item['file_name'], item['content_type']) for item in files}) != len(files):
+            return Response({'success': False, 'error': 'Duplicate file_name and content_type pairs would share an S3 key'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            presigner = get_presigner()
+        except (NoCredentialsError, PartialCredentialsError):
+            return Response({'success': False, 'error': 'Could not generate signed URLs'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+        uploads = _upload_targets(request.user, files, presigner, timestamp)
+        return Response({'success': True, 'uploads': uploads}, status=status.HTTP_200_OK)
     
 
+def _owns_s3_key(user, s3_key):
+    return isinstance(s3_key, str) and s3_key.startswith(f'{user.id}/')
+
+
+def _may_store_s3_key(user, s3_key):
+    """Whether ``user`` may record ``s3_key``: one of their per-user or staging keys."""
+    return _owns_s3_key(user, s3_key) or (isinstance(s3_key, str) and s3_key.startswith(f'staging/{user.id}/'))
+
+
+_ALGORITHM_SCHEMA = openapi.Schema(
+    type=openapi.TYPE_STRING, enum=list(HASH_ALGORITHM_CODES),
+    description='The algorithm that produced the hash; inferred from its length when omitted',
+)
+
+
+def _algorithm_error(file_hash, algorithm):
+    """Why ``algorithm``, the optional algorithm name sent with ``file_hash``, cannot be used, or None."""
+    if algorithm is None:
+        return None
+    if not isinstance(algorithm, str) or algorithm not in HASH_ALGORITHM_CODES:
+        return f"algorithm must be one of {', '.join(HASH_ALGORITHM_CODES)}"
+    try:
+        parse_hex_digest(file_hash, algorithm)
+    except (TypeError, ValueError):
+        return f'hash is not a {algorithm} digest'
+    return None
+
+
+def _s3_error_response(error):
+    message = error.response.get('Error', {}).get('Message') or str(error)
+    return Response({'success': False, 'error': message}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class CreateMultipartUpload(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="Start an S3 multipart upload for a large audio file. The server picks the part "
+                              "size from the declared file size; the client then requests part URLs, uploads the "
+                              "parts (concurrently, retrying single parts as needed) and completes the upload.",
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'file_name': openapi.Schema(type=openapi.TYPE_STRING, description='The name of the file to be uploaded'),
+                'content_type': openapi.Schema(type=openapi.TYPE_STRING, description='The content type (MIME type) of the file'),
+                'file_size': openapi.Schema(type=openapi.TYPE_INTEGER, description='The size of the file in bytes'),
+            },
+            required=['file_name', 'content_type', 'file_size'],
+        ),
+        responses={
+            200: openapi.Response(description='Upload id and part layout', examples={
+                'application/json': {
+                    'success': True,
+                    'upload_id': 'VXBsb2FkIElE...',
+                    's3_key': '1/audio/song.wav_20240101000000/audio/wav',
+                    'part_size': 8388608,
+                    'part_count': 13,
+                }
+            }),
+            400: 'Invalid request body',
+        },
+    )
+    def post(self, request):
+        file_name = request.data.get('file_name')
+        content_type = request.data.get('content_type')
+        file_size = request.data.get('file_size')
+
+        if not file_name or not content_type:
+            return Response({'success': False, 'error': 'file_name and content_type are required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            part_size, part_count = choose_part_size(int(file_size))
+        except (TypeError, ValueError):
+            return Response({'success': False, 'error': 'file_size must be an integer between 1 byte and 5 TiB'}, status=status.HTTP_400_BAD_REQUEST)
+
+        s3_key = build_upload_key(request.user.id, file_name, content_type)
+        try:
+            upload = get_s3_client().create_multipart_upload(
+                Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=s3_key, ContentType=content_type
+            )
+        except ClientError as e:
+            return _s3_error_response(e)
+        return Response({
+            'success': True,
+            'upload_id': upload['UploadId'],
+            's3_key': s3_key,
+            'part_size': part_size,
+            'part_count': part_count,
+        }, status=status.HTTP_200_OK)
+
+
+class PresignMultipartUploadParts(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="Presign upload URLs for a batch of parts of a multipart upload. "
+                              f"Accepts up to {settings.AUDIO_MULTIPART_PART_URL_BATCH_LIMIT} part numbers per request; "
+                              "a single part can be presigned again to retry it.",
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                's3_key': openapi.Schema(type=openapi.TYPE_STRING, description='The S3 key returned when the upload was created'),
+                'upload_id': openapi.Schema(type=openapi.TYPE_STRING, description='The multipart upload id'),
+                'part_numbers': openapi.Schema(
+                    type=openapi.TYPE_ARRAY,
+                    items=openapi.Schema(type=openapi.TYPE_INTEGER),
+                    description='Part numbers (1-10000) to presign'
+                ),
+            },
+            required=['s3_key', 'upload_id', 'part_numbers'],
+        ),
+        responses={200: 'Presigned part URLs keyed by part number', 400: 'Invalid request body'},
+    )
+    def post(self, request):
+        s3_key = request.data.get('s3_key')
+        upload_id = request.data.get('upload_id')
+        part_numbers = request.data.get('part_numbers')
+
+        if not _owns_s3_key(request.user, s3_key) or not upload_id:
+            return Response({'success': False, 'error': 'A valid s3_key and upload_id are required'}, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(part_numbers, list) or not part_numbers:
+            return Response({'success': False, 'error': 'part_numbers must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(part_numbers) > settings.AUDIO_MULTIPART_PART_URL_BATCH_LIMIT:
+            return Response({'success': False, 'error': f'At most {settings.AUDIO_MULTIPART_PART_URL_BATCH_LIMIT} parts are allowed per request'}, status=status.HTTP_400_BAD_REQUEST)
+        if not all(isinstance(number, int) and not isinstance(number, bool) and 1 <= number <= 10000 for number in part_numbers):
+            return Response({'success': False, 'error': 'Part numbers must be integers between 1 and 10000'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            presigner = get_presigner()
+        except (NoCredentialsError, PartialCredentialsError) as e:
+            logger.error(f"Error generating signed URL: {e}")
+            return Response({'success': False, 'error': 'Could not generate signed URL'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        urls = {number: presigner.presign_upload_part(s3_key, upload_id, number) for number in part_numbers}
+        return Response({'success': True, 'urls': urls}, status=status.HTTP_200_OK)
+
+
+class CompleteMultipartUpload(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="Complete a multipart upload from the ETags returned by each part upload.",
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                's3_key': openapi.Schema(type=openapi.TYPE_STRING, description='The S3 key returned when the upload was created'),
+                'upload_id': openapi.Schema(type=openapi.TYPE_STRING, description='The multipart upload id'),
+                'parts': openapi.Schema(
+                    type=openapi.TYPE_ARRAY,
+                    items=openapi.Schema(
+                        type=openapi.TYPE_OBJECT,
+                        properties={
+                            'part_number': openapi.Schema(type=openapi.TYPE_INTEGER),
+                            'etag': openapi.Schema(type=openapi.TYPE_STRING),
+                        },
+                        required=['part_number', 'etag'],
+                    ),
+                ),
+            },
+            required=['s3_key', 'upload_id', 'parts'],
+        ),
+        responses={200: 'Upload completed', 400: 'Invalid request body'},
+    )
+    def post(self, request):
+        s3_key = request.data.get('s3_key')
+        upload_id = request.data.get('upload_id')
+        parts = request.data.get('parts')
+
+        if not _owns_s3_key(request.user, s3_key) or not upload_id:
+            return Response({'success': False, 'error': 'A valid s3_key and upload_id are required'}, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(parts, list) or not parts or not all(
+            isinstance(part, dict) and isinstance(part.get('part_number'), int) and not isinstance(part['part_number'], bool)
+            and part.get('etag') for part in parts
+        ):
+            return Response({'success': False, 'error': 'parts must be a non-empty list of {part_number, etag}'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            get_s3_client().complete_multipart_upload(
+                Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+                Key=s3_key,
+                UploadId=upload_id,
+                MultipartUpload={'Parts': [
+                    {'PartNumber': part['part_number'], 'ETag': part['etag']}
+                    for part in sorted(parts, key=lambda part: part['part_number'])
+                ]},
+            )
+        except ClientError as e:
+            return _s3_error_response(e)
+        return Response({'success': True, 's3_key': s3_key}, status=status.HTTP_200_OK)
+
+
+class AbortMultipartUpload(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="Abort a multipart upload and discard any uploaded parts.",
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                's3_key': openapi.Schema(type=openapi.TYPE_STRING, description='The S3 key returned when the upload was created'),
+                'upload_id': openapi.Schema(type=openapi.TYPE_STRING, description='The multipart upload id'),
+            },
+            required=['s3_key', 'upload_id'],
+        ),
+        responses={200: 'Upload aborted', 400: 'Invalid request body'},
+    )
+    def post(self, request):
+        s3_key = request.data.get('s3_key')
+        upload_id = request.data.get('upload_id')
+
+        if not _owns_s3_key(request.user, s3_key) or not upload_id:
+            return Response({'success': False, 'error': 'A valid s3_key and upload_id are required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            get_s3_client().abort_multipart_upload(
+                Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=s3_key, UploadId=upload_id
+            )
+        except ClientError as e:
+            return _s3_error_response(e)
+        return Response({'success': True}, status=status.HTTP_200_OK)
+
+
 class CheckIfAudioHashExist(APIView):
     permission_classes = [IsAuthenticated]
+    replica_reads = True
     
     @swagger_auto_schema(
-        operation_description="Check if an audio file hash already exists in the database.",
+        operation_description="Check if an audio file hash already exists in the database. A hash reserved "
+                              "through upload/reserve/ counts as existing until the reservation is abandoned.",
         request_body=openapi.Schema(
             type=openapi.TYPE_OBJECT,
             properties={
@@ -84,9 +507,89 @@ class CheckIfAudioHashExist(APIView):
         if not hash_value:
             return Response({'success': False, 'error': 'Hash is required'}, status=status.HTTP_400_BAD_REQUEST)
         
-        exists = MyAudioFile.objects.filter(file_hash=hash_value).exists()
+        exists = hash_filter.hash_exists(hash_value)
         return Response({'success': True, 'exists': exists}, status=status.HTTP_200_OK)
-    
+
+
+class CheckIfAudioHashExistAsync(AsyncAPIView, CheckIfAudioHashExist):
+    """``CheckIfAudioHashExist`` for ASGI servers."""
+
+    @swagger_auto_schema(**CheckIfAudioHashExist.post._swagger_auto_schema)
+    async def post(self, request):
+        hash_value = request.data.get('hash')
+
+        if not hash_value:
+            return Response({'success': False, 'error': 'Hash is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        exists = await hash_filter.ahash_exists(hash_value)
+        return Response({'success': True, 'exists': exists}, status=status.HTTP_200_OK)
+
+
+class CheckIfAudioHashesExistBatch(APIView):
+    permission_classes = [IsAuthenticated]
+    replica_reads = True
+
+    @swagger_auto_schema(
+        operation_description="Check whether many audio file hashes already exist in the database. "
+                              "Hashes reserved through upload/reserve/ count as existing until the reservation is abandoned. "
+                              f"Accepts up to {settings.AUDIO_HASH_BATCH_LIMIT} hashes per request.",
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'hashes': openapi.Schema(
+                    type=openapi.TYPE_ARRAY,
+                    items=openapi.Schema(type=openapi.TYPE_STRING),
+                    description='The hashes of the audio files'
+                ),
+            },
+            required=['hashes'],
+        ),
+        responses={
+            200: openapi.Response(description='Existence status per hash', examples={
+                'application/json': {
+                    'success': True,
+                    'exists': {'3F786850E387550FDAB836ED7E6DC881DE23001B': True}
+                }
+            }),
+            400: 'Invalid request body',
+        },
+    )
+    def post(self, request):
+        hashes = request.data.get('hashes')
+
+        if not isinstance(hashes, list) or not hashes:
+            return Response({'success': False, 'error': 'hashes must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(hashes) > settings.AUDIO_HASH_BATCH_LIMIT:
+            return Response({'success': False, 'error': f'At most {settings.AUDIO_HASH_BATCH_LIMIT} hashes are allowed per request'}, status=status.HTTP_400_BAD_REQUEST)
+        if not all(isinstance(hash_value, str) and hash_value for hash_value in hashes):
+            return Response({'success': False, 'error': 'Every hash must be a non-empty string'}, status=status.HTTP_400_BAD_REQUEST)
+
+        found = hash_filter.existing_hashes(hashes)
+        exists = {hash_value: hash_value in found for hash_value in hashes}
+        return Response({'success': True, 'exists': exists}, status=status.HTTP_200_OK)
+
+
+class AudioHashFilterStats(APIView):
+    permission_classes = [IsAdminUser]
+
+    @swagger_auto_schema(
+        operation_description="Report the size, load and observed false-positive rate of this worker's audio hash filter.",
+        responses={200: 'Filter statistics'},
+    )
+    def get(self, request):
+        return Response({'success': True, 'data': hash_filter.stats()}, status=status.HTTP_200_OK)
+
+
+class DatabasePoolStats(APIView):
+    permission_classes = [IsAdminUser]
+
+    @swagger_auto_schema(
+        operation_description="Report the size, checkouts and health-check failures of this worker's database connection pools.",
+        responses={200: 'Pool statistics, keyed by database alias'},
+    )
+    def get(self, request):
+        return Response({'success': True, 'data': pool_stats()}, status=status.HTTP_200_OK)
+
 
 class StoreAudioDetailsHashAndS3Key(APIView):
     permission_classes = [IsAuthenticated]
@@ -99,6 +602,7 @@ class StoreAudioDetailsHashAndS3Key(APIView):
                 'hash': openapi.Schema(type=openapi.TYPE_STRING, description='The hash of the audio file'),
                 's3_key': openapi.Schema(type=openapi.TYPE_STRING, description='The S3 key where the file is stored'),
                 'file_name': openapi.Schema(type=openapi.TYPE_STRING, description='The name of the file'),
+                'algorithm': _ALGORITHM_SCHEMA,
             },
             required=['hash', 's3_key', 'file_name'],
         ),
@@ -108,30 +612,393 @@ class StoreAudioDetailsHashAndS3Key(APIView):
         },
     )
     def post(self, request):
+        return self.store(request)
+
+    def store(self, request):
         try:
             hash_value = request.data.get('hash')
             s3_key = request.data.get('s3_key')
             file_name = request.data.get('file_name')
+            algorithm = request.data.get('algorithm')
             
             if not hash_value or not s3_key or not file_name:
                 return Response({'success': False, 'error': 'Hash, s3_key, and file_name are required'}, status=status.HTTP_400_BAD_REQUEST)
+            if not _may_store_s3_key(request.user, s3_key):
+                return Response({'success': False, 'error': 'Invalid s3_key'}, status=status.HTTP_400_BAD_REQUEST)
+            error = _algorithm_error(hash_value, algorithm)
+            if error:
+                return Response({'success': False, 'error': error}, status=status.HTTP_400_BAD_REQUEST)
             
-            
-            MyAudioFile.objects.create(
-                contributor=request.user,
-                file_hash=hash_value,
-                s3_key=s3_key,
-                file_name=file_name
-            )
+            with transaction.atomic():
+                MyAudioFile.objects.release_abandoned([hash_value])
+                audio_file = MyAudioFile(
+                    contributor=request.user,
+                    file_hash=hash_value,
+                    s3_key=s3_key,
+                    file_name=file_name
+                ).with_digest(algorithm)
+                audio_file.save(force_insert=True)
+                schedule_verification(audio_file.pk)
+                if settings.AUDIO_FINGERPRINT_ON_STORE:
+                    enqueue('fingerprint_audio', pk=audio_file.pk)
             
             return Response({'success': True, 'message': 'Audio details successfully stored'}, status=status.HTTP_200_OK)
+        except IntegrityError:
+            return Response({'success': False, 'error': 'Audio file with this hash already exists'}, status=status.HTTP_409_CONFLICT)
         except Exception as e:
-            return Response({'success': False, 'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER)
+            return Response({'success': False, 'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+class StoreAudioDetailsHashAndS3KeyAsync(AsyncAPIView, StoreAudioDetailsHashAndS3Key):
+    """
+    ``StoreAudioDetailsHashAndS3Key`` for ASGI servers. The insert and its
+    task rows share one transaction, so the sync view's code runs in a thread.
+    """
 
+    @swagger_auto_schema(**StoreAudioDetailsHashAndS3Key.post._swagger_auto_schema)
+    async def post(self, request):
+        return await sync_to_async(self.store)(request)
+
+
+class StoreAudioDetailsHashAndS3KeyBatch(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="Store many audio hash records in one transaction. "
+                              f"Accepts up to {settings.AUDIO_STORE_BATCH_LIMIT} records per request. "
+                              "Hashes that are already stored are left untouched and reported as existing.",
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'files': openapi.Schema(
+                    type=openapi.TYPE_ARRAY,
+                    items=openapi.Schema(
+                        type=openapi.TYPE_OBJECT,
+                        properties={
+                            'hash': openapi.Schema(type=openapi.TYPE_STRING, description='The hash of the audio file'),
+                            's3_key': openapi.Schema(type=openapi.TYPE_STRING, description='The S3 key where the file is stored'),
+                            'file_name': openapi.Schema(type=openapi.TYPE_STRING, description='The name of the file'),
+                            'algorithm': _ALGORITHM_SCHEMA,
+                        },
+                        required=['hash', 's3_key', 'file_name'],
+                    ),
+                    description='The audio files to store'
+                ),
+            },
+            required=['files'],
+        ),
+        responses={
+            200: openapi.Response(description='Hashes inserted and hashes that already existed', examples={
+                'application/json': {
+                    'success': True,
+                    'inserted': ['3F786850E387550FDAB836ED7E6DC881DE23001B'],
+                    'existing': ['89E6C98D92887913CADF06B2ADB97F26CDE4849B'],
+                }
+            }),
+            400: 'Invalid request body',
+        },
+    )
+    def post(self, request):
+        files = request.data.get('files')
+
+        if not isinstance(files, list) or not files:
+            return Response({'success': False, 'error': 'files must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(files) > settings.AUDIO_STORE_BATCH_LIMIT:
+            return Response({'success': False, 'error': f'At most {settings.AUDIO_STORE_BATCH_LIMIT} files are allowed per request'}, status=status.HTTP_400_BAD_REQUEST)
+        records = []
+        for item in files:
+            if not isinstance(item, dict) or not all(isinstance(item.get(field), str) and item.get(field) for field in ('hash', 's3_key', 'file_name')):
+                return Response({'success': False, 'error': 'Every file needs hash, s3_key and file_name'}, status=status.HTTP_400_BAD_REQUEST)
+            if not _may_store_s3_key(request.user, item['s3_key']):
+                return Response({'success': False, 'error': f"Invalid s3_key {item['s3_key']}"}, status=status.HTTP_400_BAD_REQUEST)
+            error = _algorithm_error(item['hash'], item.get('algorithm'))
+            if error:
+                return Response({'success': False, 'error': error}, status=status.HTTP_400_BAD_REQUEST)
+            records.append((item['hash'], item['s3_key'], item['file_name'], item.get('algorithm')))
+        if len({record[0] for record in records}) != len(records):
+            return Response({'success': False, 'error': 'Duplicate hash in request'}, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            inserted, existing = MyAudioFile.objects.store_many(request.user, records)
+            pks = list(inserted.values())
+            schedule_verifications(pks)
+            if settings.AUDIO_FINGERPRINT_ON_STORE and pks:
+                enqueue_many('fingerprint_audio', [{'pk': pk} for pk in pks])
+            # bulk_create sends no post_save, so the hash filter is fed here.
+            transaction.on_commit(lambda: hash_filter.add_many(inserted))
+
+        return Response({
+            'success': True,
+            'inserted': [record[0] for record in records if record[0] in inserted],
+            'existing': [record[0] for record in records if record[0] in existing],
+        }, status=status.HTTP_200_OK)
+
+
+
+
+
+
+
+class ReserveAudioUpload(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="Reserve an audio hash and get a pre-signed upload URL in one call, replacing the "
+                              "check-hash, signed-url and save-hash sequence. The hash is claimed with an insert "
+                              "against its unique constraint, so two clients can never both upload it. Upload to "
+                              "signed_url with the returned headers, then call upload/complete/. Hashed uploads "
+                              "go to a staging key and are moved to their content-addressed key once verified. "
+                              "Unfinished reservations can be taken over, and stop counting as stored, "
+                              f"after {settings.AUDIO_UPLOAD_RESERVATION_TTL} seconds.",
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'hash': openapi.Schema(type=openapi.TYPE_STRING, description='The hash of the audio file'),
+                'file_name': openapi.Schema(type=openapi.TYPE_STRING, description='The name of the file to be uploaded'),
+                'content_type': openapi.Schema(type=openapi.TYPE_STRING, description='The content type (MIME type) of the file'),
+                'algorithm': _ALGORITHM_SCHEMA,
+            },
+            required=['hash', 'file_name', 'content_type'],
+        ),
+        responses={
+            201: openapi.Response(description='Hash reserved', examples={
+                'application/json': {
+                    'success': True,
+                    'duplicate': False,
+                    'upload_required': True,
+                    's3_key': 'staging/1/8c1e4f0a9b2d4e6f8a0b1c2d3e4f5a6b',
+                    'signed_url': 'https://bucket.s3.amazonaws.com/...',
+                    'headers': {'Content-Type': 'audio/mpeg'},
+                    'expires_in': 3600,
+                }
+            }),
+            400: 'Invalid request body',
+            409: openapi.Response(description='The hash is already stored or being uploaded', examples={
+                'application/json': {'success': False, 'duplicate': True, 'error': 'Audio file with this hash already exists'}
+            }),
+        },
+    )
+    def post(self, request):
+        hash_value = request.data.get('hash')
+        file_name = request.data.get('file_name')
+        content_type = request.data.get('content_type')
+        algorithm = request.data.get('algorithm')
 
+        if not hash_value or not file_name or not content_type:
+            return Response({'success': False, 'error': 'hash, file_name and content_type are required'}, status=status.HTTP_400_BAD_REQUEST)
+        error = _algorithm_error(hash_value, algorithm)
+        if error:
+            return Response({'success': False, 'error': error}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            presigner = get_presigner()
+        except (NoCredentialsError, PartialCredentialsError):
+            return Response({'success': False, 'error': 'Could not generate signed URL'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        ttl = settings.AUDIO_UPLOAD_RESERVATION_TTL
+        s3_key = choose_upload_key(request.user.id, file_name, content_type, hash_value, algorithm=algorithm)
+        audio_file = MyAudioFile.objects.reserve(request.user, hash_value, s3_key, file_name, ttl, algorithm)
+        if audio_file is None:
+            return Response({'success': False, 'duplicate': True, 'error': 'Audio file with this hash already exists'}, status=status.HTTP_409_CONFLICT)
+
+        # Stored content shares the digest constraint, so a successful
+        # reservation always needs an upload, to a staging key when hashed.
+        return Response({
+            'success': True,
+            'duplicate': False,
+            'upload_required': True,
+            's3_key': s3_key,
+            'signed_url': presigner.presign_put(s3_key, content_type, expires=ttl),
+            'headers': {'Content-Type': content_type},
+            'expires_in': ttl,
+        }, status=status.HTTP_201_CREATED)
+
+
+class CompleteAudioUpload(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="Mark a reserved upload as finished once the file is in S3. Queues verification "
+                              "and fingerprinting of the stored file.",
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'hash': openapi.Schema(type=openapi.TYPE_STRING, description='The hash passed to upload/reserve/'),
+            },
+            required=['hash'],
+        ),
+        responses={
+            200: 'Audio details successfully stored',
+            400: 'Invalid request body',
+            404: 'No pending upload of this hash by the current user',
+            409: 'The file is not in S3 yet',
+            503: 'S3 could not be reached',
+        },
+    )
+    def post(self, request):
+        hash_value = request.data.get('hash')
+
+        if not hash_value:
+            return Response({'success': False, 'error': 'Hash is required'}, status=status.HTTP_400_BAD_REQUEST)
+        pending = MyAudioFile.objects.filter(
+            file_hash=hash_value, contributor=request.user, upload_status=MyAudioFile.UPLOAD_PENDING
+        )
+        row = pending.values_list('pk', 's3_key').first()
+        if row is None:
+            return Response({'success': False, 'error': 'No pending upload for this hash'}, status=status.HTTP_404_NOT_FOUND)
+        pk, s3_key = row
+        try:
+            uploaded = object_exists(s3_key)
+        except (BotoCoreError, ClientError) as e:
+            logger.warning(f"Could not check S3 for {s3_key}: {e}")
+            return Response({'success': False, 'error': 'Could not check the upload, try again'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        if not uploaded:
+            return Response({'success': False, 'error': 'The file has not been uploaded yet'}, status=status.HTTP_409_CONFLICT)
+        with transaction.atomic():
+            if not pending.filter(pk=pk).update(upload_status=MyAudioFile.UPLOAD_COMPLETE, uploaded_at=timezone.now()):
+                return Response({'success': False, 'error': 'No pending upload for this hash'}, status=status.HTTP_404_NOT_FOUND)
+            _schedule_processing(pk)
+        return Response({'success': True, 'message': 'Audio details successfully stored'}, status=status.HTTP_200_OK)
+
+
+class FingerPrintAudio(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="Queue fingerprinting of a stored audio file so re-encoded or trimmed copies of it can be "
+                              "recognised. Any previous fingerprints of the file are replaced when the task runs.",
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'hash': openapi.Schema(type=openapi.TYPE_STRING, description='The hash of a stored audio file you contributed'),
+            },
+            required=['hash'],
+        ),
+        responses={
+            202: openapi.Response(description='Fingerprinting queued', examples={
+                'application/json': {'success': True, 'task_id': 42}
+            }),
+            400: 'Invalid request body',
+            404: 'No such audio file',
+        },
+    )
+    def post(self, request):
+        hash_value = request.data.get('hash')
+
+        if not hash_value:
+            return Response({'success': False, 'error': 'Hash is required'}, status=status.HTTP_400_BAD_REQUEST)
+        audio_file = MyAudioFile.objects.filter(file_hash=hash_value, contributor=request.user).only('pk').first()
+        if audio_file is None:
+            return Response({'success': False, 'error': 'Audio file not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        task = enqueue('fingerprint_audio', pk=audio_file.pk)
+        return Response({'success': True, 'task_id': task.pk}, status=status.HTTP_202_ACCEPTED)
+
+
+class ListMyUploads(APIView):
+    permission_classes = [IsAuthenticated]
+    fields = ('id', 'file_name', 'file_hash', 's3_key', 'uploaded_at', 'upload_status', 'verification_status')
+
+    @swagger_auto_schema(
+        operation_description="List the audio files uploaded by the current user, newest first. "
+                              "Pass the returned next_cursor as cursor to fetch the following page; "
+                              "it is null on the last page.",
+        manual_parameters=[
+            openapi.Parameter('cursor', openapi.IN_QUERY, description="next_cursor from the previous page", type=openapi.TYPE_STRING),
+            openapi.Parameter(
+                'limit', openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                description=f"Page size (default {settings.AUDIO_UPLOADS_PAGE_SIZE}, at most {settings.AUDIO_UPLOADS_PAGE_MAX})",
+            ),
+        ],
+        responses={200: 'A page of uploads and the cursor of the next page', 400: 'Invalid cursor or limit'},
+    )
+    def get(self, request):
+        try:
+            limit = int(request.query_params.get('limit', settings.AUDIO_UPLOADS_PAGE_SIZE))
+        except ValueError:
+            return Response({'success': False, 'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, settings.AUDIO_UPLOADS_PAGE_MAX))
+
+        # Keyset pagination on (uploaded_at, id): every page is a seek into the
+        # (contributor, uploaded_at, id) index, however deep into the listing it is.
+        # "(uploaded_at, id) < cursor" is split into two range queries, the rest of
+        # the cursor's timestamp and then older ones, because an OR of the two is
+        # not an index range on every backend.
+        uploads = MyAudioFile.objects.filter(contributor=request.user)
+        newest_first = ('-uploaded_at', '-id')
+        cursor = request.query_params.get('cursor')
+        if cursor:
+            try:
+                uploaded_at, pk = decode_upload_cursor(cursor)
+            except ValueError as e:
+                return Response({'success': False, 'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            rows = list(
+                uploads.filter(uploaded_at=uploaded_at, id__lt=pk).order_by(*newest_first).values(*self.fields)[:limit + 1]
+            )
+            if len(rows) <= limit:
+                rows += uploads.filter(uploaded_at__lt=uploaded_at).order_by(*newest_first).values(*self.fields)[:limit + 1 - len(rows)]
+        else:
+            rows = list(uploads.order_by(*newest_first).values(*self.fields)[:limit + 1])
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_upload_cursor(rows[-1]['uploaded_at'], rows[-1]['id'])
+        return Response({'success': True, 'results': rows, 'next_cursor': next_cursor}, status=status.HTTP_200_OK)
+
+
+class CheckAudioFingerprint(APIView):
+    permission_classes = [IsAuthenticated]
+    replica_reads = True
+    parser_classes = [MultiPartParser]
+
+    @swagger_auto_schema(
+        operation_description="Identify which stored audio files a clip was taken from, even if it was re-encoded or trimmed.",
+        manual_parameters=[
+            openapi.Parameter(
+                'file', openapi.IN_FORM, description="Audio clip to recognise", type=openapi.TYPE_FILE, required=True
+            ),
+        ],
+        responses={
+            200: openapi.Response(description='Best matches, best first', examples={
+                'application/json': {
+                    'success': True,
+                    'matches': [{
+                        'file_hash': '3F786850E387550FDAB836ED7E6DC881DE23001B',
+                        'file_name': 'song.mp3',
+                        'score': 412,
+                        'offset_seconds': 31.3,
+                    }]
+                }
+            }),
+            400: 'No file provided or the file could not be decoded',
+        },
+        consumes=['multipart/form-data'],
+    )
+    def post(self, request):
+        # numpy and scipy are loaded on first use rather than with the URLconf.
+        from .decoding import AudioDecodeError
+        from .fingerprint import fingerprint_chunks
+        from .matching import match_fingerprints
+
+        if 'file' not in request.FILES:
+            return Response({'success': False, 'error': 'No file provided'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            hashes, offsets = fingerprint_chunks(request.FILES['file'].chunks())
+        except (AudioDecodeError, OSError) as e:
+            return Response({'success': False, 'error': f'Could not decode audio: {e}'}, status=status.HTTP_400_BAD_REQUEST)
 
+        matches = match_fingerprints(hashes, offsets)
+        files = MyAudioFile.objects.only('file_hash', 'file_name').in_bulk([match['file_id'] for match in matches])
+        results = [
+            {
+                'file_hash': files[match['file_id']].file_hash,
+                'file_name': files[match['file_id']].file_name,
+                'score': match['score'],
+                'offset_seconds': match['offset_seconds'],
+            }
+            for match in matches if match['file_id'] in files
+        ]
+        return Response({'success': True, 'matches': results}, status=status.HTTP_200_OK)
 
 
 
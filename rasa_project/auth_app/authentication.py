@@ -0,0 +1,45 @@
+from django.db import router
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .user_cache import CACHED_USER_FIELDS, user_cache
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    ``JWTAuthentication`` that resolves the token's user from ``user_cache``,
+    so repeat requests with the same token do no database work. The user is
+    rebuilt with ``Model.from_db`` from the cached columns.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        wanted = CACHED_USER_FIELDS + (['password'] if api_settings.CHECK_REVOKE_TOKEN else [])
+        # from_db() takes the loaded values in model field order.
+        fields = [f.attname for f in self.user_model._meta.concrete_fields if f.attname in wanted]
+        values = user_cache.get(user_id)
+        if values is None or len(values) != len(fields):
+            values = (
+                self.user_model.objects.filter(**{api_settings.USER_ID_FIELD: user_id})
+                .values_list(*fields).first()
+            )
+            if values is None:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            user_cache.set(user_id, values)
+        user = self.user_model.from_db(router.db_for_read(self.user_model), fields, values)
+
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
@@ -0,0 +1,167 @@
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.validators import validate_email
+from django.db import transaction
+
+from auth_app.models import CustomUser
+
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 't'}
+
+
+class Command(BaseCommand):
+    help = (
+        "Import users from a CSV (with a header row) or JSONL file. Columns: email (required), password or "
+        "password_hash (an already hashed Django password), username, first_name, last_name, phonenumber, "
+        "is_verified. Passwords are hashed in a process pool; existing emails are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV or JSONL file, or '-' for standard input.")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Input format; inferred from the file extension by default.')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Rows hashed and inserted per transaction.')
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                            help='Password hashing processes; 0 hashes in this process.')
+        parser.add_argument('--verified', action='store_true', help='Mark every imported user as verified.')
+
+    def handle(self, *args, **options):
+        input_format = options['format'] or ('jsonl' if options['path'].endswith(('.jsonl', '.ndjson')) else 'csv')
+        if input_format == 'csv' and options['path'] == '-' and not options['format']:
+            raise CommandError('Pass --format when reading from standard input.')
+        self.verified = options['verified']
+        self.counts = {'rows': 0, 'created': 0, 'existing': 0, 'conflicts': 0, 'invalid': 0}
+        self.seen = set()
+        self.started = time.monotonic()
+
+        pool = None
+        self.processes = options['processes']
+        if self.processes > 0:
+            # Spawned so the workers share no database connection; they only need settings.
+            pool = ProcessPoolExecutor(
+                max_workers=self.processes, mp_context=multiprocessing.get_context('spawn'),
+                initializer=django.setup,
+            )
+        stream = sys.stdin if options['path'] == '-' else open(options['path'], newline='', encoding='utf-8')
+        try:
+            rows = csv.DictReader(stream) if input_format == 'csv' else self.read_jsonl(stream)
+            # Hash the next batch in the pool while the previous one is written.
+            pending = None
+            while True:
+                batch = list(islice(rows, options['batch_size']))
+                if not batch:
+                    break
+                users, to_hash = self.prepare(batch)
+                hashes = self.hash_passwords(pool, [password for _, password in to_hash])
+                if pending:
+                    self.write(*pending)
+                pending = (users, [user for user, _ in to_hash], hashes)
+            if pending:
+                self.write(*pending)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+            if pool:
+                pool.shutdown()
+        self.stdout.write(self.style.SUCCESS(f'Done: {self.progress()}'))
+
+    def read_jsonl(self, stream):
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                self.stderr.write(f'Line {line_number}: invalid JSON ({e})')
+                yield {}
+
+    def prepare(self, batch):
+        """
+        Turn raw rows into unsaved users, dropping invalid rows and emails
+        already stored or seen. Returns the users and the ``(user, password)``
+        pairs still to be hashed.
+        """
+        self.counts['rows'] += len(batch)
+        candidates = {}
+        for row in batch:
+            email = CustomUser.objects.normalize_email((row.get('email') or '').strip())
+            try:
+                validate_email(email)
+            except ValidationError:
+                self.counts['invalid'] += 1
+                self.stderr.write(f'Skipping row with invalid email {email!r}')
+                continue
+            if email in self.seen or email in candidates:
+                self.counts['existing'] += 1
+                continue
+            candidates[email] = row
+
+        existing = set(CustomUser.objects.filter(email__in=list(candidates)).values_list('email', flat=True))
+        self.counts['existing'] += len(existing)
+        users, to_hash = [], []
+        for email, row in candidates.items():
+            self.seen.add(email)
+            if email in existing:
+                continue
+            user = CustomUser(
+                email=email,
+                username=row.get('username') or None,
+                first_name=row.get('first_name') or '',
+                last_name=row.get('last_name') or '',
+                phonenumber=row.get('phonenumber') or None,
+                is_verified=self.verified or str(row.get('is_verified', '')).strip().lower() in TRUE_VALUES,
+            )
+            password_hash = row.get('password_hash')
+            if password_hash:
+                try:
+                    identify_hasher(password_hash)
+                except ValueError:
+                    self.counts['invalid'] += 1
+                    self.stderr.write(f'Skipping {email}: unrecognised password hash')
+                    continue
+                user.password = password_hash
+            elif row.get('password'):
+                to_hash.append((user, row['password']))
+            else:
+                # No password: unusable until reset through the password reset email.
+                user.set_unusable_password()
+            users.append(user)
+        return users, to_hash
+
+    def hash_passwords(self, pool, passwords):
+        """Start hashing ``passwords``; returns an iterator of hashes in the same order."""
+        if pool is None:
+            return map(make_password, passwords)
+        chunksize = max(1, len(passwords) // (self.processes * 4))
+        return pool.map(make_password, passwords, chunksize=chunksize)
+
+    def write(self, users, hashed_users, hashes):
+        for user, password_hash in zip(hashed_users, hashes):
+            user.password = password_hash
+        emails = [user.email for user in users]
+        with transaction.atomic():
+            # ignore_conflicts covers emails registered through the site since the
+            # lookup; it reports no row counts, so they are counted around it.
+            before = CustomUser.objects.filter(email__in=emails).count()
+            CustomUser.objects.bulk_create(users, ignore_conflicts=True)
+            created = CustomUser.objects.filter(email__in=emails).count() - before
+        self.counts['created'] += created
+        self.counts['conflicts'] += len(users) - created
+        self.stdout.write(self.progress())
+
+    def progress(self):
+        elapsed = time.monotonic() - self.started
+        rate = self.counts['rows'] / elapsed if elapsed else 0
+        return (
+            f"{self.counts['rows']} rows read, {self.counts['created']} created, {self.counts['existing']} existing, "
+            f"{self.counts['conflicts']} registered meanwhile, {self.counts['invalid']} invalid, {rate:.0f} rows/s"
+        )
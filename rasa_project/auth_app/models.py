@@ -5,12 +5,6 @@ from django.contrib.auth.models import AbstractUser,PermissionsMixin,BaseUserMan
 from django.contrib.auth.models import User
 from django.utils.translation import gettext_lazy as _
 from django.db import models
-from rest_framework_simplejwt.tokens import RefreshToken
-
-from rest_framework.views import APIView
-from rest_framework.response import Response
-from rest_framework import status
-from rest_framework.permissions import IsAuthenticated
 #from .serializers import CustomUserSerializer
 
 
@@ -45,6 +39,9 @@ class CustomUser(AbstractUser):
     objects = CustomUserManager()
 
     def tokens(self):
+        # Imported here so loading the models does not pull in the JWT machinery.
+        from rest_framework_simplejwt.tokens import RefreshToken
+
         refresh = RefreshToken.for_user(self)
         return({
             'refresh': str(refresh),
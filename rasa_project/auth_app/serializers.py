@@ -1,7 +1,9 @@
 from rest_framework import serializers
 from .models import CustomUser
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
-from rest_framework.exceptions import ValidationError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
+from django.contrib.auth.models import update_last_login
 class CustomUserSerializer(serializers.ModelSerializer):
     class Meta:
         model = CustomUser
@@ -14,6 +16,11 @@ class UserTokenObtainPairSerializer(TokenObtainPairSerializer):
     password = serializers.CharField()
 
     def validate(self, attrs):
+        """
+        One user query and one password hash per login. ``super().validate`` is
+        not called: its ``authenticate()`` would hash the password again in
+        every entry of ``AUTHENTICATION_BACKENDS``.
+        """
         email = attrs.get("email", "")
         password = attrs.get("password", "")
         
@@ -32,8 +39,15 @@ class UserTokenObtainPairSerializer(TokenObtainPairSerializer):
         if not user.is_verified:
             raise ValidationError({"account": "Please activate your account."})
 
-        # If everything is valid, generate tokens using the parent class logic
-        data = super().validate(attrs)
+        if not api_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(self.error_messages["no_active_account"], "no_active_account")
+
+        # Issue the tokens the way TokenObtainPairSerializer does
+        self.user = user
+        refresh = self.get_token(user)
+        data = {"refresh": str(refresh), "access": str(refresh.access_token)}
+        if api_settings.UPDATE_LAST_LOGIN:
+            update_last_login(None, user)
         return data
 
 
@@ -53,12 +67,12 @@ class SignUpSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         # Extract the password from the validated data
         password = validated_data.pop('password', None)
-        # Create a new user instance with the remaining validated data
-        user = CustomUser.objects.create(**validated_data)
+        # Build the user with the remaining validated data and save it once
+        user = CustomUser(**validated_data)
         # Set the password for the user
         if password:
             user.set_password(password)
-            user.save()
+        user.save()
         return user
 
 
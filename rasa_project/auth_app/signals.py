@@ -0,0 +1,14 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import CustomUser
+from .user_cache import user_cache
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_cached_user(sender, instance, **kwargs):
+    # simplejwt's settings module imports django.test; load it when first needed, not at startup.
+    from rest_framework_simplejwt.settings import api_settings
+
+    user_cache.delete(getattr(instance, api_settings.USER_ID_FIELD))
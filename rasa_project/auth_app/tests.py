@@ -1,4 +1,16 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import base_user
+from django.core import mail
+from django.core.management import call_command
+from django.core.mail.backends import locmem
+from django.test import TestCase, override_settings
 
 from django.urls import reverse
 from rest_framework import status
@@ -6,6 +18,9 @@ from rest_framework.test import APITestCase, APIClient
 from django.contrib.auth import get_user_model
 from rest_framework_simplejwt.tokens import RefreshToken
 
+from auth_app.authentication import user_cache
+from auth_app.utils import EmailDispatcher, Util
+
 User = get_user_model()
 
 class UserEndpointTests(APITestCase):
@@ -88,3 +103,213 @@ class UserEndpointTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertEqual(response.data['success'], False)
         self.assertEqual(response.data['error'], 'Invalid token')
+
+
+class FlakyEmailBackend(locmem.EmailBackend):
+    """locmem backend whose first ``send_messages`` call fails."""
+    calls = 0
+
+    def send_messages(self, messages):
+        FlakyEmailBackend.calls += 1
+        if FlakyEmailBackend.calls == 1:
+            raise ConnectionError('connection reset')
+        return super().send_messages(messages)
+
+
+class FailingEmailBackend(locmem.EmailBackend):
+    def send_messages(self, messages):
+        raise ConnectionError('connection refused')
+
+
+class EmailDispatcherTests(TestCase):
+
+    def test_emails_are_sent_in_batches_by_the_pool(self):
+        dispatcher = EmailDispatcher()
+        with override_settings(EMAIL_DISPATCHER_WORKERS=1):
+            for i in range(5):
+                dispatcher.submit(mail.EmailMessage(subject=f'Hello {i}', body='Hi', to=[f'user{i}@example.com']))
+            self.assertTrue(dispatcher.flush(timeout=5))
+        self.assertEqual(sorted(m.subject for m in mail.outbox), [f'Hello {i}' for i in range(5)])
+        stats = dispatcher.stats()
+        self.assertEqual(stats['sent'], 5)
+        self.assertEqual(stats['queue_depth'], 0)
+        self.assertLessEqual(stats['batches'], 5)
+        self.assertIsNotNone(stats['delivery_ms']['max'])
+
+    @override_settings(
+        EMAIL_BACKEND=f'{__name__}.FlakyEmailBackend', EMAIL_DISPATCHER_WORKERS=1, EMAIL_DISPATCHER_RETRY_BACKOFF=0
+    )
+    def test_failed_send_is_retried(self):
+        FlakyEmailBackend.calls = 0
+        dispatcher = EmailDispatcher()
+        dispatcher.submit(mail.EmailMessage(subject='Verify your email', body='Hi', to=['a@example.com']))
+        self.assertTrue(dispatcher.flush(timeout=5))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(dispatcher.stats()['retried'], 1)
+        self.assertEqual(dispatcher.stats()['failed'], 0)
+
+    @override_settings(
+        EMAIL_BACKEND=f'{__name__}.FlakyEmailBackend', EMAIL_DISPATCHER_WORKERS=1, EMAIL_DISPATCHER_RETRY_BACKOFF=0.3
+    )
+    def test_retry_backoff_does_not_hold_up_the_queue(self):
+        FlakyEmailBackend.calls = 0
+        dispatcher = EmailDispatcher()
+        dispatcher.submit(mail.EmailMessage(subject='First', body='Hi', to=['a@example.com']))
+        deadline = time.monotonic() + 5
+        while not FlakyEmailBackend.calls and time.monotonic() < deadline:
+            time.sleep(0.01)
+        # Sent while the first email waits out its backoff.
+        dispatcher.submit(mail.EmailMessage(subject='Second', body='Hi', to=['b@example.com']))
+        self.assertTrue(dispatcher.flush(timeout=5))
+        self.assertEqual([m.subject for m in mail.outbox], ['Second', 'First'])
+
+    @override_settings(
+        EMAIL_BACKEND=f'{__name__}.FailingEmailBackend', EMAIL_DISPATCHER_WORKERS=1, EMAIL_DISPATCHER_RETRY_QUEUE_SIZE=0
+    )
+    def test_failures_are_dropped_when_the_retry_queue_is_full(self):
+        dispatcher = EmailDispatcher()
+        with self.assertLogs('auth_app.utils', 'ERROR') as logs:
+            dispatcher.submit(mail.EmailMessage(subject='Verify your email', body='Hi', to=['a@example.com']))
+            self.assertTrue(dispatcher.flush(timeout=5))
+        self.assertIn('Retry queue full', logs.output[0])
+        self.assertEqual(dispatcher.stats()['failed'], 1)
+        self.assertEqual(dispatcher.stats()['retry_pending'], 0)
+
+    @override_settings(EMAIL_BACKEND=f'{__name__}.FailingEmailBackend', EMAIL_DISPATCHER_WORKERS=0)
+    def test_inline_send_errors_are_logged_not_raised(self):
+        dispatcher = EmailDispatcher()
+        with self.assertLogs('auth_app.utils', 'ERROR'):
+            dispatcher.submit(mail.EmailMessage(subject='Verify your email', body='Hi', to=['a@example.com']))
+        self.assertEqual(dispatcher.stats()['failed'], 1)
+
+    @override_settings(EMAIL_DISPATCHER_WORKERS=0)
+    def test_util_sends_inline_without_workers(self):
+        Util.send_email({'email_subject': 'Reset your password', 'email_body': 'Hi', 'to_email': 'b@example.com'})
+        self.assertEqual(mail.outbox[0].to, ['b@example.com'])
+
+
+class LoginTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='login@example.com', password='password123', is_verified=True)
+
+    def test_login_hashes_the_password_once(self):
+        with mock.patch.object(base_user, 'check_password', wraps=base_user.check_password) as check:
+            response = self.client.post(
+                reverse('login'), {'email': 'login@example.com', 'password': 'password123'}, format='json'
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('access', response.data)
+        self.assertEqual(check.call_count, 1)
+
+    def test_login_errors_are_unchanged(self):
+        cases = [
+            ({'email': 'nobody@example.com', 'password': 'password123'}, 'email', 'No user found with this email.'),
+            ({'email': 'login@example.com', 'password': 'wrong'}, 'password', 'Invalid password.'),
+        ]
+        for data, field, message in cases:
+            response = self.client.post(reverse('login'), data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(response.data['errors'][field], [message])
+
+        User.objects.filter(pk=self.user.pk).update(is_verified=False)
+        response = self.client.post(reverse('login'), {'email': 'login@example.com', 'password': 'password123'}, format='json')
+        self.assertEqual(response.data['errors']['account'], ['Please activate your account.'])
+
+
+class CachedJWTAuthenticationTests(APITestCase):
+
+    def setUp(self):
+        user_cache.clear()
+        self.user = User.objects.create_user(email='cached@example.com', password='password123', username='cached')
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_repeat_requests_do_not_query_the_user(self):
+        url = reverse('get_user')
+        with self.assertNumQueries(1):
+            self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.data['data']['username'], 'cached')
+
+    def test_saving_or_deleting_the_user_invalidates_it(self):
+        url = reverse('get_user')
+        self.client.get(url)
+        self.user.username = 'renamed'
+        self.user.save()
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.data['data']['username'], 'renamed')
+
+        self.user.delete()
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(AUTH_USER_CACHE_ALIAS='default')
+    def test_shared_cache_serves_other_processes(self):
+        url = reverse('get_user')
+        self.client.get(url)
+        user_cache.clear()  # as seen from another worker process
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ImportUsersCommandTests(TestCase):
+
+    def setUp(self):
+        User.objects.create_user(email='taken@example.com', password='password123')
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def import_file(self, name, content, **options):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        out = StringIO()
+        call_command('import_users', path, processes=0, batch_size=2, stdout=out, stderr=StringIO(), **options)
+        return out.getvalue()
+
+    def test_csv_import_skips_existing_duplicate_and_invalid_rows(self):
+        out = self.import_file('users.csv', (
+            'email,password,username,is_verified\n'
+            'a@example.com,secret-a,alice,true\n'
+            'taken@example.com,secret,,\n'
+            'b@example.com,,bob,\n'
+            'a@example.com,other,,\n'
+            'not-an-email,secret,,\n'
+        ))
+        self.assertIn('5 rows read, 2 created, 2 existing, 0 registered meanwhile, 1 invalid', out)
+        alice = User.objects.get(email='a@example.com')
+        self.assertTrue(alice.check_password('secret-a'))
+        self.assertTrue(alice.is_verified)
+        self.assertFalse(User.objects.get(email='b@example.com').has_usable_password())
+
+    def test_emails_registered_during_the_import_are_not_counted_as_created(self):
+        from auth_app.management.commands.import_users import Command
+
+        prepare = Command.prepare
+
+        def prepare_then_register(command, batch):
+            prepared = prepare(command, batch)
+            User.objects.create_user(email='e@example.com', password='password123')
+            return prepared
+
+        with mock.patch.object(Command, 'prepare', prepare_then_register):
+            out = self.import_file('users.csv', 'email,password\ne@example.com,secret\nf@example.com,secret\n')
+        self.assertIn('2 rows read, 1 created, 0 existing, 1 registered meanwhile', out)
+
+    def test_jsonl_import_keeps_password_hashes(self):
+        from django.contrib.auth.hashers import make_password
+
+        rows = [
+            {'email': 'c@example.com', 'password_hash': make_password('secret-c'), 'first_name': 'Cy'},
+            {'email': 'd@example.com', 'password_hash': 'not-a-hash'},
+        ]
+        out = self.import_file('users.jsonl', ''.join(json.dumps(row) + '\n' for row in rows), verified=True)
+        self.assertIn('1 created', out)
+        user = User.objects.get(email='c@example.com')
+        self.assertTrue(user.check_password('secret-c'))
+        self.assertTrue(user.is_verified)
+        self.assertFalse(User.objects.filter(email='d@example.com').exists())
+
@@ -9,5 +9,6 @@ urlpatterns = [
     path('update-user/', views.UpdateUserDetails.as_view(), name='update'),
     path('request-password-change/', views.PasswordRequestChange.as_view(), name='password-change'),
     path('reset-password/', views.PasswordReset.as_view(),name='password-reset'),
-    path('get-user/',views.GetUserDetailsView.as_view(),name='get_user')
+    path('get-user/',views.GetUserDetailsView.as_view(),name='get_user'),
+    path('email-dispatcher-stats/', views.EmailDispatcherStats.as_view(), name='email_dispatcher_stats'),
 ]
@@ -0,0 +1,85 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+# Columns kept for an authenticated user; anything else (password, last_login,
+# date_joined) is left deferred and loaded on first access.
+CACHED_USER_FIELDS = [
+    'id', 'email', 'username', 'first_name', 'last_name', 'phonenumber',
+    'is_active', 'is_staff', 'is_superuser', 'is_verified',
+]
+
+
+class UserCache:
+    """
+    Column values of recently authenticated users, keyed by user id: a
+    process-local LRU with a TTL, in front of the ``AUTH_USER_CACHE_ALIAS``
+    cache shared by all workers when one is configured. ``post_save`` and
+    ``post_delete`` on the user model clear an entry from this process and
+    the shared cache; other processes' local copies expire after
+    ``AUTH_USER_CACHE_TTL`` seconds, as do changes made with
+    ``QuerySet.update()``, which sends no signals.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = OrderedDict()
+
+    @staticmethod
+    def _shared():
+        alias = settings.AUTH_USER_CACHE_ALIAS
+        return caches[alias] if alias else None
+
+    @staticmethod
+    def _shared_key(user_id):
+        return f'auth_user:{user_id}'
+
+    def get(self, user_id):
+        key = str(user_id)
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is not None:
+                expires_at, values = entry
+                if expires_at > time.monotonic():
+                    self._local.move_to_end(key)
+                    return values
+                del self._local[key]
+        shared = self._shared()
+        if shared is not None:
+            values = shared.get(self._shared_key(key))
+            if values is not None:
+                self._set_local(key, values)
+                return values
+        return None
+
+    def set(self, user_id, values):
+        key = str(user_id)
+        self._set_local(key, values)
+        shared = self._shared()
+        if shared is not None:
+            shared.set(self._shared_key(key), values, settings.AUTH_USER_CACHE_TTL)
+
+    def _set_local(self, key, values):
+        with self._lock:
+            self._local[key] = (time.monotonic() + settings.AUTH_USER_CACHE_TTL, values)
+            self._local.move_to_end(key)
+            while len(self._local) > settings.AUTH_USER_CACHE_SIZE:
+                self._local.popitem(last=False)
+
+    def delete(self, user_id):
+        key = str(user_id)
+        with self._lock:
+            self._local.pop(key, None)
+        shared = self._shared()
+        if shared is not None:
+            shared.delete(self._shared_key(key))
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+
+
+user_cache = UserCache()
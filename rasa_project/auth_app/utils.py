@@ -1,18 +1,270 @@
-from django.core.mail import EmailMessage
+import atexit
+import heapq
+import itertools
+import logging
+import os
+import queue
 import threading
+import time
+from collections import deque, namedtuple
 
-class EmailThread(threading.Thread):
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
 
-    def __init__(self, email):
-        self.email = email
-        threading.Thread.__init__(self)
+logger = logging.getLogger(__name__)
+
+QueuedEmail = namedtuple('QueuedEmail', ['message', 'enqueued_at'])
+
+
+class EmailDispatcher:
+    """
+    Sends email from a bounded queue with a small pool of worker threads.
+
+    Each worker keeps one connection from ``EMAIL_BACKEND`` open between
+    messages and hands everything waiting in the queue (up to
+    ``EMAIL_DISPATCHER_BATCH_SIZE``) to a single ``send_messages`` call, so a
+    burst of signups costs one TLS handshake per worker rather than one thread
+    and one handshake per email. When the queue is full, ``submit`` blocks for
+    up to ``EMAIL_DISPATCHER_ENQUEUE_TIMEOUT`` seconds and then sends the
+    message in the caller's thread. Failed sends are retried one message at a
+    time with exponential backoff: they wait in a bounded heap ordered by due
+    time (``EMAIL_DISPATCHER_RETRY_QUEUE_SIZE``; further failures are dropped
+    and logged) that the workers send from, on their own connections, between
+    batches, so the queue keeps draining meanwhile. A message in a batch that
+    failed part way may therefore be delivered twice. At interpreter
+    exit (e.g. a recycled gunicorn worker) queued and retrying messages get
+    up to ``EMAIL_DISPATCHER_SHUTDOWN_TIMEOUT`` seconds to go out.
+
+    With ``EMAIL_DISPATCHER_WORKERS = 0`` messages are sent inline. Errors
+    sending inline are logged, never raised into the request.
+    """
+    latency_samples = 1000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._workers = []
+        self._retries = threading.Condition()
+        # (due, sequence, item, attempt) heap, plus retries being sent.
+        self._delayed = []
+        self._sequence = itertools.count()
+        self._pending_retries = 0
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.batches = 0
+        self.sent_inline = 0
+        self._send_ms = deque(maxlen=self.latency_samples)
+        self._delivery_ms = deque(maxlen=self.latency_samples)
+
+    def _start(self):
+        # Threads do not survive a fork, so a forked worker starts its own pool.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=settings.EMAIL_DISPATCHER_QUEUE_SIZE)
+            self._workers = [
+                threading.Thread(target=self._run, name=f'email-dispatcher-{i}', daemon=True)
+                for i in range(settings.EMAIL_DISPATCHER_WORKERS)
+            ]
+            for worker in self._workers:
+                worker.start()
+            if self._pid is None:
+                atexit.register(self._drain)
+            self._pid = os.getpid()
+
+    def submit(self, message):
+        if settings.EMAIL_DISPATCHER_WORKERS == 0:
+            self._send_inline(message)
+            return
+        self._start()
+        try:
+            self._queue.put(QueuedEmail(message, time.monotonic()), timeout=settings.EMAIL_DISPATCHER_ENQUEUE_TIMEOUT)
+        except queue.Full:
+            logger.warning(f"Email queue full ({self._queue.maxsize}); sending to {message.to} inline")
+            self._send_inline(message)
+
+    def flush(self, timeout=None):
+        """Wait until every queued email has been sent or given up on; returns False on timeout."""
+        if self._queue is None or self._pid != os.getpid():
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        # Retries are scheduled before their batch is marked done, so the queue goes first.
+        for condition, pending in (
+            (self._queue.all_tasks_done, lambda: self._queue.unfinished_tasks),
+            (self._retries, lambda: self._pending_retries),
+        ):
+            with condition:
+                while pending():
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    condition.wait(remaining)
+        return True
+
+    def _drain(self):
+        if not self.flush(timeout=settings.EMAIL_DISPATCHER_SHUTDOWN_TIMEOUT):
+            logger.error(
+                f"Exiting with {self._queue.unfinished_tasks} queued and {self._pending_retries} retrying emails unsent"
+            )
+
+    def _send_inline(self, message):
+        start = time.monotonic()
+        try:
+            message.send()
+        except Exception:
+            logger.exception(f"Sending email to {message.to} failed")
+            with self._stats_lock:
+                self.failed += 1
+            return
+        self._record(1, start, [start])
+        with self._stats_lock:
+            self.sent_inline += 1
+
+    def _run(self):
+        connection = get_connection()
+        while True:
+            due = self._next_retry()
+            if isinstance(due, tuple):
+                self._retry(connection, *due)
+                continue
+            try:
+                first = self._queue.get(timeout=min(settings.EMAIL_DISPATCHER_IDLE_TIMEOUT, due))
+            except queue.Empty:
+                if due >= settings.EMAIL_DISPATCHER_IDLE_TIMEOUT:
+                    # Close idle connections here rather than find them dropped by the server.
+                    connection.close()
+                continue
+            batch = [first]
+            while len(batch) < settings.EMAIL_DISPATCHER_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._deliver(connection, batch)
+            except Exception:
+                logger.exception('Email dispatcher failed to deliver a batch')
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _deliver(self, connection, batch):
+        start = time.monotonic()
+        try:
+            connection.send_messages([item.message for item in batch])
+        except Exception as e:
+            logger.warning(f"Sending {len(batch)} emails failed ({e}); retrying individually")
+            self._close(connection)
+            for item in batch:
+                self._schedule_retry(item, 0)
+            return
+        with self._stats_lock:
+            self.batches += 1
+        self._record(len(batch), start, [item.enqueued_at for item in batch])
+
+    def _schedule_retry(self, item, attempt):
+        """Queue ``item`` for retry after the backoff for ``attempt``, or give up on it."""
+        if attempt >= settings.EMAIL_DISPATCHER_MAX_RETRIES:
+            with self._stats_lock:
+                self.failed += 1
+            logger.error(f"Giving up on email to {item.message.to} after {settings.EMAIL_DISPATCHER_MAX_RETRIES} retries")
+            return
+        with self._retries:
+            if len(self._delayed) < settings.EMAIL_DISPATCHER_RETRY_QUEUE_SIZE:
+                due = time.monotonic() + settings.EMAIL_DISPATCHER_RETRY_BACKOFF * 2 ** attempt
+                heapq.heappush(self._delayed, (due, next(self._sequence), item, attempt))
+                self._pending_retries += 1
+                return
+        with self._stats_lock:
+            self.failed += 1
+        logger.error(
+            f"Retry queue full ({settings.EMAIL_DISPATCHER_RETRY_QUEUE_SIZE}); dropping email to {item.message.to}"
+        )
+
+    def _next_retry(self):
+        """Pop the ``(item, attempt)`` of a retry that is due, or return the seconds until the next one."""
+        with self._retries:
+            if not self._delayed:
+                return float('inf')
+            wait = self._delayed[0][0] - time.monotonic()
+            if wait > 0:
+                return wait
+            _, _, item, attempt = heapq.heappop(self._delayed)
+            return item, attempt
+
+    def _retry(self, connection, item, attempt):
+        with self._stats_lock:
+            self.retried += 1
+        start = time.monotonic()
+        try:
+            connection.send_messages([item.message])
+        except Exception as e:
+            logger.warning(f"Retry {attempt + 1} sending email to {item.message.to} failed: {e}")
+            self._close(connection)
+            self._schedule_retry(item, attempt + 1)
+        else:
+            self._record(1, start, [item.enqueued_at])
+        finally:
+            with self._retries:
+                self._pending_retries -= 1
+                self._retries.notify_all()
+
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _record(self, count, start, enqueued_at):
+        now = time.monotonic()
+        with self._stats_lock:
+            self.sent += count
+            self._send_ms.append((now - start) * 1000)
+            self._delivery_ms.extend((now - t) * 1000 for t in enqueued_at)
+
+    @staticmethod
+    def _summary(samples):
+        if not samples:
+            return {'avg': None, 'p95': None, 'max': None}
+        ordered = sorted(samples)
+        return {
+            'avg': round(sum(ordered) / len(ordered), 1),
+            'p95': round(ordered[int(0.95 * (len(ordered) - 1))], 1),
+            'max': round(ordered[-1], 1),
+        }
+
+    def stats(self):
+        running = self._queue is not None and self._pid == os.getpid()
+        with self._stats_lock:
+            send_ms, delivery_ms = list(self._send_ms), list(self._delivery_ms)
+        return {
+            'workers': sum(worker.is_alive() for worker in self._workers) if running else 0,
+            'queue_depth': self._queue.qsize() if running else 0,
+            'retry_pending': self._pending_retries,
+            'queue_size': settings.EMAIL_DISPATCHER_QUEUE_SIZE,
+            'sent': self.sent,
+            'sent_inline': self.sent_inline,
+            'batches': self.batches,
+            'retried': self.retried,
+            'failed': self.failed,
+            # Time spent in the backend call per batch, and from submit to delivery per email.
+            'send_ms': self._summary(send_ms),
+            'delivery_ms': self._summary(delivery_ms),
+        }
+
+
+email_dispatcher = EmailDispatcher()
 
-    def run(self):
-        self.email.send()
 
 class Util:
     @staticmethod
     def send_email(data):
         email = EmailMessage(
             subject=data['email_subject'], body=data['email_body'], to=[data['to_email']])
-        EmailThread(email).start()
\ No newline at end of file
+        email_dispatcher.submit(email)
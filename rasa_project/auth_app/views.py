@@ -7,7 +7,7 @@ from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.sites.shortcuts import get_current_site
 from django.urls import reverse
 import jwt
-from .utils import Util
+from .utils import Util, email_dispatcher
 from django.conf import settings
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
@@ -19,8 +19,8 @@ from rest_framework import generics, permissions
 from rest_framework.response import Response
 from rest_framework import status
 from .serializers import *
-from rest_framework_simplejwt.authentication import JWTAuthentication
-from rest_framework.permissions import IsAuthenticated
+from .authentication import CachedJWTAuthentication
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 
 class GetUserDetailsView(APIView):
     permission_classes = [IsAuthenticated]
@@ -62,7 +62,7 @@ class GetUserDetailsView(APIView):
 # Endpoint for updating user details
 class UpdateUserDetails(generics.UpdateAPIView):
     serializer_class = UpdateUserSerializer
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
 
@@ -150,6 +150,8 @@ class SignUp(GenericAPIView):
 # Endpoint for email verification
 class VerifyEmail(GenericAPIView ):
     serializer_class = EmailVerificationSerializer
+    # Reads and then saves the user, so both go to the primary.
+    replica_reads = False
 
     token_param_config = openapi.Parameter(
         'token', in_=openapi.IN_QUERY, description='Description', type=openapi.TYPE_STRING)
@@ -265,4 +267,15 @@ class PasswordReset(GenericAPIView):
         except jwt.exceptions.DecodeError:
             return response.Response({'success': False, 'error': 'Invalid token'}, status=status.HTTP_400_BAD_REQUEST)
         except CustomUser.DoesNotExist:
-            return response.Response({'success': False, 'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+            return response.Response({'success': False, 'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
+
+
+class EmailDispatcherStats(APIView):
+    permission_classes = [IsAdminUser]
+
+    @swagger_auto_schema(
+        operation_description="Report this worker's email queue depth, delivery counts and send latency.",
+        responses={200: 'Dispatcher statistics'},
+    )
+    def get(self, request):
+        return Response({'success': True, 'data': email_dispatcher.stats()}, status=status.HTTP_200_OK)
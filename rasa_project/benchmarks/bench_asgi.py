@@ -0,0 +1,203 @@
+"""
+Load test: the audio endpoints under WSGI (gunicorn, sync views) and ASGI
+(uvicorn, async views).
+
+Both servers run one worker process against the same throwaway SQLite
+database, with ``AUDIO_ASYNC_VIEWS`` on so that the async routes exist. S3
+is replaced by a local stub that answers every request with a 404 after
+``--s3-latency`` milliseconds, so that no request leaves the machine.
+Presigning only HEADs content that a verified row points at, and the
+throwaway database has none, so the benchmarked requests do not wait on it.
+Each endpoint is driven by ``--concurrency`` keep-alive connections for
+``--duration`` seconds.
+
+    python benchmarks/bench_asgi.py [--concurrency 64] [--duration 10] [--threads 8] [--s3-latency 30]
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# name -> (WSGI path, ASGI path, body for request number i)
+ENDPOINTS = {
+    'hash check': (
+        '/api/audio/check-if-audio-hash/', '/api/audio/async/check-if-audio-hash/',
+        lambda i: {'hash': 'A' * 40 if i % 2 else f'{i:040X}'},
+    ),
+    'presign': (
+        '/api/audio/signed-aws-url/', '/api/audio/async/signed-aws-url/',
+        lambda i: {'file_name': f'{i}.mp3', 'content_type': 'audio/mpeg', 'hash': f'{i:040x}'},
+    ),
+    'store': (
+        '/api/audio/save-audio-hash/', '/api/audio/async/save-audio-hash/',
+        lambda i: {'hash': f'{time.time_ns():040X}{i}', 's3_key': f'bench/{i}', 'file_name': f'{i}.mp3'},
+    ),
+}
+
+_SETUP = '''
+from rest_framework_simplejwt.tokens import RefreshToken
+from audio_app.models import MyAudioFile
+from auth_app.models import CustomUser
+user = CustomUser.objects.create_user(username='bench', email='bench@example.com', password='benchmark-password')
+MyAudioFile.objects.create(contributor=user, file_hash='A' * 40, s3_key='bench/a', file_name='a.mp3')
+print(RefreshToken.for_user(user).access_token)
+'''
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+async def s3_stub(latency):
+    """An S3 endpoint where no object exists; every response takes ``latency`` seconds."""
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                length = 0
+                for line in head.split(b'\r\n'):
+                    if line.lower().startswith(b'content-length:'):
+                        length = int(line.split(b':')[1])
+                if length:
+                    await reader.readexactly(length)
+                await asyncio.sleep(latency)
+                writer.write(b'HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n')
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            # CancelledError: the benchmark is over and the loop is shutting down.
+            writer.close()
+
+    return await asyncio.start_server(handle, '127.0.0.1', 0)
+
+
+async def request(reader, writer, path, body, token):
+    payload = json.dumps(body).encode()
+    writer.write(
+        f'POST {path} HTTP/1.1\r\nHost: localhost\r\nAuthorization: Bearer {token}\r\n'
+        f'Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n'.encode() + payload
+    )
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.split(b'\r\n')
+    headers = dict(line.split(b': ', 1) for line in lines[1:] if b': ' in line)
+    headers = {key.lower(): value for key, value in headers.items()}
+    await reader.readexactly(int(headers.get(b'content-length', 0)))
+    return int(lines[0].split()[1]), headers.get(b'connection', b'').lower() == b'close'
+
+
+async def load(port, path, make_body, token, concurrency, duration):
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+    counter = iter(range(10 ** 9))
+
+    async def client():
+        nonlocal errors
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                status, close = await request(reader, writer, path, make_body(next(counter)), token)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                status, close = None, True
+            if status == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+            if close:
+                writer.close()
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'requests_per_s': len(latencies) / elapsed,
+        'p50_ms': latencies[len(latencies) // 2] * 1000 if latencies else None,
+        'p95_ms': latencies[int(len(latencies) * 0.95)] * 1000 if latencies else None,
+        'errors': errors,
+    }
+
+
+def wait_for(port, process, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'server exited with {process.returncode}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'server on port {port} did not start')
+
+
+async def main(args):
+    stub = await s3_stub(args.s3_latency / 1000)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        env = dict(
+            os.environ,
+            DATABASE_URL=f'sqlite:///{tmp_dir}/bench.sqlite3',
+            AWS_S3_ENDPOINT_URL=f'http://127.0.0.1:{stub.sockets[0].getsockname()[1]}',
+            AUDIO_VERIFY_ON_STORE='True',
+            AUDIO_ASYNC_VIEWS='True',
+            OPENAPI_SCHEMA_LIVE='False',
+            DEBUG='False',
+        )
+        manage = [sys.executable, 'manage.py']
+        subprocess.run(manage + ['migrate', '-v', '0'], cwd=BASE_DIR, env=env, check=True)
+        token = subprocess.run(
+            manage + ['shell', '-c', _SETUP], cwd=BASE_DIR, env=env, check=True, capture_output=True, text=True,
+        ).stdout.strip().splitlines()[-1]
+
+        servers = {
+            'WSGI': [sys.executable, '-m', 'gunicorn', 'rasa_project.wsgi:application', '--workers', '1',
+                     '--worker-class', 'gthread', '--threads', str(args.threads), '--bind', '127.0.0.1:{port}'],
+            'ASGI': [sys.executable, '-m', 'uvicorn', 'rasa_project.asgi:application', '--workers', '1',
+                     '--lifespan', 'off', '--no-access-log', '--log-level', 'warning', '--host', '127.0.0.1',
+                     '--port', '{port}'],
+        }
+        results = {}
+        for server, command in servers.items():
+            port = free_port()
+            process = subprocess.Popen(
+                [part.format(port=port) for part in command], cwd=BASE_DIR, env=env,
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+            try:
+                wait_for(port, process)
+                for name, (wsgi_path, asgi_path, make_body) in ENDPOINTS.items():
+                    path = wsgi_path if server == 'WSGI' else asgi_path
+                    await load(port, path, make_body, token, min(args.concurrency, 8), 1)  # warm up
+                    results[server, name] = await load(port, path, make_body, token, args.concurrency, args.duration)
+            finally:
+                process.terminate()
+                process.wait()
+    stub.close()
+
+    print(f'{args.concurrency} connections, {args.duration}s per endpoint, gunicorn gthread x{args.threads}, '
+          f'S3 latency {args.s3_latency:.0f} ms')
+    for name in ENDPOINTS:
+        for server in servers:
+            result = results[server, name]
+            print(f"{name:<11} {server}  {result['requests_per_s']:8.1f} req/s  p50 {result['p50_ms'] or 0:7.1f} ms  "
+                  f"p95 {result['p95_ms'] or 0:7.1f} ms  errors {result['errors']}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--threads', type=int, default=8, help='gunicorn threads per worker')
+    parser.add_argument('--s3-latency', type=float, default=30, help='milliseconds per S3 request')
+    asyncio.run(main(parser.parse_args()))
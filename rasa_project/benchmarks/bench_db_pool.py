@@ -0,0 +1,127 @@
+"""
+Benchmark: check-if-audio-hash/ throughput with and without connection pooling.
+
+Runs the WSGI application in-process, as a gunicorn worker with ``threads``
+threads would, so every request goes through Django's request_finished
+handling and closes (or returns) its database connection. The hash filter is
+disabled so that every request queries the database. Each configuration runs
+in its own interpreter, against a throwaway test database on the configured
+DATABASE_URL; pooling needs a MySQL or PostgreSQL one.
+
+    python benchmarks/bench_db_pool.py [requests] [threads]
+"""
+import io
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run(requests, threads):
+    sys.path.insert(0, BASE_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'rasa_project.settings')
+
+    import django
+
+    django.setup()
+
+    from django.conf import settings
+    from django.core.wsgi import get_wsgi_application
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+    from rest_framework_simplejwt.tokens import RefreshToken
+
+    from audio_app.models import MyAudioFile
+    from auth_app.models import CustomUser
+    from rasa_project.db.pool import pool_stats
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        user = CustomUser.objects.create_user(username='bench', email='bench@example.com', password='benchmark-password')
+        MyAudioFile.objects.create(contributor=user, file_hash='A' * 40, s3_key='1/audio/a', file_name='a.mp3')
+        token = str(RefreshToken.for_user(user).access_token)
+        connection.close()
+        application = get_wsgi_application()
+
+        def call(hash_value):
+            body = json.dumps({'hash': hash_value}).encode()
+            environ = {
+                'REQUEST_METHOD': 'POST', 'PATH_INFO': '/api/audio/check-if-audio-hash/',
+                'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'HTTP_HOST': 'testserver',
+                'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(body), 'wsgi.errors': sys.stderr,
+                'CONTENT_TYPE': 'application/json', 'CONTENT_LENGTH': str(len(body)),
+                'HTTP_AUTHORIZATION': f'Bearer {token}',
+            }
+            statuses = []
+            response = application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+            try:
+                b''.join(response)
+            finally:
+                response.close()
+            if not statuses[0].startswith('200'):
+                raise RuntimeError(f'check-if-audio-hash/ answered {statuses[0]}')
+
+        latencies = []
+
+        def worker(count):
+            timings = []
+            for i in range(count):
+                start = time.perf_counter()
+                call('A' * 40 if i % 2 else f'{i:040X}')
+                timings.append(time.perf_counter() - start)
+            latencies.extend(timings)
+
+        for _ in range(threads):
+            call('A' * 40)
+        pool = [threading.Thread(target=worker, args=(requests // threads,)) for _ in range(threads)]
+        start = time.perf_counter()
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    latencies.sort()
+    print(json.dumps({
+        'engine': settings.DATABASES['default']['ENGINE'],
+        'requests_per_s': len(latencies) / elapsed,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p95_ms': latencies[int(len(latencies) * 0.95)] * 1000,
+        'pools': pool_stats(),
+    }))
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    results = {}
+    for label, pool_size in (('no pool', 0), (f'pool of {threads}', threads)):
+        env = dict(os.environ, DB_POOL_MAX_SIZE=str(pool_size), AUDIO_HASH_FILTER_ENABLED='False')
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--run', str(requests), str(threads)],
+            env=env, cwd=BASE_DIR, check=True, capture_output=True, text=True,
+        ).stdout
+        results[label] = json.loads(output.strip().splitlines()[-1])
+
+    for label, result in results.items():
+        print(f"{label:<12} {result['engine']:<36} {result['requests_per_s']:8.1f} req/s  "
+              f"p50 {result['p50_ms']:6.2f} ms  p95 {result['p95_ms']:6.2f} ms")
+        for alias, stats in result['pools'].items():
+            print(f"{'':<12} {alias}: created {stats['created']}, reused {stats['reused']}, "
+                  f"waits {stats['waits']}, failed checks {stats['failed_checks']}")
+    baseline, pooled = results.values()
+    print(f"speedup:     {pooled['requests_per_s'] / baseline['requests_per_s']:8.2f}x")
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--run']:
+        run(int(sys.argv[2]), int(sys.argv[3]))
+    else:
+        main()
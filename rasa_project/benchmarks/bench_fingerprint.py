@@ -0,0 +1,51 @@
+"""
+Benchmark: CPU cost of audio fingerprinting, in CPU-seconds per hour of audio.
+
+Synthesises a tone-and-noise signal at the fingerprinting sample rate, so no
+audio files or ffmpeg are needed.
+
+    python benchmarks/bench_fingerprint.py [seconds_of_audio]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'rasa_project.settings')
+
+import django
+
+django.setup()
+
+import numpy as np
+
+from audio_app.fingerprint import SAMPLE_RATE, fingerprint_samples
+
+
+def synthetic_audio(seconds, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    # A new random chord every half second over a noise floor.
+    notes = rng.uniform(80, 4000, size=(int(seconds * 2) + 1, 4))
+    freqs = notes[(t * 2).astype(int)]
+    signal = np.sin(2 * np.pi * freqs * t[:, None]).sum(axis=1)
+    return (signal * 4000 + rng.normal(0, 200, t.size)).astype(np.float32)
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 600
+    samples = synthetic_audio(seconds)
+    fingerprint_samples(samples[:SAMPLE_RATE * 5])
+
+    start = time.process_time()
+    hashes, offsets = fingerprint_samples(samples)
+    cpu = time.process_time() - start
+
+    print(f'audio:              {seconds:10.0f} s')
+    print(f'fingerprints:       {len(hashes):10d} ({len(hashes) / seconds:.0f}/s of audio)')
+    print(f'cpu time:           {cpu:10.2f} s')
+    print(f'cpu s / audio hour: {cpu * 3600 / seconds:10.2f}')
+
+
+if __name__ == '__main__':
+    main()
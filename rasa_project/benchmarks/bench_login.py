@@ -0,0 +1,69 @@
+"""
+Micro-benchmark: the login serializer.
+
+Compares the original ``UserTokenObtainPairSerializer.validate`` (which checks
+the password itself and then again through ``authenticate()`` in every
+authentication backend) with the current single-hash path. Runs against a
+throwaway test database with the configured ``PASSWORD_HASHERS``.
+
+    python benchmarks/bench_login.py [iterations]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'rasa_project.settings')
+
+import django
+
+django.setup()
+
+from django.db import connection
+from django.test.utils import setup_test_environment
+from rest_framework.exceptions import ValidationError
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+
+from auth_app.models import CustomUser
+from auth_app.serializers import UserTokenObtainPairSerializer
+
+
+class LegacyUserTokenObtainPairSerializer(UserTokenObtainPairSerializer):
+
+    def validate(self, attrs):
+        user = CustomUser.objects.filter(email=attrs.get('email', '')).first()
+        if user is None:
+            raise ValidationError({'email': 'No user found with this email.'})
+        if not user.check_password(attrs.get('password', '')):
+            raise ValidationError({'password': 'Invalid password.'})
+        if not user.is_verified:
+            raise ValidationError({'account': 'Please activate your account.'})
+        return TokenObtainPairSerializer.validate(self, attrs)
+
+
+def bench(serializer_class, iterations):
+    data = {'email': 'bench@example.com', 'password': 'benchmark-password'}
+    serializer_class(data=data).is_valid(raise_exception=True)
+    start = time.process_time()
+    for _ in range(iterations):
+        serializer_class(data=data).is_valid(raise_exception=True)
+    return (time.process_time() - start) / iterations
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        CustomUser.objects.create_user(email='bench@example.com', password='benchmark-password', is_verified=True)
+        legacy = bench(LegacyUserTokenObtainPairSerializer, iterations)
+        current = bench(UserTokenObtainPairSerializer, iterations)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+    print(f'legacy (hash per backend): {legacy * 1e3:8.1f} ms CPU/login  {1 / legacy:8.1f} logins/s/core')
+    print(f'single hash:               {current * 1e3:8.1f} ms CPU/login  {1 / current:8.1f} logins/s/core')
+    print(f'speedup:                   {legacy / current:8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
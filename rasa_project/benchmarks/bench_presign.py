@@ -0,0 +1,58 @@
+"""
+Micro-benchmark: presigned PUT URL generation.
+
+Compares the original ``generate_s3_signed_url`` (a new boto3 client per call)
+with the shared ``S3Presigner``. No network access is needed.
+
+    python benchmarks/bench_presign.py [iterations]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'rasa_project.settings')
+
+import django
+
+django.setup()
+
+import boto3
+from django.conf import settings
+
+from audio_app.utils import generate_s3_signed_url
+
+
+def legacy_generate_s3_signed_url(file_path, content_type, expiration=3600):
+    s3_client = boto3.client(
+        's3',
+        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+        region_name=settings.AWS_S3_REGION_NAME
+    )
+    return s3_client.generate_presigned_url(
+        'put_object',
+        Params={'Bucket': settings.AWS_STORAGE_BUCKET_NAME, 'Key': file_path, 'ContentType': content_type},
+        ExpiresIn=expiration
+    )
+
+
+def bench(func, iterations):
+    func('1/audio/warmup.mp3', 'audio/mpeg')
+    start = time.perf_counter()
+    for i in range(iterations):
+        func(f'1/audio/track-{i}.mp3_20240101000000/audio/mpeg', 'audio/mpeg')
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    legacy = bench(legacy_generate_s3_signed_url, iterations)
+    current = bench(generate_s3_signed_url, iterations)
+    print(f'legacy (client per call): {legacy * 1e6:10.1f} us/url')
+    print(f'shared presigner:         {current * 1e6:10.1f} us/url')
+    print(f'speedup:                  {legacy / current:10.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+from contextlib import contextmanager
+
+from ..pool import PoolTimeout, get_pool
+
+
+class PooledDatabaseWrapperMixin:
+    """
+    Takes connections from the alias's ``ConnectionPool`` instead of opening
+    them, and gives them back instead of closing them. A reused connection
+    keeps the session state ``init_connection_state()`` set when it was
+    opened, so that is skipped for it.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool_reused = False
+
+    @property
+    def pool(self):
+        return get_pool(self.alias, self.settings_dict)
+
+    def get_new_connection(self, conn_params):
+        connect = super().get_new_connection
+        try:
+            connection, self.pool_reused = self.pool.acquire(lambda: connect(conn_params), self.pool_check)
+        except PoolTimeout as e:
+            raise self.Database.OperationalError(str(e)) from e
+        if self.pool_reused:
+            self.pool_reuse(connection)
+        return connection
+
+    def init_connection_state(self):
+        if not self.pool_reused:
+            super().init_connection_state()
+
+    def _close(self):
+        if self.connection is None:
+            return
+        # A connection closed inside atomic() or with autocommit off may be
+        # mid-transaction; it is closed rather than handed to someone else.
+        with self.wrap_database_errors:
+            self.pool.release(
+                self.connection,
+                discard=self.in_atomic_block or not self.autocommit,
+                check=self.errors_occurred,
+            )
+
+    @contextmanager
+    def _nodb_cursor(self):
+        # Used to create, clone and drop (test) databases, which the server
+        # refuses while pooled connections to them are open.
+        self.pool.close_all()
+        with super()._nodb_cursor() as cursor:
+            yield cursor
+
+    def pool_check(self, connection):
+        """Raise if ``connection`` can no longer be used."""
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+
+    def pool_reuse(self, connection):
+        """Set up the wrapper for ``connection`` coming from the pool rather than a new connect."""
@@ -0,0 +1,10 @@
+from django.db.backends.mysql import base
+
+from ..base import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+
+    def pool_check(self, connection):
+        # mysqlclient and PyMySQL both answer a COM_PING without reconnecting.
+        connection.ping()
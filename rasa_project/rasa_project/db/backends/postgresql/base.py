@@ -0,0 +1,20 @@
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.psycopg_any import IsolationLevel
+
+from ..base import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+
+    def pool_check(self, connection):
+        if connection.closed:
+            raise self.Database.InterfaceError('connection already closed')
+        super().pool_check(connection)
+
+    def pool_reuse(self, connection):
+        # The parent sets this before connecting; the connection itself
+        # already has the configured level.
+        isolation_level = self.settings_dict['OPTIONS'].get('isolation_level')
+        self.isolation_level = (
+            IsolationLevel.READ_COMMITTED if isolation_level is None else IsolationLevel(isolation_level)
+        )
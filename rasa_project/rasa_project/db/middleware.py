@@ -0,0 +1,51 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+
+from .routers import begin_request, end_request, primary_pins, resolved_user_id
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Scopes ``ReplicaRouter`` decisions to the request, and pins the user's
+    reads to the primary for a while after a request of theirs wrote.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = begin_request(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            state = end_request(token)
+        user_id = self.writer(request, state)
+        if user_id is not None:
+            primary_pins.pin(user_id)
+        return response
+
+    async def __acall__(self, request):
+        token = begin_request(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            state = end_request(token)
+        user_id = self.writer(request, state)
+        if user_id is not None:
+            if settings.DATABASE_PIN_CACHE_ALIAS:
+                await sync_to_async(primary_pins.pin)(user_id)
+            else:
+                primary_pins.pin(user_id)
+        return response
+
+    @staticmethod
+    def writer(request, state):
+        """The id of the authenticated user whose request wrote, if it did."""
+        # DRF copies the user it authenticated onto the Django request.
+        return resolved_user_id(request) if state.wrote else None
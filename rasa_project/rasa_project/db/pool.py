@@ -0,0 +1,258 @@
+"""
+Database connection pooling.
+
+Django opens a new database connection for every request (or keeps one per
+thread with CONN_MAX_AGE). The pooled backends in ``rasa_project.db.backends``
+instead hand a connection back to a per-process ``ConnectionPool`` when Django
+closes it, and take one from the pool when Django connects. A connection that
+sat idle for more than ``ping_after`` seconds, or whose last user saw a
+database error, is health-checked before it is handed out again.
+
+Only connections released in autocommit mode, outside of ``atomic()``, are
+kept; anything else may carry an open transaction and is closed. Session
+state set with raw SQL (temporary tables, session variables) survives a
+checkout, as it does with CONN_MAX_AGE.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class _Entry:
+    __slots__ = ('connection', 'created_at', 'released_at', 'needs_check')
+
+    def __init__(self, connection, now):
+        self.connection = connection
+        self.created_at = now
+        self.released_at = now
+        self.needs_check = False
+
+
+def _close(connection):
+    try:
+        connection.close()
+    except Exception as e:
+        logger.warning(f"Error closing pooled database connection: {e}")
+
+
+class ConnectionPool:
+    """
+    At most ``max_size`` open connections, handed out most recently used
+    first so that surplus ones go idle and are closed after ``max_idle``
+    seconds. Connections older than ``max_lifetime`` seconds are closed when
+    they come back. ``acquire`` waits up to ``timeout`` seconds for a free
+    slot and then raises ``PoolTimeout``.
+    """
+
+    def __init__(self, max_size, max_idle=300, max_lifetime=3600, timeout=10, ping_after=1):
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self._cond = threading.Condition()
+        self._idle = deque()  # least recently released first
+        self._in_use = {}  # id(connection) -> _Entry
+        self._size = 0  # idle + in use + being opened
+        self.created = 0
+        self.reused = 0
+        self.closed_idle = 0
+        self.closed_lifetime = 0
+        self.discarded = 0
+        self.failed_checks = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.wait_ms = 0.0
+
+    def _evict_idle(self, now):
+        """Remove connections idle for longer than ``max_idle``; the caller closes them."""
+        evicted = []
+        while self._idle and now - self._idle[0].released_at > self.max_idle:
+            evicted.append(self._idle.popleft())
+        self._size -= len(evicted)
+        self.closed_idle += len(evicted)
+        if evicted:
+            self._cond.notify(len(evicted))
+        return evicted
+
+    def acquire(self, connect, check):
+        """
+        Return ``(connection, reused)``: an idle connection that passed
+        ``check(connection)`` when one was due, or else a new one from
+        ``connect()``. ``check`` raises if the connection is unusable.
+        """
+        started = time.monotonic()
+        waited = False
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    stale = self._evict_idle(now)
+                    entry = self._idle.pop() if self._idle else None
+                    if entry is not None or self._size < self.max_size:
+                        break
+                    if not waited:
+                        waited = True
+                        self.waits += 1
+                    remaining = started + self.timeout - now
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise PoolTimeout(
+                            f"No database connection became free within {self.timeout}s "
+                            f"({self.max_size} in use)"
+                        )
+                    self._cond.wait(remaining)
+                if entry is None:
+                    self._size += 1
+                else:
+                    self._in_use[id(entry.connection)] = entry
+                if waited:
+                    self.wait_ms += (now - started) * 1000
+            for old in stale:
+                _close(old.connection)
+
+            if entry is None:
+                try:
+                    connection = connect()
+                except BaseException:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._in_use[id(connection)] = _Entry(connection, time.monotonic())
+                    self.created += 1
+                return connection, False
+
+            if entry.needs_check or now - entry.released_at > self.ping_after:
+                try:
+                    check(entry.connection)
+                except Exception as e:
+                    logger.info(f"Discarding pooled database connection that failed its health check: {e}")
+                    with self._cond:
+                        self.failed_checks += 1
+                    self._remove(entry.connection)
+                    continue
+            entry.needs_check = False
+            with self._cond:
+                self.reused += 1
+            return entry.connection, True
+
+    def release(self, connection, discard=False, check=False):
+        """
+        Return ``connection`` to the pool, or close it if ``discard`` is set or
+        it has outlived ``max_lifetime``. ``check`` forces a health check on
+        its next checkout.
+        """
+        now = time.monotonic()
+        with self._cond:
+            entry = self._in_use.pop(id(connection), None)
+            if entry is None:
+                # Not ours, e.g. opened before the pool was reset after a fork.
+                pass
+            elif discard or now - entry.created_at > self.max_lifetime:
+                if discard:
+                    self.discarded += 1
+                else:
+                    self.closed_lifetime += 1
+                self._size -= 1
+                self._cond.notify()
+                entry = None
+            else:
+                entry.released_at = now
+                entry.needs_check = check
+                self._idle.append(entry)
+                self._cond.notify()
+            stale = self._evict_idle(now)
+        if entry is None:
+            _close(connection)
+        for old in stale:
+            _close(old.connection)
+
+    def _remove(self, connection):
+        """Close a checked-out ``connection`` and free its slot."""
+        with self._cond:
+            if self._in_use.pop(id(connection), None) is not None:
+                self._size -= 1
+                self._cond.notify()
+        _close(connection)
+
+    def close_all(self):
+        """Close every idle connection. Checked-out ones are closed or kept when released."""
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+            self._size -= len(idle)
+            self._cond.notify(len(idle))
+        for entry in idle:
+            _close(entry.connection)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'max_size': self.max_size,
+                'size': self._size,
+                'in_use': len(self._in_use),
+                'idle': len(self._idle),
+                'created': self.created,
+                'reused': self.reused,
+                'closed_idle': self.closed_idle,
+                'closed_lifetime': self.closed_lifetime,
+                'discarded': self.discarded,
+                'failed_checks': self.failed_checks,
+                'waits': self.waits,
+                'timeouts': self.timeouts,
+                'wait_ms': round(self.wait_ms, 3),
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+_pools_pid = os.getpid()
+
+
+def _pool_key(alias, settings_dict):
+    return (alias, settings_dict['NAME'], settings_dict['HOST'], settings_dict['PORT'], settings_dict['USER'])
+
+
+def get_pool(alias, settings_dict):
+    """
+    The pool for connections made with ``settings_dict``, created from its
+    ``POOL`` options on first use. Pools are per process: a forked child
+    starts with none, leaving the parent's connections alone.
+    """
+    global _pools_pid
+    key = _pool_key(alias, settings_dict)
+    pool = _pools.get(key) if _pools_pid == os.getpid() else None
+    if pool is None:
+        with _pools_lock:
+            if _pools_pid != os.getpid():
+                _pools.clear()
+                _pools_pid = os.getpid()
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = ConnectionPool(**settings_dict.get('POOL', {}))
+    return pool
+
+
+def pool_stats():
+    """
+    Stats of this process's pools, keyed by database alias, or by
+    ``alias:name`` for a pool of a database the alias no longer points at.
+    """
+    if _pools_pid != os.getpid():
+        return {}
+    stats = {}
+    for (alias, name, *_), pool in list(_pools.items()):
+        current = settings.DATABASES.get(alias, {}).get('NAME') == name
+        stats[alias if current else f'{alias}:{name}'] = pool.stats()
+    return stats
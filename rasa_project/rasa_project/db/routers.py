@@ -0,0 +1,273 @@
+"""
+Read-replica routing.
+
+``ReplicaRoutingMiddleware`` gives each request a ``RequestState``. Reads
+of views with ``replica_reads = True`` may go to the ``DATABASE_REPLICAS``,
+as may those of safe-method requests (GET, HEAD, OPTIONS) unless the view
+sets ``replica_reads = False``. ``ReplicaRouter`` sends them to the replica
+chosen at the request's first read, so a request sees one consistent
+snapshot, except:
+
+- once the request has written, and for ``DATABASE_REPLICA_PIN_SECONDS``
+  after a request of the same user wrote, so users read their own writes;
+- inside ``atomic()`` on the primary, or within ``use_primary()``;
+- for sessions, which are read before the user is known.
+
+Reads outside a request (management commands, task workers, threads) and all
+writes go to the primary.
+"""
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.functional import SimpleLazyObject, empty
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# App labels whose reads always go to the primary.
+PRIMARY_APP_LABELS = {'sessions'}
+
+
+class RequestState:
+    __slots__ = ('request', '_use_replicas', 'wrote', 'user_pinned', 'replica')
+
+    def __init__(self, request=None):
+        self.request = request
+        self._use_replicas = None if request is not None else False
+        self.wrote = False
+        self.user_pinned = None  # unknown until the request's user is
+        self.replica = None  # chosen at the first read that may use one
+
+    @property
+    def use_replicas(self):
+        """Whether the request's view may read from replicas; False until its URL is resolved."""
+        if self._use_replicas is None:
+            match = getattr(self.request, 'resolver_match', None)
+            if match is None:
+                return False
+            view_class = getattr(match.func, 'view_class', None)
+            self._use_replicas = getattr(view_class, 'replica_reads', self.request.method in SAFE_METHODS)
+        return self._use_replicas
+
+    @use_replicas.setter
+    def use_replicas(self, value):
+        self._use_replicas = value
+
+
+_request_state = ContextVar('db_request_state', default=None)
+
+
+def begin_request(request):
+    """Start routing for ``request``; returns a token for ``end_request()``."""
+    return _request_state.set(RequestState(request))
+
+
+def end_request(token):
+    """Stop routing for the request started with ``token``; returns its ``RequestState``."""
+    state = _request_state.get()
+    _request_state.reset(token)
+    return state
+
+
+def current_state():
+    return _request_state.get()
+
+
+@contextmanager
+def use_primary():
+    """Send the reads in this block to the primary, e.g. to read a row another user just wrote."""
+    token = _request_state.set(RequestState())
+    try:
+        yield
+    finally:
+        _request_state.reset(token)
+
+
+def resolved_user_id(request):
+    # Only a user that is already resolved: evaluating a lazy one here would
+    # itself read from the database.
+    user = request.__dict__.get('user')
+    if isinstance(user, SimpleLazyObject):
+        user = None if user._wrapped is empty else user._wrapped
+    if user is None or not user.is_authenticated:
+        return None
+    return user.pk
+
+
+class PrimaryPins:
+    """
+    Users whose reads stay on the primary until a deadline: kept in this
+    process, and in the ``DATABASE_PIN_CACHE_ALIAS`` cache when one is
+    configured so that every worker sees them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = {}  # user id -> time.time() deadline
+
+    @staticmethod
+    def _shared():
+        alias = settings.DATABASE_PIN_CACHE_ALIAS
+        return caches[alias] if alias else None
+
+    @staticmethod
+    def _shared_key(user_id):
+        return f'db_pin:{user_id}'
+
+    def pin(self, user_id):
+        seconds = settings.DATABASE_REPLICA_PIN_SECONDS
+        now = time.time()
+        with self._lock:
+            if len(self._local) > 10000:
+                self._local = {key: deadline for key, deadline in self._local.items() if deadline > now}
+            self._local[str(user_id)] = now + seconds
+        shared = self._shared()
+        if shared is not None:
+            shared.set(self._shared_key(user_id), now + seconds, seconds)
+
+    def is_pinned(self, user_id):
+        now = time.time()
+        if self._local.get(str(user_id), 0) > now:
+            return True
+        shared = self._shared()
+        return shared is not None and (shared.get(self._shared_key(user_id)) or 0) > now
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+
+
+primary_pins = PrimaryPins()
+
+
+# Replica lag, in seconds, by vendor; None where the database is not replicating.
+def _postgresql_lag(cursor):
+    cursor.execute(
+        'SELECT CASE WHEN pg_is_in_recovery() '
+        'THEN COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END'
+    )
+    lag = cursor.fetchone()[0]
+    return None if lag is None else float(lag)
+
+
+def _mysql_lag(cursor):
+    cursor.execute('SHOW REPLICA STATUS')
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    columns = [column[0] for column in cursor.description]
+    lag = row[columns.index('Seconds_Behind_Source')]
+    if lag is None:
+        raise RuntimeError('replication is not running')
+    return float(lag)
+
+
+LAG_QUERIES = {
+    'postgresql': _postgresql_lag,
+    'mysql': _mysql_lag,
+}
+
+
+class ReplicaLag:
+    """
+    Last measured lag of each replica, refreshed every
+    ``DATABASE_REPLICA_LAG_REFRESH`` seconds by whichever read finds it stale.
+    A replica that cannot be measured counts as infinitely far behind.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._lags = {}
+        self._measured_at = None
+
+    def measure(self, alias):
+        measure = LAG_QUERIES.get(connections[alias].vendor)
+        if measure is None:
+            return 0.0
+        try:
+            with connections[alias].cursor() as cursor:
+                lag = measure(cursor)
+        except Exception as e:
+            logger.warning(f"Could not measure the replication lag of {alias}: {e}")
+            return float('inf')
+        return 0.0 if lag is None else lag
+
+    def get(self, replicas):
+        now = time.monotonic()
+        stale = self._measured_at is None or now - self._measured_at > settings.DATABASE_REPLICA_LAG_REFRESH
+        # One request measures; the others use the previous values meanwhile.
+        if stale and self._lock.acquire(blocking=self._measured_at is None):
+            try:
+                self._lags = {alias: self.measure(alias) for alias in replicas}
+                self._measured_at = time.monotonic()
+            finally:
+                self._lock.release()
+        return self._lags
+
+    def reset(self):
+        with self._lock:
+            self._lags, self._measured_at = {}, None
+
+
+replica_lag = ReplicaLag()
+_round_robin = itertools.count()
+
+
+def choose_replica(replicas):
+    """The replica to read from, or None if all are too far behind."""
+    if settings.DATABASE_REPLICA_SELECTION == 'least_lag':
+        lags = replica_lag.get(replicas)
+        alias = min(replicas, key=lambda alias: lags.get(alias, float('inf')))
+        return alias if lags.get(alias, float('inf')) <= settings.DATABASE_REPLICA_MAX_LAG else None
+    return replicas[next(_round_robin) % len(replicas)]
+
+
+class ReplicaRouter:
+    """Writes and migrations go to the primary; reads as described in the module docstring."""
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas:
+            return None
+        state = _request_state.get()
+        if (
+            state is None or not state.use_replicas or state.wrote
+            or model._meta.app_label in PRIMARY_APP_LABELS
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        if state.user_pinned is None:
+            user_id = resolved_user_id(state.request)
+            if user_id is not None:
+                state.user_pinned = primary_pins.is_pinned(user_id)
+        if state.user_pinned:
+            return DEFAULT_DB_ALIAS
+        if state.replica is None:
+            state.replica = choose_replica(replicas) or DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the schema through replication.
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
@@ -0,0 +1,148 @@
+"""
+OpenAPI schema views.
+
+Generating the schema walks every view and re-runs the ``swagger_auto_schema``
+introspection, so outside of ``OPENAPI_SCHEMA_LIVE`` (on by default with
+DEBUG) the documents are rendered once, by ``manage.py build_openapi_schema``
+at deploy time or on the first request otherwise, and served as static bytes
+with an ETag.
+"""
+import hashlib
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+from drf_yasg import openapi
+from drf_yasg.codecs import OpenAPICodecJson, OpenAPICodecYaml
+from drf_yasg.views import get_schema_view
+from rest_framework import permissions
+
+logger = logging.getLogger(__name__)
+
+API_INFO = openapi.Info(
+    title="My API",
+    default_version='v1',
+    description="My API description",
+    terms_of_service="https://www.example.com/terms/",
+    contact=openapi.Contact(email="contact@example.com"),
+    license=openapi.License(name="Awesome License"),
+)
+
+schema_view = get_schema_view(
+    API_INFO,
+    public=True,
+    permission_classes=(permissions.AllowAny,),
+)
+
+# Artifact format -> (codec, content type)
+SCHEMA_FORMATS = {
+    'json': (OpenAPICodecJson, 'application/json'),
+    'yaml': (OpenAPICodecYaml, 'application/yaml'),
+}
+
+
+def render_schema(schema_format):
+    """Generate the public schema and encode it as ``schema_format`` bytes."""
+    generator = schema_view.generator_class(API_INFO)
+    codec_class, _ = SCHEMA_FORMATS[schema_format]
+    return codec_class(validators=[]).encode(generator.get_schema(request=None, public=True))
+
+
+def schema_path(schema_format):
+    return os.path.join(settings.OPENAPI_SCHEMA_DIR, f'openapi.{schema_format}')
+
+
+def write_schema(schema_format):
+    """Render ``schema_format`` to its artifact file, replacing it atomically. Returns the path and bytes."""
+    body = render_schema(schema_format)
+    path = schema_path(schema_format)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(body)
+    os.replace(tmp_path, path)
+    return path, body
+
+
+class SchemaArtifact:
+    """
+    The rendered schema in one format, read from ``OPENAPI_SCHEMA_DIR`` and
+    re-read when the file changes. Without a built file the schema is
+    rendered once in this process and kept.
+    """
+
+    def __init__(self, schema_format):
+        self.schema_format = schema_format
+        self._lock = threading.Lock()
+        self._state = (None, None, None)  # (file mtime, body, etag)
+
+    def get(self):
+        path = schema_path(self.schema_format)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = 'rendered'
+        if self._state[0] == mtime:
+            return self._state[1:]
+        with self._lock:
+            if self._state[0] != mtime:
+                if mtime == 'rendered':
+                    logger.warning(f"{path} not found; rendering the OpenAPI schema in process (run build_openapi_schema)")
+                    body = render_schema(self.schema_format)
+                else:
+                    with open(path, 'rb') as f:
+                        body = f.read()
+                self._state = (mtime, body, f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+        return self._state[1:]
+
+    def etag(self, request, *args, **kwargs):
+        return self.get()[1]
+
+
+schema_artifacts = {schema_format: SchemaArtifact(schema_format) for schema_format in SCHEMA_FORMATS}
+
+
+def _prebuilt_view(schema_format, content_type=None):
+    artifact = schema_artifacts[schema_format]
+
+    @condition(etag_func=artifact.etag)
+    def view(request, *args, **kwargs):
+        body, _ = artifact.get()
+        response = HttpResponse(body, content_type=content_type or SCHEMA_FORMATS[schema_format][1])
+        patch_cache_control(response, public=True, max_age=settings.OPENAPI_SCHEMA_MAX_AGE)
+        return response
+
+    return view
+
+
+def schema_document(schema_format):
+    """View serving the bare schema as ``schema_format``."""
+    live = schema_view.without_ui(cache_timeout=0)
+    prebuilt = _prebuilt_view(schema_format)
+
+    def view(request, *args, **kwargs):
+        if settings.OPENAPI_SCHEMA_LIVE:
+            return live(request, format=f'.{schema_format}')
+        return prebuilt(request)
+
+    return view
+
+
+def schema_ui(renderer):
+    """
+    View serving the ``renderer`` UI page. The page fetches its schema from
+    ``?format=openapi`` on the same URL, which is answered from the artifact.
+    """
+    live = schema_view.with_ui(renderer, cache_timeout=0)
+    prebuilt = _prebuilt_view('json', content_type='application/openapi+json')
+
+    def view(request, *args, **kwargs):
+        if request.GET.get('format') == 'openapi' and not settings.OPENAPI_SCHEMA_LIVE:
+            return prebuilt(request)
+        return live(request, *args, **kwargs)
+
+    return view
@@ -1,6 +1,6 @@
 from datetime import timedelta
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 import dj_database_url
 import os
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -46,6 +46,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'rasa_project.db.middleware.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -86,6 +87,55 @@ DATABASES = {
 	"default": dj_database_url.parse(config('DATABASE_URL'))
 }
 
+# Read replicas, as a comma-separated list of database URLs. They are added as
+# replica_1, replica_2, ... and serve the reads of safe-method requests and of
+# views marked replica_reads (see rasa_project.db.routers)
+DATABASE_REPLICA_URLS = config('DATABASE_REPLICA_URLS', default='', cast=Csv())
+DATABASE_REPLICAS = []
+for index, url in enumerate(DATABASE_REPLICA_URLS, start=1):
+    DATABASES[f'replica_{index}'] = dict(dj_database_url.parse(url), TEST={'MIRROR': 'default'})
+    DATABASE_REPLICAS.append(f'replica_{index}')
+DATABASE_ROUTERS = ['rasa_project.db.routers.ReplicaRouter']
+# How each request picks its replica: 'round_robin', or 'least_lag' to prefer the one furthest along
+DATABASE_REPLICA_SELECTION = config('DATABASE_REPLICA_SELECTION', default='round_robin')
+# With least_lag: replicas further behind than this many seconds are skipped,
+# and lag is re-measured this often
+DATABASE_REPLICA_MAX_LAG = config('DATABASE_REPLICA_MAX_LAG', default=30, cast=float)
+DATABASE_REPLICA_LAG_REFRESH = config('DATABASE_REPLICA_LAG_REFRESH', default=5, cast=float)
+# Seconds a user's reads stay on the primary after a request of theirs wrote;
+# set DATABASE_PIN_CACHE_ALIAS to a CACHES alias to share pins between workers
+DATABASE_REPLICA_PIN_SECONDS = config('DATABASE_REPLICA_PIN_SECONDS', default=5, cast=float)
+DATABASE_PIN_CACHE_ALIAS = config('DATABASE_PIN_CACHE_ALIAS', default='')
+
+# Pooled connections for MySQL and PostgreSQL (see rasa_project.db.pool); a
+# DB_POOL_MAX_SIZE of 0 opens a connection per request
+DB_POOL_MAX_SIZE = config('DB_POOL_MAX_SIZE', default=0, cast=int)
+DB_POOL_MAX_IDLE = config('DB_POOL_MAX_IDLE', default=300, cast=float)
+DB_POOL_MAX_LIFETIME = config('DB_POOL_MAX_LIFETIME', default=3600, cast=float)
+DB_POOL_TIMEOUT = config('DB_POOL_TIMEOUT', default=10, cast=float)
+# Seconds a connection may sit idle before it is pinged on checkout
+DB_POOL_PING_AFTER = config('DB_POOL_PING_AFTER', default=1, cast=float)
+POOLED_DB_ENGINES = {
+    'django.db.backends.mysql': 'rasa_project.db.backends.mysql',
+    'django.db.backends.postgresql': 'rasa_project.db.backends.postgresql',
+}
+
+for database in DATABASES.values():
+    if not DB_POOL_MAX_SIZE or database['ENGINE'] not in POOLED_DB_ENGINES:
+        continue
+    database.update(
+        ENGINE=POOLED_DB_ENGINES[database['ENGINE']],
+        # The pool decides when connections are closed.
+        CONN_MAX_AGE=0,
+        POOL={
+            'max_size': DB_POOL_MAX_SIZE,
+            'max_idle': DB_POOL_MAX_IDLE,
+            'max_lifetime': DB_POOL_MAX_LIFETIME,
+            'timeout': DB_POOL_TIMEOUT,
+            'ping_after': DB_POOL_PING_AFTER,
+        },
+    )
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -143,6 +193,17 @@ EMAIL_PORT = 465
 EMAIL_HOST_USER =config('Email_Address')
 EMAIL_HOST_PASSWORD =config('Email_Password')
 
+# Pooled email sending (see auth_app.utils.EmailDispatcher); 0 workers sends inline
+EMAIL_DISPATCHER_WORKERS = config('EMAIL_DISPATCHER_WORKERS', default=2, cast=int)
+EMAIL_DISPATCHER_QUEUE_SIZE = config('EMAIL_DISPATCHER_QUEUE_SIZE', default=1000, cast=int)
+EMAIL_DISPATCHER_BATCH_SIZE = config('EMAIL_DISPATCHER_BATCH_SIZE', default=50, cast=int)
+EMAIL_DISPATCHER_ENQUEUE_TIMEOUT = config('EMAIL_DISPATCHER_ENQUEUE_TIMEOUT', default=5, cast=float)
+EMAIL_DISPATCHER_MAX_RETRIES = config('EMAIL_DISPATCHER_MAX_RETRIES', default=3, cast=int)
+EMAIL_DISPATCHER_RETRY_BACKOFF = config('EMAIL_DISPATCHER_RETRY_BACKOFF', default=2, cast=float)
+EMAIL_DISPATCHER_RETRY_QUEUE_SIZE = config('EMAIL_DISPATCHER_RETRY_QUEUE_SIZE', default=1000, cast=int)
+EMAIL_DISPATCHER_IDLE_TIMEOUT = config('EMAIL_DISPATCHER_IDLE_TIMEOUT', default=30, cast=float)
+EMAIL_DISPATCHER_SHUTDOWN_TIMEOUT = config('EMAIL_DISPATCHER_SHUTDOWN_TIMEOUT', default=10, cast=float)
+
 
 SWAGGER_SETTINGS = {
    'SECURITY_DEFINITIONS': {
@@ -153,9 +214,15 @@ SWAGGER_SETTINGS = {
       }
    }}
 
+# Outside of live mode the OpenAPI schema is served from files written by
+# `manage.py build_openapi_schema` (see rasa_project.schema)
+OPENAPI_SCHEMA_LIVE = config('OPENAPI_SCHEMA_LIVE', default=DEBUG, cast=bool)
+OPENAPI_SCHEMA_DIR = config('OPENAPI_SCHEMA_DIR', default=os.path.join(BASE_DIR, 'var', 'openapi'))
+OPENAPI_SCHEMA_MAX_AGE = config('OPENAPI_SCHEMA_MAX_AGE', default=300, cast=int)
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'auth_app.authentication.CachedJWTAuthentication',
         # other authentication classes...
     ),
 }
@@ -166,6 +233,12 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=365),     # Adjust as needed
 }
 
+# Users resolved from JWTs are cached per process (see auth_app.authentication);
+# set AUTH_USER_CACHE_ALIAS to a CACHES alias to share them between workers too
+AUTH_USER_CACHE_TTL = config('AUTH_USER_CACHE_TTL', default=300, cast=int)
+AUTH_USER_CACHE_SIZE = config('AUTH_USER_CACHE_SIZE', default=10000, cast=int)
+AUTH_USER_CACHE_ALIAS = config('AUTH_USER_CACHE_ALIAS', default='')
+
 
 STATIC_URL = '/static/'
 
@@ -182,3 +255,69 @@ AWS_SECRET_ACCESS_KEY = config('AWS_SECRET_ACCESS_KEY')
 AWS_STORAGE_BUCKET_NAME = config('AWS_STORAGE_BUCKET_NAME')
 AWS_S3_REGION_NAME = config('AWS_S3_REGION_NAME')
 AWS_S3_CUSTOM_DOMAIN = f"{AWS_STORAGE_BUCKET_NAME}.s3.amazonaws.com"
+# Set to point S3 calls at a stand-in such as MinIO or moto
+AWS_S3_ENDPOINT_URL = config('AWS_S3_ENDPOINT_URL', default=None)
+
+# S3 key layout for uploads sent with their hash: 'content' uploads them to
+# staging/{user_id}/{uuid} and moves them to {h[0:2]}/{h[2:4]}/{algorithm}/{hex digest}
+# once verification has checked the hash, 'user' stores them under {user_id}/audio/
+AUDIO_S3_KEY_LAYOUT = config('AUDIO_S3_KEY_LAYOUT', default='content')
+# Concurrent HEAD requests used to find already-stored, verified content
+AUDIO_S3_HEAD_WORKERS = config('AUDIO_S3_HEAD_WORKERS', default=8, cast=int)
+# Threads shared by the async views for blocking S3 requests (see audio_app.s3)
+AUDIO_S3_IO_THREADS = config('AUDIO_S3_IO_THREADS', default=32, cast=int)
+# Serve the async endpoints under /api/audio/async/ for ASGI servers; off
+# until benchmarks/bench_asgi.py shows them beating the WSGI views
+AUDIO_ASYNC_VIEWS = config('AUDIO_ASYNC_VIEWS', default=False, cast=bool)
+
+# Maximum number of hashes accepted by a single batch hash-existence request
+AUDIO_HASH_BATCH_LIMIT = config('AUDIO_HASH_BATCH_LIMIT', default=1000, cast=int)
+# Maximum number of files accepted by a single batch presign request
+AUDIO_PRESIGN_BATCH_LIMIT = config('AUDIO_PRESIGN_BATCH_LIMIT', default=500, cast=int)
+# Maximum number of records accepted by a single batch store request
+AUDIO_STORE_BATCH_LIMIT = config('AUDIO_STORE_BATCH_LIMIT', default=1000, cast=int)
+# Seconds a reserved but unfinished upload blocks its hash; also the lifetime of its upload URL
+AUDIO_UPLOAD_RESERVATION_TTL = config('AUDIO_UPLOAD_RESERVATION_TTL', default=3600, cast=int)
+# Look hashes up by the binary digest column instead of file_hash; enable once
+# backfill_audio_digests has run
+AUDIO_HASH_LOOKUP_BY_DIGEST = config('AUDIO_HASH_LOOKUP_BY_DIGEST', default=False, cast=bool)
+# Default and maximum page sizes of the my-uploads listing
+AUDIO_UPLOADS_PAGE_SIZE = config('AUDIO_UPLOADS_PAGE_SIZE', default=50, cast=int)
+AUDIO_UPLOADS_PAGE_MAX = config('AUDIO_UPLOADS_PAGE_MAX', default=500, cast=int)
+# Maximum number of multipart part URLs presigned per request
+AUDIO_MULTIPART_PART_URL_BATCH_LIMIT = config('AUDIO_MULTIPART_PART_URL_BATCH_LIMIT', default=100, cast=int)
+
+# In-process Bloom filter in front of the audio hash lookup (see audio_app.hash_filter)
+AUDIO_HASH_FILTER_ENABLED = config('AUDIO_HASH_FILTER_ENABLED', default=True, cast=bool)
+AUDIO_HASH_FILTER_PATH = config('AUDIO_HASH_FILTER_PATH', default=os.path.join(BASE_DIR, 'var', 'audio_hash_filter.bin'))
+AUDIO_HASH_FILTER_CAPACITY = config('AUDIO_HASH_FILTER_CAPACITY', default=1000000, cast=int)
+AUDIO_HASH_FILTER_ERROR_RATE = config('AUDIO_HASH_FILTER_ERROR_RATE', default=0.01, cast=float)
+AUDIO_HASH_FILTER_REFRESH_SECONDS = config('AUDIO_HASH_FILTER_REFRESH_SECONDS', default=30, cast=int)
+
+# Server-side verification of uploaded objects against their claimed hash (see audio_app.verification);
+# it is also what moves staged uploads to their content-addressed keys
+AUDIO_VERIFY_ON_STORE = config('AUDIO_VERIFY_ON_STORE', default=True, cast=bool)
+AUDIO_VERIFY_RANGE_WORKERS = config('AUDIO_VERIFY_RANGE_WORKERS', default=4, cast=int)
+AUDIO_VERIFY_CHUNK_SIZE = config('AUDIO_VERIFY_CHUNK_SIZE', default=8 * 1024 * 1024, cast=int)
+
+# Streaming ffmpeg decode used for fingerprinting (see audio_app.decoding)
+AUDIO_FFMPEG_BINARY = config('AUDIO_FFMPEG_BINARY', default='ffmpeg')
+AUDIO_DECODE_READ_SIZE = config('AUDIO_DECODE_READ_SIZE', default=256 * 1024, cast=int)
+
+# Fingerprint matching: postings per hash above which a hash is ignored, and minimum aligned votes for a match
+AUDIO_MATCH_MAX_FANOUT = config('AUDIO_MATCH_MAX_FANOUT', default=1000, cast=int)
+AUDIO_MATCH_MIN_SCORE = config('AUDIO_MATCH_MIN_SCORE', default=5, cast=int)
+# Memory-mapped fingerprint index written by the build_fingerprint_index command
+AUDIO_FINGERPRINT_INDEX_DIR = config('AUDIO_FINGERPRINT_INDEX_DIR', default=os.path.join(BASE_DIR, 'var', 'fingerprint_index'))
+AUDIO_FINGERPRINT_INDEX_RELOAD_SECONDS = config('AUDIO_FINGERPRINT_INDEX_RELOAD_SECONDS', default=30, cast=int)
+AUDIO_FINGERPRINT_INDEX_MAX_DELTAS = config('AUDIO_FINGERPRINT_INDEX_MAX_DELTAS', default=8, cast=int)
+
+# Background task queue run by the run_audio_worker command (see audio_app.tasks).
+# Pool workers renew the locks of running tasks every third of the visibility
+# timeout; inline workers (--processes 0) cannot, so there the visibility
+# timeout must exceed the task timeout.
+AUDIO_FINGERPRINT_ON_STORE = config('AUDIO_FINGERPRINT_ON_STORE', default=True, cast=bool)
+AUDIO_TASK_MAX_ATTEMPTS = config('AUDIO_TASK_MAX_ATTEMPTS', default=3, cast=int)
+AUDIO_TASK_TIMEOUT = config('AUDIO_TASK_TIMEOUT', default=900, cast=int)
+AUDIO_TASK_VISIBILITY_TIMEOUT = config('AUDIO_TASK_VISIBILITY_TIMEOUT', default=1200, cast=int)
+AUDIO_TASK_RETRY_BACKOFF = config('AUDIO_TASK_RETRY_BACKOFF', default=30, cast=int)
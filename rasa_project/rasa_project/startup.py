@@ -0,0 +1,114 @@
+"""
+Import-time profile of process startup.
+
+A fresh interpreter is started with ``-X importtime`` and runs the two phases
+every process goes through: ``django.setup()``, which is all a management
+command or a worker boot pays for, and loading the URLconf, which a web
+worker pays on its first request. Each imported module's own time is charged
+to the project app that (transitively) imported it, or else to the top-level
+package that did.
+"""
+import os
+import subprocess
+import sys
+from collections import namedtuple
+
+from django.apps import apps
+from django.conf import settings
+
+PHASES = ('setup', 'urls')
+_MARKER = '--- startup phase: urls ---'
+_BOOTSTRAP = f'''
+import sys
+import django
+django.setup()
+sys.stderr.write({_MARKER!r} + "\\n")
+from django.urls import get_resolver
+get_resolver().url_patterns
+'''
+
+# Modules each phase must not import; they are loaded on first use.
+DEFERRED_MODULES = {
+    'setup': ('numpy', 'scipy', 'boto3', 'botocore', 'rest_framework.views', 'rest_framework_simplejwt.tokens'),
+    'urls': ('numpy', 'scipy', 'boto3'),
+}
+
+# Import time each phase may charge to the project's own packages, including
+# the third-party modules they are first to import. Django's own startup is
+# not counted, so the budget only moves when this code base changes what it
+# imports. Wall-clock, so it is checked by `profile_startup --check` rather
+# than the test suite.
+IMPORT_BUDGET_MS = {'setup': 60, 'urls': 450}
+
+ImportRecord = namedtuple('ImportRecord', ['module', 'self_us', 'cumulative_us', 'owner'])
+
+
+def project_packages():
+    """Top-level packages of the installed apps that live in this project, and the project package."""
+    base_dir = str(settings.BASE_DIR)
+    packages = {app.name.split('.')[0] for app in apps.get_app_configs() if app.path.startswith(base_dir)}
+    packages.add(settings.ROOT_URLCONF.split('.')[0])
+    return packages
+
+
+def parse_importtime(lines, packages):
+    """
+    Parse ``-X importtime`` lines into ``ImportRecord``s, charging each module
+    to its nearest importer (or itself) in ``packages``, or else to the
+    top-level package of the import that started the chain.
+    """
+    entries = []
+    for line in lines:
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((depth, int(self_us), int(cumulative_us), name.strip()))
+
+    # Modules are listed after everything they imported; walked backwards each
+    # module comes before its imports, so a stack holds its importers.
+    records, stack = [], []
+    for depth, self_us, cumulative_us, module in reversed(entries):
+        while stack and stack[-1][0] >= depth:
+            stack.pop()
+        top = module.split('.')[0]
+        if top in packages:
+            owner = top
+        elif stack:
+            owner = stack[-1][1]
+        else:
+            owner = top
+        stack.append((depth, owner))
+        records.append(ImportRecord(module, self_us, cumulative_us, owner))
+    records.reverse()
+    return records
+
+
+def profile_startup():
+    """Return ``{phase: [ImportRecord, ...]}`` measured in a fresh interpreter."""
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', _BOOTSTRAP],
+        cwd=str(settings.BASE_DIR), env=dict(os.environ), capture_output=True, text=True,
+    )
+    if process.returncode != 0:
+        raise RuntimeError(f'Startup failed:\n{process.stderr[-2000:]}')
+    setup_lines, _, url_lines = process.stderr.partition(_MARKER)
+    packages = project_packages()
+    return {
+        'setup': parse_importtime(setup_lines.splitlines(), packages),
+        'urls': parse_importtime(url_lines.splitlines(), packages),
+    }
+
+
+def time_by_owner(records):
+    """Milliseconds of import time per owner, largest first."""
+    totals = {}
+    for record in records:
+        totals[record.owner] = totals.get(record.owner, 0) + record.self_us
+    return sorted(((owner, us / 1000) for owner, us in totals.items()), key=lambda item: -item[1])
+
+
+def project_import_ms(records, packages=None):
+    """Milliseconds of import time charged to the project's own packages."""
+    packages = packages or project_packages()
+    return sum(record.self_us for record in records if record.owner in packages) / 1000
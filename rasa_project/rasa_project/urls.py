@@ -1,30 +1,16 @@
 
-from rest_framework import permissions
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
 from django.contrib import admin
 from django.urls import path, include
+from .schema import schema_document, schema_ui
 #from .swagger import BothHttpAndHttpsSchemaGenerator
-import json
-
-schema_view = get_schema_view(
-    openapi.Info(
-        title="My API",
-        default_version='v1',
-        description="My API description",
-        terms_of_service="https://www.example.com/terms/",
-        contact=openapi.Contact(email="contact@example.com"),
-        license=openapi.License(name="Awesome License"),
-    ),
-    public=True,
-    permission_classes=(permissions.AllowAny,),
-)
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
-    path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
+    path('swagger/', schema_ui('swagger'), name='schema-swagger-ui'),
+    path('redoc/', schema_ui('redoc'), name='schema-redoc'),
+    path('swagger.json', schema_document('json'), name='schema-json'),
+    path('swagger.yaml', schema_document('yaml'), name='schema-yaml'),
     path('api/auth/',include('auth_app.urls')),
     path('api/audio/',include('audio_app.urls'))
 ]